@@ -0,0 +1,169 @@
+"""
+Token-bucket admission control for RPC-backed routes
+Each request to a guarded route takes one token from its client's buckets
+(per wallet and per IP) and from the endpoint class's shared bucket, then a
+slot from the process-wide RPC concurrency limit. Tokens are only taken when
+every bucket has one, so a rejected request costs none of its buckets. Anything over a limit is
+answered immediately with 429 and Retry-After, before any RPC or external
+API call is made. Limits apply per worker process.
+"""
+
+import os
+import math
+import time
+import logging
+import threading
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable, Dict, Optional, Tuple, Union
+from flask import jsonify, request
+from metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'true').lower() != 'false'
+# class=tokens_per_second:burst, applied to each wallet and each IP
+ADMISSION_CLIENT_LIMITS = os.environ.get('ADMISSION_CLIENT_LIMITS', 'trade=0.5:5,quote=2:20,refresh=0.2:3')
+# class=tokens_per_second:burst, shared by all clients of the class
+ADMISSION_CLASS_LIMITS = os.environ.get('ADMISSION_CLASS_LIMITS', 'trade=20:50,quote=50:100,refresh=2:5')
+ADMISSION_MAX_RPC_CONCURRENCY = int(os.environ.get('ADMISSION_MAX_RPC_CONCURRENCY', 32))
+ADMISSION_MAX_KEYS = int(os.environ.get('ADMISSION_MAX_KEYS', 100000))
+
+def parse_limits(value: str) -> Dict[str, Tuple[float, float]]:
+    """Parse "class=rate:burst,..." into {class: (rate, burst)}"""
+    limits = {}
+    for item in (value or '').split(','):
+        name, _, spec = item.partition('=')
+        rate, _, burst = spec.partition(':')
+        if name.strip() and rate.strip():
+            limits[name.strip()] = (float(rate), float(burst or rate))
+    return limits
+
+class TokenBucket:
+    """Refills at rate tokens/second up to burst; wait() returns seconds until a token is available"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated_at')
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = now
+
+    def wait(self, now: float) -> float:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else float('inf')
+
+    def take(self):
+        self.tokens -= 1
+
+class AdmissionController:
+    """Buckets per (class, scope, key) in an LRU, plus the RPC concurrency limit"""
+
+    def __init__(self, client_limits: Dict[str, Tuple[float, float]], class_limits: Dict[str, Tuple[float, float]],
+                 max_concurrency: int = ADMISSION_MAX_RPC_CONCURRENCY, max_keys: int = ADMISSION_MAX_KEYS):
+        self.client_limits = client_limits
+        self.class_limits = class_limits
+        self.max_keys = max_keys
+        self._buckets: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    def check(self, endpoint_class: str, ip: Optional[str],
+              wallet: Union[None, str, Callable[[], Optional[str]]]) -> Optional[Tuple[str, float]]:
+        """
+        None if admitted, else (scope, retry_after_seconds) for the first bucket that is empty
+        wallet may be a function returning the address; it is only called once
+        the IP bucket has a token, so a flood from one address never pays for
+        wallet token verification.
+        """
+        now = time.monotonic()
+        limit = self.client_limits.get(endpoint_class)
+        checks = []
+        if limit and ip:
+            checks.append(('ip', ip, limit))
+            rejected = self._admit(endpoint_class, checks, now, take=False)
+            if rejected:
+                return rejected
+
+        if limit:
+            wallet = wallet() if callable(wallet) else wallet
+            if wallet:
+                checks.append(('wallet', wallet.lower(), limit))
+        if endpoint_class in self.class_limits:
+            checks.append(('class', '*', self.class_limits[endpoint_class]))
+        return self._admit(endpoint_class, checks, now)
+
+    def _admit(self, endpoint_class: str, checks, now: float, take: bool = True) -> Optional[Tuple[str, float]]:
+        """Check every (scope, key, limit) bucket; take a token from each only if all have one"""
+        with self._lock:
+            buckets = [(scope, self._bucket((endpoint_class, scope, key), limit, now)) for scope, key, limit in checks]
+            for scope, bucket in buckets:
+                wait = bucket.wait(now)
+                if wait > 0:
+                    return scope, wait
+            if take:
+                for _, bucket in buckets:
+                    bucket.take()
+        return None
+
+    def _bucket(self, bucket_key: Tuple[str, str, str], limit: Tuple[float, float], now: float) -> TokenBucket:
+        bucket = self._buckets.get(bucket_key)
+        if bucket is None:
+            bucket = self._buckets[bucket_key] = TokenBucket(*limit, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(bucket_key)
+        return bucket
+
+    def acquire_slot(self) -> bool:
+        return self._slots.acquire(blocking=False)
+
+    def release_slot(self):
+        self._slots.release()
+
+# Global controller instance
+admission_controller = AdmissionController(parse_limits(ADMISSION_CLIENT_LIMITS), parse_limits(ADMISSION_CLASS_LIMITS))
+
+def get_admission_controller() -> AdmissionController:
+    """Get the admission controller instance"""
+    return admission_controller
+
+def _reject(endpoint_class: str, scope: str, retry_after: float):
+    get_metrics().admission_rejections.inc(endpoint_class, scope)
+    seconds = max(1, math.ceil(retry_after))
+    response = jsonify({
+        'success': False,
+        'message': f'Too many requests, retry in {seconds}s'
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(seconds)
+    return response
+
+def admit(endpoint_class: str):
+    """Decorator for RPC-backed routes: rate limits, then a concurrency slot for the call"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ADMISSION_ENABLED:
+                return func(*args, **kwargs)
+
+            from wallet_service import get_wallet_service
+            controller = get_admission_controller()
+            rejected = controller.check(endpoint_class, request.remote_addr,
+                                        get_wallet_service().get_connected_wallet)
+            if rejected:
+                return _reject(endpoint_class, *rejected)
+
+            if not controller.acquire_slot():
+                return _reject(endpoint_class, 'concurrency', 1)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                controller.release_slot()
+        return wrapper
+    return decorator
@@ -0,0 +1,333 @@
+"""
+Columnar export of trades, price history and chat messages
+Rows are streamed in EXPORT_CHUNK_ROWS chunks through a server-side cursor
+and written as compressed Parquet, Hive-partitioned by day (and by wallet for
+trades):
+
+    <EXPORT_DIR>/trade/date=2026-10-19/wallet=0xabc.../part-<from>-<to>-<n>.parquet
+
+Memory stays bounded: rows are buffered per partition, at most
+EXPORT_MAX_BUFFERED_ROWS in total, and at most EXPORT_MAX_OPEN_FILES writers
+stay open. Each table keeps an id watermark in indexer_checkpoint, so a run
+exports only rows added since the last one. A run writes into a staging
+directory (ignored by Parquet readers) and moves its files into place only
+once all of them are complete, then advances the watermark. A failed run
+deletes its staging directory; one left by a killed run is removed by the next.
+
+On PostgreSQL, sequence ids can commit out of order, so a run stops at the
+newest row older than EXPORT_SETTLE_SECONDS. Lower ids were allocated even
+earlier, and transactions here are far shorter than that, so all of them have
+committed; newer rows are picked up by the next run.
+
+Exported rows are never revisited, so a table whose rows still change stops
+below the first one that can: trades wait until they leave 'pending' (the
+receipt tracker settles or expires them within RECEIPT_EXPIRY_SECONDS).
+
+--restart resets the watermark and deletes the table's exported files before
+writing them again.
+
+Needs pyarrow (pip install '.[export]'), which the web app itself does not use.
+
+Usage:
+    python analytics_export.py [--tables trade,price_history,chat_message] [--out exports] [--restart]
+"""
+
+import os
+import time
+import shutil
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import func, or_, select, text, update
+from app import db
+from models import Trade, PriceHistory, ChatMessage, IndexerCheckpoint
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR = os.environ.get('EXPORT_DIR', 'exports')
+EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', 50000))
+EXPORT_COMPRESSION = os.environ.get('EXPORT_COMPRESSION', 'zstd')
+EXPORT_MAX_BUFFERED_ROWS = int(os.environ.get('EXPORT_MAX_BUFFERED_ROWS', 100000))
+EXPORT_MAX_OPEN_FILES = int(os.environ.get('EXPORT_MAX_OPEN_FILES', 64))
+# Rows newer than this are left for the next run (not applied to SQLite, which commits ids in order)
+EXPORT_SETTLE_SECONDS = int(os.environ.get('EXPORT_SETTLE_SECONDS', 120))
+
+# Partition value for NULL keys, as Hive and Spark spell it
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+STAGING_PREFIX = '.staging-'
+
+# Table -> (model, day column, optional second partition column)
+EXPORT_TABLES = {
+    'trade': (Trade, 'created_at', 'wallet_address'),
+    'price_history': (PriceHistory, 'timestamp', None),
+    'chat_message': (ChatMessage, 'created_at', None)
+}
+
+# Table -> (column, value) of rows that may still be updated; the export stops below the first
+EXPORT_UNSETTLED = {
+    'trade': ('status', 'pending')
+}
+
+def arrow_schema(table) -> 'pa.Schema':
+    """Arrow schema for a SQLAlchemy table's columns"""
+    fields = []
+    for column in table.columns:
+        python_type = column.type.python_type
+        if python_type is bool:
+            arrow_type = pa.bool_()
+        elif python_type is int:
+            arrow_type = pa.int64()
+        elif python_type is float:
+            arrow_type = pa.float64()
+        elif python_type is datetime:
+            arrow_type = pa.timestamp('us')
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type, nullable=not column.primary_key))
+    return pa.schema(fields)
+
+class PartitionWriter:
+    """Buffers rows per partition and writes them under root through a bounded set of open Parquet writers"""
+
+    def __init__(self, root: str, schema: 'pa.Schema', file_prefix: str, compression: str,
+                 row_group_rows: int, max_buffered_rows: int, max_open_files: int):
+        self.root = root
+        self.schema = schema
+        self.file_prefix = file_prefix
+        self.compression = compression
+        self.row_group_rows = row_group_rows
+        self.max_buffered_rows = max_buffered_rows
+        self.max_open_files = max_open_files
+        self.buffers: Dict[Tuple[str, ...], List[tuple]] = {}
+        self.buffered = 0
+        self.writers: OrderedDict = OrderedDict()
+        self.file_counts: Dict[Tuple[str, ...], int] = {}
+        self.files: List[str] = []
+
+    def add(self, partition: Tuple[str, ...], row: tuple):
+        buffer = self.buffers.setdefault(partition, [])
+        buffer.append(row)
+        self.buffered += 1
+        if len(buffer) >= self.row_group_rows:
+            self._flush(partition)
+        elif self.buffered >= self.max_buffered_rows:
+            for key in list(self.buffers):
+                self._flush(key)
+
+    def _flush(self, partition: Tuple[str, ...]):
+        rows = self.buffers.pop(partition, None)
+        if not rows:
+            return
+        self.buffered -= len(rows)
+        columns = list(zip(*rows))
+        batch = pa.Table.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, self.schema)], schema=self.schema
+        )
+        self._writer(partition).write_table(batch, row_group_size=self.row_group_rows)
+
+    def _writer(self, partition: Tuple[str, ...]) -> 'pq.ParquetWriter':
+        writer = self.writers.get(partition)
+        if writer is not None:
+            self.writers.move_to_end(partition)
+            return writer[0]
+
+        if len(self.writers) >= self.max_open_files:
+            self._close(next(iter(self.writers)))
+        directory = os.path.join(self.root, *partition)
+        os.makedirs(directory, exist_ok=True)
+        sequence = self.file_counts.get(partition, 0)
+        self.file_counts[partition] = sequence + 1
+        path = os.path.join(directory, f"{self.file_prefix}-{sequence}.parquet")
+        writer = pq.ParquetWriter(path, self.schema, compression=self.compression)
+        self.writers[partition] = (writer, path)
+        return writer
+
+    def _close(self, partition: Tuple[str, ...]):
+        writer, path = self.writers.pop(partition)
+        writer.close()
+        self.files.append(path)
+
+    def close(self) -> List[str]:
+        """Flush every buffer and finish all files; returns the paths written"""
+        for partition in list(self.buffers):
+            self._flush(partition)
+        for partition in list(self.writers):
+            self._close(partition)
+        return self.files
+
+    def abort(self):
+        """Close the open writers and delete everything written under root"""
+        for writer, _ in self.writers.values():
+            try:
+                writer.close()
+            except Exception:
+                pass
+        self.writers.clear()
+        self.buffers.clear()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+class AnalyticsExporter:
+    """Exports the tables in EXPORT_TABLES to partitioned Parquet, incrementally"""
+
+    def __init__(self, out_dir: str = EXPORT_DIR, chunk_rows: int = EXPORT_CHUNK_ROWS,
+                 compression: str = EXPORT_COMPRESSION):
+        if pa is None:
+            raise RuntimeError("Parquet export needs pyarrow: pip install '.[export]'")
+        self.out_dir = out_dir
+        self.chunk_rows = chunk_rows
+        self.compression = compression
+
+    @staticmethod
+    def checkpoint_name(name: str) -> str:
+        return f"export:{name}"
+
+    def load_watermark(self, name: str) -> int:
+        """Highest id already exported for a table (0 if never exported)"""
+        return db.session.execute(
+            select(IndexerCheckpoint.last_block).where(IndexerCheckpoint.name == self.checkpoint_name(name))
+        ).scalar() or 0
+
+    def _save_watermark(self, name: str, last_id: int):
+        updated = db.session.execute(
+            update(IndexerCheckpoint)
+            .where(IndexerCheckpoint.name == self.checkpoint_name(name))
+            .values(last_block=last_id, updated_at=datetime.utcnow())
+        ).rowcount
+        if not updated:
+            db.session.add(IndexerCheckpoint(name=self.checkpoint_name(name), last_block=last_id))
+        db.session.commit()
+
+    @staticmethod
+    def _partition(row: tuple, day_index: int, key_index: Optional[int]) -> Tuple[str, ...]:
+        day = row[day_index]
+        partition = (f"date={day.date().isoformat() if day else NULL_PARTITION}",)
+        if key_index is not None:
+            value = row[key_index]
+            partition += (f"wallet={value.lower() if value else NULL_PARTITION}",)
+        return partition
+
+    def export_table(self, name: str, restart: bool = False) -> Dict[str, Any]:
+        """Export one table's rows above its watermark; returns row and file counts"""
+        started = time.monotonic()
+        model, day_column, key_column = EXPORT_TABLES[name]
+        table = model.__table__
+        root = os.path.join(self.out_dir, name)
+        if restart:
+            # Watermark first: if the run fails after this, the next one starts over too
+            self._save_watermark(name, 0)
+            self._clear_output(root)
+        watermark = self.load_watermark(name)
+        upper = self._upper_bound(table, table.c[day_column], watermark, EXPORT_UNSETTLED.get(name))
+        db.session.commit()
+        if upper <= watermark:
+            logger.info(f"Export {name}: nothing newer than id {watermark}")
+            return {'rows': 0, 'files': 0, 'watermark': watermark}
+
+        columns = [column.name for column in table.columns]
+        day_index = columns.index(day_column)
+        key_index = columns.index(key_column) if key_column else None
+        self._clear_staging(root)
+        staging = os.path.join(root, f"{STAGING_PREFIX}{watermark + 1}-{upper}")
+        writer = PartitionWriter(
+            staging, arrow_schema(table), f"part-{watermark + 1}-{upper}",
+            self.compression, self.chunk_rows, EXPORT_MAX_BUFFERED_ROWS, EXPORT_MAX_OPEN_FILES
+        )
+
+        rows = 0
+        try:
+            with db.engine.connect() as connection:
+                if connection.dialect.name == 'postgresql':
+                    # The cursor stays open between chunks for as long as the files take to write
+                    connection.execute(text("SET LOCAL statement_timeout = 0"))
+                    connection.execute(text("SET LOCAL idle_in_transaction_session_timeout = 0"))
+                result = connection.execution_options(yield_per=self.chunk_rows).execute(
+                    select(*table.columns).where(table.c.id > watermark, table.c.id <= upper).order_by(table.c.id)
+                )
+                for chunk in result.partitions():
+                    for row in chunk:
+                        writer.add(self._partition(row, day_index, key_index), tuple(row))
+                    rows += len(chunk)
+                    logger.debug("Export %s: %d rows streamed", name, rows)
+            files = [self._publish(path, staging, root) for path in writer.close()]
+        except Exception:
+            writer.abort()
+            raise
+        shutil.rmtree(staging, ignore_errors=True)
+
+        self._save_watermark(name, upper)
+        elapsed = time.monotonic() - started
+        logger.info(f"Export {name}: {rows} rows in {len(files)} files up to id {upper} ({elapsed:.1f}s)")
+        return {'rows': rows, 'files': len(files), 'watermark': upper, 'seconds': round(elapsed, 1)}
+
+    @staticmethod
+    def _upper_bound(table, day_column, watermark: int, unsettled: Optional[Tuple[str, Any]] = None) -> int:
+        """Highest id this run may export"""
+        query = select(func.max(table.c.id)).where(table.c.id > watermark)
+        if db.engine.dialect.name != 'sqlite':
+            cutoff = datetime.utcnow() - timedelta(seconds=EXPORT_SETTLE_SECONDS)
+            query = query.where(or_(day_column <= cutoff, day_column.is_(None)))
+        if unsettled is not None:
+            column, value = unsettled
+            first_unsettled = db.session.execute(
+                select(func.min(table.c.id)).where(table.c.id > watermark, table.c[column] == value)
+            ).scalar()
+            if first_unsettled is not None:
+                query = query.where(table.c.id < first_unsettled)
+        return db.session.execute(query).scalar() or 0
+
+    @staticmethod
+    def _clear_output(root: str):
+        """Delete a table's exported files (and any staging left behind)"""
+        if os.path.isdir(root):
+            logger.warning(f"Removing previous export {root}")
+            shutil.rmtree(root)
+
+    @staticmethod
+    def _clear_staging(root: str):
+        """Remove staging directories left by runs that were killed"""
+        if os.path.isdir(root):
+            for entry in os.listdir(root):
+                if entry.startswith(STAGING_PREFIX):
+                    logger.warning(f"Removing unfinished export {os.path.join(root, entry)}")
+                    shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+
+    @staticmethod
+    def _publish(path: str, staging: str, root: str) -> str:
+        """Move a finished file from staging to the same partition under root"""
+        target = os.path.join(root, os.path.relpath(path, staging))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+        return target
+
+    def run(self, tables: Optional[List[str]] = None, restart: bool = False) -> Dict[str, Dict[str, Any]]:
+        """Export each table in turn"""
+        return {name: self.export_table(name, restart) for name in (tables or list(EXPORT_TABLES))}
+
+if __name__ == '__main__':
+    import argparse
+    from app import app
+
+    parser = argparse.ArgumentParser(description='Export trades, price history and chat messages to Parquet')
+    parser.add_argument('--tables', default=','.join(EXPORT_TABLES), help='Comma-separated tables to export')
+    parser.add_argument('--out', default=EXPORT_DIR, help='Output directory')
+    parser.add_argument('--chunk-rows', type=int, default=EXPORT_CHUNK_ROWS, help='Rows per fetch and row group')
+    parser.add_argument('--compression', default=EXPORT_COMPRESSION, help='Parquet codec (zstd, snappy, gzip, none)')
+    parser.add_argument('--restart', action='store_true', help='Delete the previous export and export everything again')
+    args = parser.parse_args()
+
+    tables = [name.strip() for name in args.tables.split(',') if name.strip()]
+    unknown = [name for name in tables if name not in EXPORT_TABLES]
+    if unknown:
+        parser.error(f"Unknown tables: {', '.join(unknown)}")
+
+    with app.app_context():
+        exporter = AnalyticsExporter(args.out, args.chunk_rows, args.compression)
+        for name, stats in exporter.run(tables, args.restart).items():
+            print(f"{name}: {stats}")
@@ -1,40 +1,111 @@
 import os
-import logging
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
-
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
+from db_profiles import get_engine_options, normalize_database_url
+from metrics import install_query_metrics, install_route_metrics
+from profiling import install_profiling
+from logging_config import configure_logging
 
 class Base(DeclarativeBase):
     pass
 
 db = SQLAlchemy(model_class=Base)
 
-# Create the app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+# Proxy hops trusted for X-Forwarded-For (0 when the app is reached directly)
+PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR', 1))
+
+def create_app() -> Flask:
+    """
+    Build the Flask app without touching the network or the database
+    Schema creation (init_schema / `flask init-db`) and per-process services
+    (init_worker) are separate steps, so the app can be preloaded and forked.
+    """
+    # Queued, non-blocking log writes (LOG_LEVEL / LOG_LEVELS)
+    configure_logging()
+
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
+    # X-Forwarded-For from the one trusted proxy hop sets remote_addr for per-IP limits
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_FIX_X_FOR, x_proto=1, x_host=1)
+
+    # Configure the database
+    database_url = normalize_database_url(os.environ.get("DATABASE_URL", "sqlite:///crypto_dashboard.db"))
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_url
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = get_engine_options(database_url)
+
+    # Initialize the app with the extension
+    db.init_app(app)
+
+    # Query and route latency metrics, exposed at /metrics
+    install_query_metrics()
+    install_route_metrics(app)
+
+    # Opt-in request profiling (PROFILE_SECRET / PROFILE_SAMPLE_RATE)
+    install_profiling(app)
+
+    # Models and routes import the service modules but build no connections
+    import models
+    from routes import bp
+    app.register_blueprint(bp)
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create missing tables, columns and indexes"""
+        init_schema(app)
+        print("Database schema is up to date")
+
+    @app.cli.command('sync-feeds')
+    def sync_feeds_command():
+        """Add FTSO feeds published on-chain to the feed catalog"""
+        from blockchain_service import get_blockchain_service
+        service = get_blockchain_service()
+        added = service.feed_catalog.sync(service.discover_ftso_feed_ids)
+        print(f"{added} FTSO feeds added to the catalog")
 
-# Configure the database
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///crypto_dashboard.db")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+    @app.cli.command('prune-price-history')
+    def prune_price_history_command():
+        """Downsample and expire old price history rows"""
+        from price_retention import get_price_history_retention
+        stats = get_price_history_retention().run_once()
+        print(f"{stats['expired']} expired and {stats['downsampled']} downsampled price history rows deleted")
 
-# Initialize the app with the extension
-db.init_app(app)
+    return app
 
-with app.app_context():
-    # Import models to create tables
+def init_schema(app: Flask):
+    """Create missing tables, then add columns and indexes create_all skips on existing tables"""
     import models
-    db.create_all()
-    
-    # Import and register routes
-    import routes
+
+    with app.app_context():
+        db.create_all()
+        models.add_missing_columns()
+        # Drop the pooled connections so none is inherited by forked workers
+        db.engine.dispose()
+
+def init_worker(app: Flask):
+    """Per-process setup, run in each worker after fork (or once for a single-process server)"""
+    from blockchain_service import reset_blockchain_service
+    from head_scheduler import start_head_scheduler
+    from metrics import get_metrics
+
+    # The parent's log writer thread does not survive the fork
+    configure_logging()
+
+    with app.app_context():
+        # Connections opened before the fork belong to the parent; close=False leaves them to it
+        db.engine.dispose(close=False)
+    reset_blockchain_service()
+
+    # Share this worker's metrics so a scrape of any worker covers all of them (METRICS_DIR)
+    get_metrics().start()
+
+    # Block/epoch-driven background refreshes (HEAD_SCHEDULER_ENABLED=true)
+    start_head_scheduler(app)
+
+app = create_app()
 
 if __name__ == '__main__':
+    init_schema(app)
+    init_worker(app)
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,139 @@
+"""
+Concurrency benchmark for the database engine profiles
+Runs concurrent readers and writers against each profile and reports throughput
+
+Usage:
+    python benchmarks/db_concurrency.py [--duration 5] [--readers 8] [--writers 2]
+    BENCH_POSTGRES_URL=postgresql://... python benchmarks/db_concurrency.py
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+from typing import Dict, Any
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from db_profiles import get_engine_options, install_sqlite_pragmas
+
+SYMBOLS = ['FLR', 'WFLR', 'ETH', 'USDT', 'MATIC', 'METIS', 'APE']
+
+def _setup_schema(engine):
+    """Create a token table shaped like models.Token and seed it"""
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS bench_token"))
+        conn.execute(text(
+            "CREATE TABLE bench_token ("
+            "id INTEGER PRIMARY KEY, symbol VARCHAR(10) UNIQUE NOT NULL, "
+            "price FLOAT NOT NULL, change_24h FLOAT)"
+        ))
+        for i, symbol in enumerate(SYMBOLS, start=1):
+            conn.execute(
+                text("INSERT INTO bench_token (id, symbol, price, change_24h) VALUES (:id, :s, :p, 0)"),
+                {'id': i, 's': symbol, 'p': random.uniform(0.01, 3000)}
+            )
+
+def _reader(engine, stop: threading.Event, counts: Dict[str, int], errors: Dict[str, int]):
+    while not stop.is_set():
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT symbol, price, change_24h FROM bench_token")).fetchall()
+            counts['reads'] += 1
+        except Exception:
+            errors['reads'] += 1
+
+def _writer(engine, stop: threading.Event, counts: Dict[str, int], errors: Dict[str, int]):
+    while not stop.is_set():
+        try:
+            with engine.begin() as conn:
+                conn.execute(
+                    text("UPDATE bench_token SET price = :p WHERE symbol = :s"),
+                    {'p': random.uniform(0.01, 3000), 's': random.choice(SYMBOLS)}
+                )
+            counts['writes'] += 1
+        except Exception:
+            errors['writes'] += 1
+
+def run_profile(name: str, url: str, engine_options: Dict[str, Any], duration: float,
+                readers: int, writers: int) -> Dict[str, Any]:
+    """Run one profile and return its throughput figures"""
+    engine = create_engine(url, **engine_options)
+    _setup_schema(engine)
+
+    stop = threading.Event()
+    counts = {'reads': 0, 'writes': 0}
+    errors = {'reads': 0, 'writes': 0}
+
+    threads = [threading.Thread(target=_reader, args=(engine, stop, counts, errors)) for _ in range(readers)]
+    threads += [threading.Thread(target=_writer, args=(engine, stop, counts, errors)) for _ in range(writers)]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    engine.dispose()
+
+    return {
+        'profile': name,
+        'readers': readers,
+        'writers': writers,
+        'duration_s': round(elapsed, 3),
+        'reads_per_s': round(counts['reads'] / elapsed, 1),
+        'writes_per_s': round(counts['writes'] / elapsed, 1),
+        'read_errors': errors['reads'],
+        'write_errors': errors['writes'],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    args = parser.parse_args()
+
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Rollback-journal baseline: the options app.py used before profiles existed
+        baseline_url = f"sqlite:///{os.path.join(tmp, 'baseline.db')}"
+        results.append(run_profile(
+            'sqlite-rollback-journal', baseline_url,
+            {'pool_recycle': 300, 'pool_pre_ping': True},
+            args.duration, args.readers, args.writers
+        ))
+
+        install_sqlite_pragmas()
+        wal_url = f"sqlite:///{os.path.join(tmp, 'wal.db')}"
+        results.append(run_profile(
+            'sqlite-wal', wal_url, get_engine_options(wal_url),
+            args.duration, args.readers, args.writers
+        ))
+
+    postgres_url = os.environ.get('BENCH_POSTGRES_URL')
+    if postgres_url:
+        results.append(run_profile(
+            'postgresql-default', postgres_url,
+            {'pool_recycle': 300, 'pool_pre_ping': True},
+            args.duration, args.readers, args.writers
+        ))
+        results.append(run_profile(
+            'postgresql-tuned', postgres_url, get_engine_options(postgres_url),
+            args.duration, args.readers, args.writers
+        ))
+
+    for result in results:
+        print(json.dumps(result))
+
+if __name__ == '__main__':
+    main()
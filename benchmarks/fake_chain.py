@@ -0,0 +1,294 @@
+"""
+Local JSON-RPC stand-in for the Flare C-chain
+Answers the calls the app makes (registry, FtsoV2, ERC20, Multicall3, block
+and receipt queries) with deterministic data and configurable latency
+"""
+
+import json
+import math
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from eth_abi import encode, decode
+from eth_utils import keccak, to_checksum_address
+
+def selector(signature: str) -> bytes:
+    """4-byte function selector for a signature such as 'balanceOf(address)'"""
+    return keccak(text=signature)[:4]
+
+REGISTRY_ADDRESS = '0xaD67FE66660Fb8dFE9d6b1b4240d8650e30F6019'
+FTSO_V2_ADDRESS = '0x00000000000000000000000000000000000F7502'
+MULTICALL3_ADDRESS = '0xcA11bde05977b3631167028862bE2a173976CA11'
+
+# Reference USD prices the FTSO feeds oscillate around
+BASE_PRICES = {
+    'FLR': 0.02, 'SGB': 0.008, 'BTC': 60000.0, 'ETH': 3000.0, 'XRP': 0.5,
+    'USDT': 1.0, 'USDC': 1.0, 'POL': 0.4, 'MATIC': 0.4, 'AVAX': 30.0,
+    'BNB': 500.0, 'SOL': 150.0, 'DOGE': 0.12, 'ADA': 0.4, 'LTC': 80.0
+}
+
+VOTING_EPOCH_SECONDS = 90
+
+class FakeChain:
+    """Deterministic chain state plus an eth_call dispatcher keyed by selector"""
+
+    def __init__(self, chain_id: int = 14, block_time: float = 1.8, initial_block: int = 30_000_000,
+                 token_decimals: Optional[Dict[str, int]] = None, extra_feeds: int = 0,
+                 max_feeds_per_call: Optional[int] = None):
+        self.chain_id = chain_id
+        self.block_time = block_time
+        self.genesis_time = time.time() - initial_block * block_time
+        self.token_decimals = {k.lower(): v for k, v in (token_decimals or {}).items()}
+        self.logs: List[Dict[str, Any]] = []
+        # Published feeds: the reference prices plus synthetic ones to model a large catalog
+        self.feed_names = [f'{symbol}/USD' for symbol in BASE_PRICES] + [f'F{i:03d}/USD' for i in range(extra_feeds)]
+        # getFeedsById reverts above this many feeds, like an oversized call running out of gas
+        self.max_feeds_per_call = max_feeds_per_call
+        # tx hash -> (from, to) reported in receipts; unknown hashes have neither
+        self.transactions: Dict[str, Tuple[str, str]] = {}
+        self.request_count = 0
+        self._lock = threading.Lock()
+
+        self.call_handlers: Dict[bytes, Callable[[str, bytes, int], bytes]] = {
+            selector('getFtsoV2()'): self._get_ftso_v2,
+            selector('getContractAddressByName(string)'): self._get_contract_address_by_name,
+            selector('getFeedsById(bytes21[])'): self._get_feeds_by_id,
+            selector('getFeedIds()'): self._get_feed_ids,
+            selector('balanceOf(address)'): self._balance_of,
+            selector('decimals()'): self._decimals,
+            selector('getEthBalance(address)'): self._get_eth_balance,
+            selector('aggregate3((address,bool,bytes)[])'): self._aggregate3,
+        }
+
+    # Block model
+
+    def head(self) -> int:
+        return int((time.time() - self.genesis_time) / self.block_time)
+
+    def block_timestamp(self, number: int) -> int:
+        return int(self.genesis_time + number * self.block_time)
+
+    def _block_number(self, tag: Any) -> int:
+        if tag in (None, 'latest', 'pending', 'safe', 'finalized'):
+            return self.head()
+        if tag == 'earliest':
+            return 0
+        return int(tag, 16) if isinstance(tag, str) else int(tag)
+
+    # eth_call handlers (to, calldata without selector, block) -> return data
+
+    def _get_ftso_v2(self, to: str, data: bytes, block: int) -> bytes:
+        return encode(['address'], [FTSO_V2_ADDRESS])
+
+    def _get_contract_address_by_name(self, to: str, data: bytes, block: int) -> bytes:
+        (name,) = decode(['string'], data)
+        address = FTSO_V2_ADDRESS if name in ('FtsoV2', 'TestFtsoV2') else '0x' + keccak(text=name)[-20:].hex()
+        return encode(['address'], [to_checksum_address(address)])
+
+    def feed_price(self, name: str, timestamp: int) -> float:
+        """Price for a feed name such as 'FLR/USD' at a point in time"""
+        base = BASE_PRICES.get(name.split('/')[0], 1.0)
+        epoch = timestamp // VOTING_EPOCH_SECONDS
+        return base * (1 + 0.02 * math.sin(epoch / 10))
+
+    def _get_feed_ids(self, to: str, data: bytes, block: int) -> bytes:
+        return encode(['bytes21[]'], [[b'\x01' + name.encode().ljust(20, b'\x00') for name in self.feed_names]])
+
+    def _get_feeds_by_id(self, to: str, data: bytes, block: int) -> bytes:
+        (feed_ids,) = decode(['bytes21[]'], data)
+        if self.max_feeds_per_call is not None and len(feed_ids) > self.max_feeds_per_call:
+            raise ValueError("execution reverted: out of gas")
+        timestamp = self.block_timestamp(block)
+        values, decimals = [], []
+        for feed_id in feed_ids:
+            name = feed_id[1:].rstrip(b'\x00').decode('ascii', errors='ignore').strip()
+            price = self.feed_price(name, timestamp)
+            digits = max(0, 7 - int(math.floor(math.log10(price)))) if price > 0 else 7
+            values.append(int(price * 10 ** digits))
+            decimals.append(digits)
+        epoch_start = timestamp - timestamp % VOTING_EPOCH_SECONDS
+        return encode(['uint256[]', 'int8[]', 'uint64'], [values, decimals, epoch_start])
+
+    def _balance_of(self, to: str, data: bytes, block: int) -> bytes:
+        (owner,) = decode(['address'], data)
+        seed = int.from_bytes(keccak(text=f"{to.lower()}:{owner.lower()}")[:8], 'big')
+        decimals = self.token_decimals.get(to.lower(), 18)
+        return encode(['uint256'], [(seed % 10_000) * 10 ** decimals])
+
+    def _decimals(self, to: str, data: bytes, block: int) -> bytes:
+        return encode(['uint8'], [self.token_decimals.get(to.lower(), 18)])
+
+    def _get_eth_balance(self, to: str, data: bytes, block: int) -> bytes:
+        (owner,) = decode(['address'], data)
+        return encode(['uint256'], [self.native_balance(owner)])
+
+    def native_balance(self, owner: str) -> int:
+        seed = int.from_bytes(keccak(text=owner.lower())[:8], 'big')
+        return (seed % 100_000) * 10 ** 18
+
+    def _aggregate3(self, to: str, data: bytes, block: int) -> bytes:
+        (calls,) = decode(['(address,bool,bytes)[]'], data)
+        results = []
+        for target, allow_failure, call_data in calls:
+            try:
+                results.append((True, self.eth_call(target, call_data, block)))
+            except Exception:
+                if not allow_failure:
+                    raise
+                results.append((False, b''))
+        return encode(['(bool,bytes)[]'], [results])
+
+    def eth_call(self, to: str, data: bytes, block: int) -> bytes:
+        handler = self.call_handlers.get(bytes(data[:4]))
+        if handler is None:
+            raise ValueError(f"execution reverted: unknown selector 0x{bytes(data[:4]).hex()}")
+        return handler(to, bytes(data[4:]), block)
+
+    # JSON-RPC methods
+
+    def handle(self, method: str, params: List[Any]) -> Any:
+        if method == 'web3_clientVersion':
+            return 'FakeChain/1.0'
+        if method == 'eth_chainId':
+            return hex(self.chain_id)
+        if method == 'net_version':
+            return str(self.chain_id)
+        if method == 'eth_blockNumber':
+            return hex(self.head())
+        if method == 'eth_gasPrice':
+            return hex(25 * 10 ** 9)
+        if method == 'eth_maxPriorityFeePerGas':
+            return hex(10 ** 9)
+        if method == 'eth_estimateGas':
+            return hex(200_000)
+        if method == 'eth_getTransactionCount':
+            return '0x0'
+        if method == 'eth_getBalance':
+            return hex(self.native_balance(params[0]))
+        if method == 'eth_getBlockByNumber':
+            number = self._block_number(params[0])
+            return self.block(number)
+        if method == 'eth_call':
+            call, tag = params[0], params[1] if len(params) > 1 else 'latest'
+            data = bytes.fromhex(call.get('data', call.get('input', '0x'))[2:])
+            return '0x' + self.eth_call(call['to'], data, self._block_number(tag)).hex()
+        if method == 'eth_getLogs':
+            return self.get_logs(params[0])
+        if method == 'eth_getTransactionReceipt':
+            return self.receipt(params[0])
+        raise ValueError(f"method not supported: {method}")
+
+    def block(self, number: int) -> Dict[str, Any]:
+        return {
+            'number': hex(number),
+            'hash': '0x' + keccak(number.to_bytes(32, 'big')).hex(),
+            'parentHash': '0x' + keccak(max(number - 1, 0).to_bytes(32, 'big')).hex(),
+            'timestamp': hex(self.block_timestamp(number)),
+            'baseFeePerGas': hex(25 * 10 ** 9),
+            'gasLimit': hex(15_000_000),
+            'gasUsed': '0x0',
+            'miner': '0x' + '00' * 20,
+            'transactions': []
+        }
+
+    def get_logs(self, query: Dict[str, Any]) -> List[Dict[str, Any]]:
+        start = self._block_number(query.get('fromBlock', 'latest'))
+        end = self._block_number(query.get('toBlock', 'latest'))
+        address = query.get('address')
+        addresses = {a.lower() for a in ([address] if isinstance(address, str) else address or [])}
+        return [
+            log for log in self.logs
+            if start <= int(log['blockNumber'], 16) <= end
+            and (not addresses or log['address'].lower() in addresses)
+        ]
+
+    def receipt(self, tx_hash: str) -> Optional[Dict[str, Any]]:
+        # Every hash confirms two blocks after the one it hashes into
+        mined = self.head() - 2
+        sender, to = self.transactions.get(tx_hash.lower(), (None, None))
+        return {
+            'transactionHash': tx_hash,
+            'from': sender,
+            'to': to,
+            'blockNumber': hex(mined),
+            'blockHash': '0x' + keccak(mined.to_bytes(32, 'big')).hex(),
+            'status': '0x1',
+            'gasUsed': hex(21_000 + int(tx_hash[-4:], 16) % 100_000),
+            'cumulativeGasUsed': hex(1_000_000),
+            'effectiveGasPrice': hex(25 * 10 ** 9),
+            'logs': []
+        }
+
+    def dispatch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self.request_count += 1
+        try:
+            result = self.handle(request['method'], request.get('params') or [])
+            return {'jsonrpc': '2.0', 'id': request.get('id'), 'result': result}
+        except Exception as e:
+            return {'jsonrpc': '2.0', 'id': request.get('id'), 'error': {'code': -32000, 'message': str(e)}}
+
+class _RPCHandler(BaseHTTPRequestHandler):
+    chain: FakeChain = None
+    latency: float = 0.0
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        payload = json.loads(body)
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if isinstance(payload, list):
+            response = [self.chain.dispatch(item) for item in payload]
+        else:
+            response = self.chain.dispatch(payload)
+
+        data = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+class FakeChainServer:
+    """Serve a FakeChain over HTTP on 127.0.0.1 in a background thread"""
+
+    def __init__(self, chain: Optional[FakeChain] = None, latency_ms: float = 0.0, port: int = 0):
+        self.chain = chain or FakeChain()
+        handler = type('RPCHandler', (_RPCHandler,), {'chain': self.chain, 'latency': latency_ms / 1000})
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self) -> 'FakeChainServer':
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Run the fake Flare JSON-RPC server')
+    parser.add_argument('--port', type=int, default=8545)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeChainServer(latency_ms=args.latency_ms, port=args.port).start()
+    print(f"Fake chain listening on {server.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,144 @@
+"""
+Benchmark for the vectorized portfolio valuation engine
+Compares the per-row Python loop the routes used to run with the NumPy passes
+
+Usage:
+    python benchmarks/portfolio_valuation.py [--holdings 500] [--wallets 5000] [--per-wallet 20]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Point the app at a throwaway database before it is imported
+_tmpdir = tempfile.mkdtemp(prefix='bench_valuation_')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}"
+
+from app import app, db
+from models import Token, Portfolio
+from portfolio_valuation import Holdings, PriceSnapshot, value_holdings, value_wallet_batch, get_valuation_engine
+
+def _timeit(func, repeat: int = 5) -> float:
+    """Best-of-N wall time in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def _synthetic(symbols, n_wallets, per_wallet):
+    wallets, holding_symbols, balances, avg_prices = [], [], [], []
+    for w in range(n_wallets):
+        wallet = f"0x{w:040x}"
+        for _ in range(per_wallet):
+            wallets.append(wallet)
+            holding_symbols.append(random.choice(symbols))
+            balances.append(random.uniform(0, 10000))
+            avg_prices.append(random.uniform(0.01, 3000))
+    rows = list(zip(wallets, holding_symbols, balances, avg_prices))
+    return Holdings(wallets, holding_symbols, balances, avg_prices), rows
+
+def _python_loop(rows, price_by_symbol):
+    """The per-holding loop the portfolio route ran before the engine"""
+    totals = {}
+    for wallet, symbol, balance, avg in rows:
+        price = price_by_symbol.get(symbol)
+        if price is None or balance <= 0:
+            continue
+        value = balance * price
+        cost = balance * avg
+        entry = totals.setdefault(wallet, [0.0, 0.0])
+        entry[0] += value
+        entry[1] += cost
+    return totals
+
+def bench_in_memory(n_symbols: int, holdings_per_wallet: int, n_wallets: int, per_wallet: int):
+    symbols = [f"TK{i}" for i in range(n_symbols)]
+    prices = [random.uniform(0.01, 3000) for _ in symbols]
+    snapshot = PriceSnapshot(symbols, prices)
+    price_by_symbol = dict(zip(symbols, prices))
+
+    results = []
+
+    single, single_rows = _synthetic(symbols, 1, holdings_per_wallet)
+    results.append({
+        'case': f'single_wallet_{holdings_per_wallet}_holdings',
+        'python_loop_ms': round(_timeit(lambda: _python_loop(single_rows, price_by_symbol)), 3),
+        'vectorized_ms': round(_timeit(lambda: value_holdings(single, snapshot)), 3)
+    })
+
+    batch, batch_rows = _synthetic(symbols, n_wallets, per_wallet)
+    results.append({
+        'case': f'batch_{n_wallets}_wallets_x_{per_wallet}',
+        'python_loop_ms': round(_timeit(lambda: _python_loop(batch_rows, price_by_symbol), repeat=3), 3),
+        'vectorized_ms': round(_timeit(lambda: value_wallet_batch(batch, snapshot), repeat=3), 3)
+    })
+    return results
+
+def _orm_loop(wallet_address: str):
+    """The ORM-row loop with one Token query per holding that the routes used to run"""
+    total_value = 0
+    for holding in Portfolio.query.filter(Portfolio.balance > 0, Portfolio.wallet_address == wallet_address).all():
+        token = Token.query.filter_by(symbol=holding.token_symbol).first()
+        if token:
+            total_value += holding.balance * token.price
+    return total_value
+
+def bench_database(n_symbols: int, holdings_per_wallet: int, n_wallets: int, per_wallet: int):
+    """End-to-end timings including the holdings and snapshot queries"""
+    with app.app_context():
+        db.create_all()
+        db.session.add_all(Token(symbol=f"TK{i}", name=f"Token {i}", price=random.uniform(0.01, 3000), change_24h=0)
+                           for i in range(n_symbols))
+
+        rows = []
+        for w in range(n_wallets):
+            count = holdings_per_wallet if w == 0 else per_wallet
+            for _ in range(count):
+                rows.append({
+                    'token_symbol': f"TK{random.randrange(n_symbols)}",
+                    'balance': random.uniform(0, 10000),
+                    'avg_buy_price': random.uniform(0.01, 3000),
+                    'wallet_address': f"0x{w:040x}"
+                })
+        db.session.execute(Portfolio.__table__.insert(), rows)
+        db.session.commit()
+
+        engine = get_valuation_engine()
+        wallets = [f"0x{w:040x}" for w in range(n_wallets)]
+        return [
+            {
+                'case': f'db_single_wallet_{holdings_per_wallet}_holdings',
+                'orm_loop_ms': round(_timeit(lambda: _orm_loop(wallets[0]), repeat=3), 3),
+                'vectorized_ms': round(_timeit(lambda: engine.value_wallet(wallets[0])), 3)
+            },
+            {
+                'case': f'db_batch_{n_wallets}_wallets',
+                'vectorized_ms': round(_timeit(lambda: engine.value_wallets(wallets), repeat=3), 3)
+            }
+        ]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--symbols', type=int, default=200)
+    parser.add_argument('--holdings', type=int, default=500)
+    parser.add_argument('--wallets', type=int, default=5000)
+    parser.add_argument('--per-wallet', type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(42)
+    results = bench_in_memory(args.symbols, args.holdings, args.wallets, args.per_wallet)
+    results += bench_database(args.symbols, args.holdings, args.wallets, args.per_wallet)
+
+    for result in results:
+        print(json.dumps(result))
+
+if __name__ == '__main__':
+    main()
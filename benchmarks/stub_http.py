@@ -0,0 +1,117 @@
+"""
+Stub HTTP servers for the external REST APIs
+CoinGecko, 1inch, the FDC data-availability layer and the Flare dev API,
+each with configurable latency
+"""
+
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+Route = Callable[[Dict[str, Any], Optional[Dict[str, Any]]], Tuple[int, Any]]
+
+COINGECKO_PRICES = {
+    'flare-networks': 0.02,
+    'wrapped-flare': 0.02,
+    'ethereum': 3000.0,
+    'matic-network': 0.4,
+    'metis-token': 40.0,
+    'apecoin': 1.1,
+    'tether': 1.0,
+    'bitcoin': 60000.0
+}
+
+def coingecko_routes() -> Dict[Tuple[str, str], Route]:
+    def simple_price(query, body):
+        ids = query.get('ids', [''])[0].split(',')
+        return 200, {coin: {'usd': COINGECKO_PRICES[coin]} for coin in ids if coin in COINGECKO_PRICES}
+    return {('GET', '/simple/price'): simple_price}
+
+def oneinch_routes() -> Dict[Tuple[str, str], Route]:
+    def swap(query, body):
+        amount = int(query.get('amount', ['0'])[0])
+        return 200, {
+            'toAmount': str(amount * 99 // 100),
+            'tx': {'data': '0x' + '12' * 196, 'to': '0x1111111254fb6c44bAC0beD2854e76F90643097d', 'value': '0'}
+        }
+    return {('GET', '/14/swap'): swap}
+
+def fdc_routes() -> Dict[Tuple[str, str], Route]:
+    def proof(query, body):
+        return 200, {'status': 'VALID', 'response': {'votingRound': (body or {}).get('votingRoundId')}}
+    return {('POST', '/proof-by-request-round'): proof}
+
+def flare_api_routes() -> Dict[Tuple[str, str], Route]:
+    def feeds(query, body):
+        symbols = query.get('symbols', [''])[0].split(',')
+        return 200, {'feeds': [{'symbol': s, 'value': 1.0} for s in symbols if s]}
+
+    def network_stats(query, body):
+        return 200, {'blockHeight': 30_000_000, 'validators': 100}
+
+    def fdc_request(query, body):
+        return 200, {'status': 'OK', 'attestationType': (body or {}).get('attestationType')}
+
+    return {
+        ('GET', '/ftso/v1/feeds'): feeds,
+        ('GET', '/api/network/stats'): network_stats,
+        ('POST', '/fdc/v1/request'): fdc_request
+    }
+
+class StubAPIServer:
+    """A route table served over HTTP on 127.0.0.1 in a background thread"""
+
+    def __init__(self, routes: Dict[Tuple[str, str], Route], latency_ms: float = 0.0, port: int = 0):
+        self.routes = routes
+        self.request_count = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _handle(self, method: str):
+                parsed = urlparse(self.path)
+                body = None
+                if method == 'POST':
+                    raw = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                    body = json.loads(raw) if raw else None
+
+                if latency_ms:
+                    time.sleep(latency_ms / 1000)
+
+                server.request_count += 1
+                route = server.routes.get((method, parsed.path))
+                status, payload = route(parse_qs(parsed.query), body) if route else (404, {'error': 'not found'})
+
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._handle('GET')
+
+            def do_POST(self):
+                self._handle('POST')
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self) -> 'StubAPIServer':
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,267 @@
+"""
+Reproducible offline benchmark suite
+Starts a fake Flare JSON-RPC node and stub REST APIs, points the app at them and
+benchmarks price refresh, portfolio sync, trade build, chatbot throughput and the
+main routes. Results are written as JSON for regression tracking.
+
+Usage:
+    python benchmarks/suite.py [--iterations 50] [--rpc-latency-ms 5] [--http-latency-ms 20]
+                               [--output results.json] [--baseline previous.json] [--only price_refresh]
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from fake_chain import FakeChain, FakeChainServer
+from stub_http import StubAPIServer, coingecko_routes, oneinch_routes, fdc_routes, flare_api_routes
+
+DEX_CONTRACT_ADDRESS = '0x5FbDB2315678afecb367f032d93F642f64180aa3'
+CHAINS = ['FLARE', 'ETHEREUM', 'POLYGON', 'AVALANCHE', 'BSC', 'COSTON2']
+
+def start_stand_ins(rpc_latency_ms: float, http_latency_ms: float) -> Dict[str, Any]:
+    """Start every local stand-in and export the env vars that point the app at them"""
+    servers = {
+        'rpc': FakeChainServer(FakeChain(), latency_ms=rpc_latency_ms).start(),
+        'coingecko': StubAPIServer(coingecko_routes(), latency_ms=http_latency_ms).start(),
+        'oneinch': StubAPIServer(oneinch_routes(), latency_ms=http_latency_ms).start(),
+        'fdc': StubAPIServer(fdc_routes(), latency_ms=http_latency_ms).start(),
+        'flare_api': StubAPIServer(flare_api_routes(), latency_ms=http_latency_ms).start()
+    }
+
+    for chain in CHAINS:
+        os.environ[f'{chain}_RPC_URL'] = servers['rpc'].url
+    os.environ['COINGECKO_API_URL'] = servers['coingecko'].url
+    os.environ['ONEINCH_API_URL'] = servers['oneinch'].url
+    os.environ['FDC_DATA_AVAILABILITY_URL'] = servers['fdc'].url
+    os.environ['FLARE_DEV_API_URL'] = servers['flare_api'].url + '/api'
+    os.environ['FLARE_FTSO_API_URL'] = servers['flare_api'].url + '/ftso/v1'
+    os.environ['FLARE_FDC_API_URL'] = servers['flare_api'].url + '/fdc/v1'
+    os.environ['DEX_CONTRACT_ADDRESS'] = DEX_CONTRACT_ADDRESS
+
+    tmpdir = tempfile.mkdtemp(prefix='flare_bench_')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+    os.environ['SHARED_PRICES_PATH'] = os.path.join(tmpdir, 'price_snapshot.bin')
+    # Benchmarks measure the routes themselves, not the 429 path
+    os.environ['ADMISSION_ENABLED'] = 'false'
+    return servers
+
+def measure(name: str, func: Callable[[], Any], iterations: int, warmup: int = 3) -> Dict[str, Any]:
+    """Run func repeatedly and summarize its latency distribution in milliseconds"""
+    errors = 0
+    for _ in range(warmup):
+        try:
+            func()
+        except Exception:
+            pass
+
+    samples = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        try:
+            func()
+        except Exception:
+            errors += 1
+        samples.append((time.perf_counter() - start) * 1000)
+    elapsed = time.perf_counter() - started
+
+    samples.sort()
+    def pct(p):
+        return samples[min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))]
+
+    return {
+        'name': name,
+        'iterations': iterations,
+        'errors': errors,
+        'mean_ms': round(statistics.fmean(samples), 3),
+        'p50_ms': round(pct(50), 3),
+        'p95_ms': round(pct(95), 3),
+        'p99_ms': round(pct(99), 3),
+        'max_ms': round(samples[-1], 3),
+        'ops_per_s': round(iterations / elapsed, 2) if elapsed > 0 else None
+    }
+
+def bench_account(index: int):
+    from eth_account import Account
+    from eth_utils import keccak
+    return Account.from_key(keccak(text=f"bench-wallet-{index}"))
+
+def sign_in(client, index: int):
+    """SIWE sign-in as a benchmark wallet; the test client keeps the wallet token cookie"""
+    from eth_account.messages import encode_defunct
+
+    account = bench_account(index)
+    sign_in_request = client.post('/api/wallet/sign_in', json={'address': account.address, 'chainId': 14}).get_json()
+    signature = account.sign_message(encode_defunct(text=sign_in_request['message'])).signature.hex()
+    response = client.post('/api/wallet/connect', json={**sign_in_request, 'signature': signature})
+    if response.status_code != 200:
+        raise RuntimeError(f"Benchmark sign-in failed: {response.get_json()}")
+
+def build_benchmarks(app, wallets: List[str]) -> Dict[str, Callable[[], Any]]:
+    """Benchmark callables keyed by name; imported lazily so env vars apply first"""
+    from blockchain_service import get_blockchain_service
+    from mock_data import sync_real_portfolio
+    from chatbot import process_chat_message
+
+    service = get_blockchain_service()
+    client = app.test_client()
+    sign_in(client, 0)
+
+    chat_messages = ['help', 'what chains do you support?', 'FLR price', 'gas fees', 'swap 10 FLR for ETH', 'hello']
+
+    def in_context(func):
+        def run():
+            with app.app_context():
+                return func()
+        return run
+
+    def trade_build(use_oneinch):
+        def run():
+            success, message = service.execute_dex_swap('WFLR', 'USDT', 1.0, wallets[0], use_oneinch=use_oneinch)
+            if not success:
+                raise RuntimeError(message)
+        return run
+
+    def chatbot_batch():
+        for message in chat_messages:
+            process_chat_message(message)
+
+    def get(path):
+        def run():
+            response = client.get(path)
+            if response.status_code >= 500:
+                raise RuntimeError(f"{path} -> {response.status_code}")
+        return run
+
+    def post(path, body):
+        def run():
+            response = client.post(path, json=body)
+            if response.status_code >= 500:
+                raise RuntimeError(f"{path} -> {response.status_code}")
+        return run
+
+    return {
+        'price_fetch': service.get_live_prices,
+        'price_refresh': in_context(service.update_token_prices),
+        'portfolio_sync': in_context(lambda: sync_real_portfolio(wallets[0])),
+        'trade_build_internal': trade_build(False),
+        'trade_build_oneinch': trade_build(True),
+        'chatbot_6_messages': in_context(chatbot_batch),
+        'route_dashboard': get('/'),
+        'route_trading': get('/trading'),
+        'route_portfolio': get('/portfolio'),
+        'route_api_portfolio': get('/api/portfolio'),
+        'route_market_stats': get('/api/market_stats'),
+        'route_refresh_prices': get('/api/refresh_prices'),
+        'route_cross_chain_quote': post('/api/cross_chain_quote', {
+            'from_chain': 'flare', 'to_chain': 'ethereum', 'from_token': 'FLR', 'to_token': 'ETH', 'amount': 100
+        }),
+        'route_aggregate_50_wallets': post('/api/portfolio/aggregate', {'wallets': wallets[:50]})
+    }
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, threshold: float) -> List[str]:
+    """Return descriptions of benchmarks whose p50 regressed by more than threshold"""
+    with open(baseline_path) as f:
+        baseline = {r['name']: r for r in json.load(f)['results']}
+
+    regressions = []
+    for result in results:
+        previous = baseline.get(result['name'])
+        if not previous or not previous['p50_ms']:
+            continue
+        change = (result['p50_ms'] - previous['p50_ms']) / previous['p50_ms']
+        result['p50_change'] = round(change, 4)
+        if change > threshold:
+            regressions.append(f"{result['name']}: p50 {previous['p50_ms']}ms -> {result['p50_ms']}ms ({change:+.0%})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--rpc-latency-ms', type=float, default=5.0)
+    parser.add_argument('--http-latency-ms', type=float, default=20.0)
+    parser.add_argument('--wallets', type=int, default=50)
+    parser.add_argument('--only', action='append', help='Run only the named benchmark (repeatable)')
+    parser.add_argument('--output', help='Write JSON results to this file instead of stdout')
+    parser.add_argument('--baseline', help='Previous results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed p50 regression vs baseline')
+    args = parser.parse_args()
+
+    servers = start_stand_ins(args.rpc_latency_ms, args.http_latency_ms)
+
+    from app import app, init_schema
+    from mock_data import initialize_real_data
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    wallets = [bench_account(i).address for i in range(args.wallets)]
+    init_schema(app)
+    with app.app_context():
+        initialize_real_data()
+
+    benchmarks = build_benchmarks(app, wallets)
+    names = args.only or list(benchmarks)
+
+    results = []
+    for name in names:
+        result = measure(name, benchmarks[name], args.iterations)
+        results.append(result)
+        print(f"{name:32s} p50={result['p50_ms']:9.3f}ms p95={result['p95_ms']:9.3f}ms "
+              f"errors={result['errors']}", file=sys.stderr)
+
+    regressions = compare(results, args.baseline, args.threshold) if args.baseline else []
+
+    report = {
+        'suite': 'flare-trader-offline',
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'config': {
+            'iterations': args.iterations,
+            'rpc_latency_ms': args.rpc_latency_ms,
+            'http_latency_ms': args.http_latency_ms,
+            'wallets': args.wallets
+        },
+        'stand_in_requests': {name: getattr(s, 'request_count', None) or getattr(getattr(s, 'chain', None), 'request_count', 0)
+                              for name, s in servers.items()},
+        'results': results,
+        'regressions': regressions
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    for server in servers.values():
+        server.stop()
+
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
@@ -5,66 +5,69 @@ Handles real onchain interactions, price feeds, and smart contract calls
 """
 
 import os
+import time
 import logging
-import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from web3 import Web3
-from typing import Dict, List, Optional, Tuple
-from models import Token, Portfolio, Trade
+from sqlalchemy import select, update, insert
+from typing import Any, Dict, List, Optional, Tuple
+from models import Token, Portfolio, Trade, PriceHistory
+from market_stats import get_market_stats
+from fragment_cache import get_fragment_cache
+from metrics import get_metrics, track_external, external_request
+from rpc_failover import FailoverHTTPProvider, parse_rpc_urls
+from logging_config import log_throttled
+from shared_prices import get_shared_price_table, read_shared_prices
+from singleflight import SingleFlight
+from price_aggregator import (PriceAggregator, PriceSource, PRICE_EXTERNAL_MIN_INTERVAL, PRICE_EXTRA_SOURCES,
+                              http_price_source, parse_sources)
+from token_registry import get_token_registry
+from feed_catalog import get_feed_catalog
 from app import db
 
 logger = logging.getLogger(__name__)
 
+# Refresh requests within this many seconds of the last one reuse its result
+PRICE_REFRESH_MIN_INTERVAL = float(os.environ.get('PRICE_REFRESH_MIN_INTERVAL', 5))
+
 class FlareBlockchainService:
     """Enhanced service for cross-chain interactions and Flare Network integration"""
 
+    # 4-byte selectors for balanceOf(address), Multicall3.getEthBalance(address) and decimals()
+    BALANCE_OF_SELECTOR = bytes.fromhex('70a08231')
+    GET_ETH_BALANCE_SELECTOR = bytes.fromhex('4d2301cc')
+    DECIMALS_SELECTOR = bytes.fromhex('313ce567')
+
     def __init__(self):
-        # Multi-chain RPC endpoints
+        # Multi-chain RPC endpoints (comma-separated lists, tried fastest-healthy first)
         self.rpc_urls = {
-            'flare': os.environ.get('FLARE_RPC_URL', 'https://flare-api.flare.network/ext/C/rpc'),
-            'ethereum': os.environ.get('ETHEREUM_RPC_URL', 'https://eth-mainnet.alchemyapi.io/v2/demo'),
-            'polygon': os.environ.get('POLYGON_RPC_URL', 'https://polygon-rpc.com'),
-            'avalanche': os.environ.get('AVALANCHE_RPC_URL', 'https://api.avax.network/ext/bc/C/rpc'),
-            'bsc': os.environ.get('BSC_RPC_URL', 'https://bsc-dataseed1.binance.org'),
-            'coston2': os.environ.get('COSTON2_RPC_URL', 'https://coston2-api.flare.network/ext/C/rpc')
+            'flare': parse_rpc_urls(os.environ.get('FLARE_RPC_URL', 'https://flare-api.flare.network/ext/C/rpc,https://rpc.ankr.com/flare')),
+            'ethereum': parse_rpc_urls(os.environ.get('ETHEREUM_RPC_URL', 'https://ethereum-rpc.publicnode.com,https://eth-mainnet.alchemyapi.io/v2/demo')),
+            'polygon': parse_rpc_urls(os.environ.get('POLYGON_RPC_URL', 'https://polygon-rpc.com,https://polygon-bor-rpc.publicnode.com')),
+            'avalanche': parse_rpc_urls(os.environ.get('AVALANCHE_RPC_URL', 'https://api.avax.network/ext/bc/C/rpc,https://avalanche-c-chain-rpc.publicnode.com')),
+            'bsc': parse_rpc_urls(os.environ.get('BSC_RPC_URL', 'https://bsc-dataseed1.binance.org,https://bsc-dataseed2.binance.org')),
+            'coston2': parse_rpc_urls(os.environ.get('COSTON2_RPC_URL', 'https://coston2-api.flare.network/ext/C/rpc'))
         }
 
-        # Initialize Web3 connections for all chains
+        # Initialize Web3 connections for all chains (sockets open on the first request)
         self.web3_connections = {}
-        for chain, rpc_url in self.rpc_urls.items():
+        for chain, rpc_urls in self.rpc_urls.items():
             try:
-                self.web3_connections[chain] = Web3(Web3.HTTPProvider(rpc_url))
-                logger.info(f"Connected to {chain}: {self.web3_connections[chain].is_connected()}")
+                self.web3_connections[chain] = Web3(FailoverHTTPProvider(rpc_urls, chain))
+                logger.info(f"Configured {chain} with {len(rpc_urls)} RPC endpoint(s)")
             except Exception as e:
                 logger.error(f"Failed to connect to {chain}: {e}")
 
         # Primary connection (Flare)
         self.w3 = self.web3_connections.get('flare')
 
+        # Token definitions, lookups and decimals (one registry shared by all services)
+        self.tokens = get_token_registry()
+
         # Cross-chain token addresses mapping
-        self.cross_chain_tokens = {
-            'flare': {
-                'WFLR': '0x1D80c49BbBCd1C0911346656B529DF9E5c2F783d',
-                'FLR': '0x0000000000000000000000000000000000000001',
-                'USDT': '0xf56dc6695cF1f5c364eDEbC7Dc7077ac9B586068',
-                'ETH': '0x6B7a87899490EcE95443e979cA9485CBE7E71522'
-            },
-            'ethereum': {
-                'WETH': '0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2',
-                'USDT': '0xdAC17F958D2ee523a2206206994597C13D831ec7',
-                'USDC': '0xA0b86a33E6441e7b1d7C31E5e6b2a41D4BC0E2e5',
-                'DAI': '0x6B175474E89094C44Da98b954EedeAC495271d0F'
-            },
-            'polygon': {
-                'WMATIC': '0x0d500B1d8E8eF31E21C99d1Db9A6444d3ADf1270',
-                'USDT': '0xc2132D05D31c914a87C6611C10748AEb04B58e8F',
-                'USDC': '0x2791Bca1f2de4661ED88A30C99A7a9449Aa84174'
-            },
-            'bsc': {
-                'WBNB': '0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c',
-                'USDT': '0x55d398326f99059fF775485246999027B3197955',
-                'BUSD': '0xe9e7CEA3DedcA5984780Bafc599bD69ADd087D56'
-            }
-        }
+        self.cross_chain_tokens = self.tokens.addresses_by_chain()
 
         # DEX router addresses for cross-chain swaps
         self.dex_routers = {
@@ -100,22 +103,80 @@ class FlareBlockchainService:
 
         # FDC and FTSO configurations
         self.contract_registry = os.environ.get('CONTRACT_REGISTRY', '0xaD67FE66660Fb8dFE9d6b1b4240d8650e30F6019')
-        self.fdc_data_availability = 'https://flr-data-availability.flare.network/api/v1/fdc'
-
-        # Enhanced FTSO Feed IDs with more pairs
-        self.ftso_feed_ids = {
-            'FLR/USD': '0x01464c522f555344000000000000000000000000000000000000000000000000',
-            'BTC/USD': '0x0142544320202020000000000000000000000000000000000000000000000000', 
-            'ETH/USD': '0x01455448202020200000000000000000000000000000000000000000000000000',
-            'XRP/USD': '0x01585250202020200000000000000000000000000000000000000000000000000',
-            'USDT/USD': '0x0155534454202020000000000000000000000000000000000000000000000000',
-            'MATIC/USD': '0x014d4154494320200000000000000000000000000000000000000000000000000',
-            'AVAX/USD': '0x01415641582020200000000000000000000000000000000000000000000000000',
-            'BNB/USD': '0x01424e4220202020000000000000000000000000000000000000000000000000'
+        self.fdc_data_availability = os.environ.get('FDC_DATA_AVAILABILITY_URL', 'https://flr-data-availability.flare.network/api/v1/fdc')
+
+        # External REST APIs (overridable for local stand-ins)
+        self.coingecko_api_url = os.environ.get('COINGECKO_API_URL', 'https://api.coingecko.com/api/v3')
+        self.oneinch_api_url = os.environ.get('ONEINCH_API_URL', 'https://api.1inch.io/v5.0')
+
+        # FTSO feeds come from the feed catalog (ftso_feed table), read in concurrent batches
+        self.feed_catalog = get_feed_catalog()
+        self.ftso_feed_batch_size = int(os.environ.get('FTSO_FEED_BATCH_SIZE', 50))
+        self.ftso_feed_workers = int(os.environ.get('FTSO_FEED_WORKERS', 4))
+        # Latest value of every catalog feed, including ones no token maps to
+        self.last_feed_prices: Dict[str, float] = {}
+
+        # Source of the last get_live_prices() result and the FTSO round it came from
+        self.last_price_source = None
+        self.last_ftso_timestamp = None
+
+        # All price sources are queried together under one deadline (PRICE_DEADLINE_SECONDS)
+        self.price_aggregator = PriceAggregator([
+            PriceSource('ftso', self._get_ftso_prices, 0),
+            PriceSource('coingecko', self._get_external_prices, 1, PRICE_EXTERNAL_MIN_INTERVAL)
+        ] + [
+            http_price_source(name, url, 2 + i)
+            for i, (name, url) in enumerate(parse_sources(PRICE_EXTRA_SOURCES).items())
+        ])
+        self._applied_ftso_timestamp = None
+        self._market_stats_seeded = False
+
+        # One price refresh at a time per process; see refresh_token_prices()
+        self._price_refresh_flight = SingleFlight()
+        self._last_price_refresh: Optional[float] = None
+
+        # Price refresh metrics (rows written per refresh)
+        self.price_refresh_metrics = {
+            'refreshes': 0,
+            'skipped_unchanged': 0,
+            'last_rows_written': 0,
+            'rows_written_total': 0
         }
 
         # Token addresses mapping for primary chain (Flare)
-        self.token_addresses = self.cross_chain_tokens.get('flare', {})
+        self.token_addresses = self.tokens.addresses('flare')
+
+        # Multicall3 (same address on Flare and most EVM chains) for batched reads
+        self.multicall_address = os.environ.get('MULTICALL3_ADDRESS', '0xcA11bde05977b3631167028862bE2a173976CA11')
+        self.multicall_batch_size = int(os.environ.get('MULTICALL_BATCH_SIZE', 200))
+        self.multicall_workers = int(os.environ.get('MULTICALL_WORKERS', 8))
+        self.multicall_abi = [
+            {
+                "inputs": [
+                    {
+                        "components": [
+                            {"name": "target", "type": "address"},
+                            {"name": "allowFailure", "type": "bool"},
+                            {"name": "callData", "type": "bytes"}
+                        ],
+                        "name": "calls",
+                        "type": "tuple[]"
+                    }
+                ],
+                "name": "aggregate3",
+                "outputs": [
+                    {
+                        "components": [
+                            {"name": "success", "type": "bool"},
+                            {"name": "returnData", "type": "bytes"}
+                        ],
+                        "name": "returnData",
+                        "type": "tuple[]"
+                    }
+                ],
+                "type": "function"
+            }
+        ]
 
         # DEX Contract Integration
         self.dex_contract_abi = [
@@ -174,113 +235,138 @@ class FlareBlockchainService:
 
     def get_live_prices(self) -> Dict[str, float]:
         """
-        Fetch live prices from Flare FTSO oracles
-        Falls back to external APIs if FTSO not available
+        Fetch live prices from FTSO oracles, CoinGecko and any extra sources at once
+        Per-token values are cross-checked and combined by the price aggregator;
+        last_price_source is the one source used, or 'consensus'.
         """
         try:
-            # Try to get prices from FTSO first
-            ftso_prices = self._get_ftso_prices()
-            if ftso_prices:
-                return ftso_prices
+            # Feed list and token mapping (database, so before the sources run off-thread)
+            self.feed_catalog.load(self.discover_ftso_feed_ids)
 
-            # Fallback to external price API
-            return self._get_external_prices()
+            aggregated = self.price_aggregator.collect()
+            self.last_price_source = aggregated.source_label
+            return aggregated.prices
 
         except Exception as e:
             logger.error(f"Error fetching live prices: {e}")
             return {}
 
+    # FTSOv2 getFeedsById and FastUpdatesConfiguration getFeedIds (official ABIs from dev.flare.network)
+    FTSO_V2_ABI = [
+        {
+            "inputs": [{"name": "_feedIds", "type": "bytes21[]"}],
+            "name": "getFeedsById",
+            "outputs": [
+                {"name": "_values", "type": "uint256[]"},
+                {"name": "_decimals", "type": "int8[]"},
+                {"name": "_timestamp", "type": "uint64"}
+            ],
+            "type": "function"
+        }
+    ]
+    FEED_IDS_ABI = [
+        {
+            "inputs": [],
+            "name": "getFeedIds",
+            "outputs": [{"name": "", "type": "bytes21[]"}],
+            "type": "function"
+        }
+    ]
+    REGISTRY_ABI = [
+        {
+            "inputs": [],
+            "name": "getFtsoV2",
+            "outputs": [{"name": "", "type": "address"}],
+            "type": "function"
+        },
+        {
+            "inputs": [{"name": "_name", "type": "string"}],
+            "name": "getContractAddressByName",
+            "outputs": [{"name": "", "type": "address"}],
+            "type": "function"
+        }
+    ]
+
+    def discover_ftso_feed_ids(self) -> List[bytes]:
+        """Feed IDs published by the FastUpdatesConfiguration contract"""
+        registry = self.w3.eth.contract(address=Web3.to_checksum_address(self.contract_registry), abi=self.REGISTRY_ABI)
+        address = registry.functions.getContractAddressByName('FastUpdatesConfiguration').call()
+        configuration = self.w3.eth.contract(address=Web3.to_checksum_address(address), abi=self.FEED_IDS_ABI)
+        return [bytes(feed_id) for feed_id in configuration.functions.getFeedIds().call()]
+
     def _get_ftso_prices(self) -> Dict[str, float]:
-        """Get prices from Flare Time Series Oracles (FTSOv2)"""
+        """Get prices from Flare Time Series Oracles (FTSOv2) for every catalog feed"""
         try:
             if not self.w3.is_connected():
-                logger.warning("Web3 not connected to Flare network")
+                log_throttled(logger, logging.WARNING, 'ftso_not_connected', "Web3 not connected to Flare network")
                 return {}
 
-            # FTSOv2 Interface ABI (official from dev.flare.network)
-            ftso_v2_abi = [
-                {
-                    "inputs": [{"name": "_feedIds", "type": "bytes21[]"}],
-                    "name": "getFeedsById",
-                    "outputs": [
-                        {"name": "_values", "type": "uint256[]"},
-                        {"name": "_decimals", "type": "int8[]"},
-                        {"name": "_timestamp", "type": "uint64"}
-                    ],
-                    "type": "function"
-                }
-            ]
+            entries = self.feed_catalog.entries()
+            if not entries:
+                return {}
 
             # Get FTSOv2 contract from registry
-            registry_abi = [
-                {
-                    "inputs": [],
-                    "name": "getFtsoV2",
-                    "outputs": [{"name": "", "type": "address"}],
-                    "type": "function"
-                }
-            ]
-
             registry_contract = self.w3.eth.contract(
                 address=Web3.to_checksum_address(self.contract_registry),
-                abi=registry_abi
+                abi=self.REGISTRY_ABI
             )
-
             ftso_v2_address = registry_contract.functions.getFtsoV2().call()
-
             ftso_contract = self.w3.eth.contract(
                 address=Web3.to_checksum_address(ftso_v2_address),
-                abi=ftso_v2_abi
+                abi=self.FTSO_V2_ABI
             )
 
-            # Get feed IDs as bytes
-            feed_ids = [Web3.to_bytes(hexstr=feed_id) for feed_id in self.ftso_feed_ids.values()]
-
-            # Call getFeedsById
-            values, decimals, timestamp = ftso_contract.functions.getFeedsById(feed_ids).call()
-
-            # Convert to price dictionary
-            prices = {}
-            feed_symbols = list(self.ftso_feed_ids.keys())
-
-            for i, (symbol, value, decimal) in enumerate(zip(feed_symbols, values, decimals)):
-                # Convert from feed format to USD price
-                token_symbol = symbol.split('/')[0]
-                price = value / (10 ** abs(decimal))
-
-                # Map to our token symbols
-                if token_symbol == 'FLR':
-                    prices['FLR'] = price
-                    prices['WFLR'] = price  # WFLR should have same price as FLR
-                elif token_symbol == 'BTC':
-                    # We don't have BTC but use for reference
-                    pass
-                elif token_symbol == 'ETH':
-                    prices['ETH'] = price
-                elif token_symbol == 'XRP':
-                    # Map to other tokens - this is simplified
-                    prices['MATIC'] = price * 0.0003  # Rough conversion
-                elif token_symbol == 'USDT':
-                    prices['USDT'] = price
-
-            logger.info(f"Retrieved FTSO prices: {prices}")
+            # Every batch reads the same block, so all values come from one voting round
+            block = self.w3.provider.head_tracker.head() if hasattr(self.w3.provider, 'head_tracker') else None
+            block = block if block is not None else 'latest'
+            batches = [entries[i:i + self.ftso_feed_batch_size] for i in range(0, len(entries), self.ftso_feed_batch_size)]
+
+            def read_batch(batch):
+                try:
+                    return ftso_contract.functions.getFeedsById([entry.feed_id for entry in batch]).call(
+                        block_identifier=block)
+                except Exception as e:
+                    # One failing batch leaves the others usable
+                    log_throttled(logger, logging.ERROR, 'ftso_batch_error', "FTSO batch of %d feeds failed: %s",
+                                  len(batch), str(e))
+                    return None
+
+            feed_prices = {}
+            timestamps = []
+            with track_external('ftso'), ThreadPoolExecutor(max_workers=min(self.ftso_feed_workers, len(batches))) as executor:
+                for batch, result in zip(batches, executor.map(read_batch, batches)):
+                    if result is None:
+                        continue
+                    values, decimals, timestamp = result
+                    timestamps.append(timestamp)
+                    for entry, value, decimal in zip(batch, values, decimals):
+                        # Convert from feed format to USD price
+                        feed_prices[entry.name] = value / (10 ** decimal)
+
+            if not timestamps:
+                return {}
+            self.last_ftso_timestamp = max(timestamps)
+            self.last_feed_prices = feed_prices
+
+            prices = self.feed_catalog.token_prices(feed_prices)
+            logger.debug("Retrieved %d FTSO feeds in %d batches: %s", len(feed_prices), len(batches), prices)
             return prices
 
         except Exception as e:
-            logger.error(f"FTSO price fetch error: {e}")
+            log_throttled(logger, logging.ERROR, 'ftso_error', "FTSO price fetch error: %s", str(e))
             return {}
 
     def _get_external_prices(self) -> Dict[str, float]:
         """Use real external price APIs including CoinGecko"""
         try:
             # Use CoinGecko API for real price data
-            url = "https://api.coingecko.com/api/v3/simple/price"
+            url = f"{self.coingecko_api_url}/simple/price"
             params = {
                 'ids': 'flare-networks,wrapped-flare,ethereum,matic-network,metis-token,apecoin,tether',
                 'vs_currencies': 'usd'
             }
 
-            response = requests.get(url, params=params, timeout=10)
+            response = external_request('coingecko', 'GET', url, params=params, timeout=10)
             if response.status_code == 200:
                 data = response.json()
 
@@ -294,32 +380,184 @@ class FlareBlockchainService:
                     'USDT': data.get('tether', {}).get('usd', 1.0),
                 }
 
-                logger.info(f"Retrieved external API prices: {prices}")
+                logger.debug("Retrieved external API prices: %s", prices)
                 return prices
 
         except Exception as e:
-            logger.error(f"External API price fetch error: {e}")
+            log_throttled(logger, logging.ERROR, 'external_price_error', "External API price fetch error: %s", str(e))
 
         return {}
 
-    def update_token_prices(self):
-        """Update database with live prices"""
+    def refresh_token_prices(self) -> Dict[str, Any]:
+        """
+        Coalesced update_token_prices() for request handlers and jobs
+        Concurrent callers share one in-flight refresh. Calls within
+        PRICE_REFRESH_MIN_INTERVAL of the last refresh in this process, or of
+        the last publish by any worker, return without fetching.
+        """
+        shared = read_shared_prices()
+        now = time.monotonic()
+        if (self._last_price_refresh is not None and now - self._last_price_refresh < PRICE_REFRESH_MIN_INTERVAL) or \
+                (shared is not None and time.time() - shared.published_at < PRICE_REFRESH_MIN_INTERVAL):
+            get_metrics().price_refreshes.inc('fresh')
+            return {'rows_written': 0, 'coalesced': 'fresh'}
+
+        rows_written, shared_call = self._price_refresh_flight.do('prices', self._run_price_refresh)
+        if shared_call:
+            get_metrics().price_refreshes.inc('coalesced')
+            return {'rows_written': rows_written, 'coalesced': 'waited'}
+        return {'rows_written': rows_written, 'coalesced': None}
+
+    def _run_price_refresh(self) -> int:
+        rows_written = self.update_token_prices()
+        self._last_price_refresh = time.monotonic()
+        return rows_written
+
+    def update_token_prices(self) -> int:
+        """
+        Update database with live prices
+        Skips the write when the FTSO round is unchanged (or, without FTSO, when
+        every source answer was cached) and updates all changed tokens in a
+        single bulk UPDATE. Returns the number of rows written.
+        """
         try:
             live_prices = self.get_live_prices()
+            self.price_refresh_metrics['refreshes'] += 1
+
+            aggregated = self.price_aggregator.last
+            ftso_timestamp = self.last_ftso_timestamp if aggregated and aggregated.contributed('ftso') else None
+            # History rows are stamped with the FTSO round, so a round is applied once
+            if ftso_timestamp is not None:
+                unchanged = ftso_timestamp == self._applied_ftso_timestamp
+            else:
+                unchanged = aggregated is None or not aggregated.fetched
+            if not live_prices or unchanged:
+                self.price_refresh_metrics['skipped_unchanged'] += 1
+                self._record_rows_written(0)
+                get_metrics().price_refreshes.inc('skipped' if live_prices else 'no_prices')
+                logger.debug("Price refresh skipped: FTSO round unchanged")
+                return 0
+
+            # Feed the rolling 24h window with this tick
+            tick_time = ftso_timestamp or time.time()
+            self._seed_market_stats()
+            market_stats = get_market_stats()
+            market_stats.record_prices(live_prices, ts=tick_time)
+
+            current = db.session.execute(
+                select(Token.id, Token.symbol, Token.price, Token.change_24h)
+                .where(Token.symbol.in_(live_prices.keys()))
+            ).all()
+
+            changes = []
+            for token_id, symbol, old_price, old_change in current:
+                price = live_prices[symbol]
+                stats = market_stats.get_stats(symbol)
+                change_24h = stats['change_24h'] if stats else 0.0
+
+                # The 24h baseline slides too, so refresh change_24h once it drifts
+                if price == old_price and old_change is not None and abs(change_24h - old_change) < 0.01:
+                    continue
+                changes.append({
+                    'id': token_id,
+                    'price': price,
+                    'change_24h': change_24h
+                })
 
-            for symbol, price in live_prices.items():
-                token = Token.query.filter_by(symbol=symbol).first()
-                if token:
-                    old_price = token.price
-                    token.price = price
-                    token.change_24h = ((price - old_price) / old_price * 100) if old_price > 0 else 0
+            if changes:
+                # ORM bulk UPDATE by primary key -> one executemany
+                db.session.execute(update(Token), changes)
+
+            tick_datetime = datetime.fromtimestamp(tick_time, timezone.utc).replace(tzinfo=None)
+            history = [{
+                'symbol': symbol,
+                'price': price,
+                'source': self.last_price_source,
+                'timestamp': tick_datetime
+            } for symbol, price in live_prices.items() if price and price > 0]
+            if history and ftso_timestamp is not None:
+                # Another worker may already have recorded this round
+                recorded = set(db.session.execute(
+                    select(PriceHistory.symbol).where(
+                        PriceHistory.symbol.in_([row['symbol'] for row in history]),
+                        PriceHistory.timestamp == tick_datetime)
+                ).scalars())
+                history = [row for row in history if row['symbol'] not in recorded]
+            if history:
+                db.session.execute(insert(PriceHistory), history)
 
             db.session.commit()
-            logger.info("Token prices updated successfully")
+            self._publish_shared_prices(ftso_timestamp)
+
+            self._applied_ftso_timestamp = ftso_timestamp
+            self._record_rows_written(len(changes))
+            get_metrics().price_refreshes.inc('applied')
+            get_metrics().price_snapshot_timestamp.set(self.last_price_source, value=tick_time)
+            if changes:
+                get_fragment_cache().bump('prices')
+            logger.info(f"Token prices updated: {len(changes)} of {len(current)} rows written")
+            return len(changes)
 
         except Exception as e:
             logger.error(f"Error updating token prices: {e}")
+            get_metrics().price_refreshes.inc('failed')
             db.session.rollback()
+            return 0
+
+    def _publish_shared_prices(self, ftso_round: Optional[int]):
+        """Publish the committed Token table to the other workers"""
+        table = get_shared_price_table()
+        if table is None:
+            return
+        try:
+            rows = db.session.execute(select(Token.symbol, Token.name, Token.price, Token.change_24h)).all()
+            table.publish(rows, self.last_price_source or 'unknown', ftso_round)
+        except Exception as e:
+            logger.error(f"Error publishing shared prices: {e}")
+
+    def _seed_market_stats(self):
+        """Load the last 24h of price history into the rolling windows once per process"""
+        if self._market_stats_seeded:
+            return
+        self._market_stats_seeded = True
+
+        try:
+            since = datetime.utcnow() - timedelta(hours=24)
+            rows = db.session.execute(
+                select(PriceHistory.symbol, PriceHistory.price, PriceHistory.timestamp)
+                .where(PriceHistory.timestamp >= since)
+                .order_by(PriceHistory.timestamp)
+            ).all()
+
+            get_market_stats().seed(
+                (symbol, price, ts.replace(tzinfo=timezone.utc).timestamp())
+                for symbol, price, ts in rows
+            )
+            logger.info(f"Seeded 24h market stats from {len(rows)} price history rows")
+
+        except Exception as e:
+            logger.error(f"Error seeding market stats: {e}")
+
+    def _record_rows_written(self, rows: int):
+        """Record rows written by the last price refresh"""
+        self.price_refresh_metrics['last_rows_written'] = rows
+        self.price_refresh_metrics['rows_written_total'] += rows
+        if rows:
+            get_metrics().price_rows_written.inc(amount=rows)
+
+    def fetch_token_decimals(self, chain: str, addresses: List[str]) -> Dict[str, int]:
+        """Read decimals() for ERC20 contracts on a chain in one multicall; failed calls are left out"""
+        batch = [(None, address, address, self.DECIMALS_SELECTOR) for address in addresses]
+        results = self._multicall_batch(batch, chain)
+        return {
+            address: int.from_bytes(return_data[:32], 'big')
+            for address, (success, return_data) in zip(addresses, results)
+            if success and len(return_data) >= 32
+        }
+
+    def ensure_token_decimals(self, chain: str = 'flare'):
+        """Confirm the registry's decimals for a chain (stored after the first read, so this is a no-op afterwards)"""
+        self.tokens.ensure_decimals(chain, self.fetch_token_decimals)
 
     def get_wallet_balance(self, wallet_address: str, token_symbol: str) -> float:
         """Get real wallet balance for a token"""
@@ -327,10 +565,14 @@ class FlareBlockchainService:
             if not self.w3.is_connected():
                 return 0.0
 
-            token_address = self.token_addresses.get(token_symbol)
-            if not token_address or token_address == '0x0000000000000000000000000000000000000000':
+            token = self.tokens.get(token_symbol)
+            if token is None or token.address is None:
                 return 0.0
 
+            owner = Web3.to_checksum_address(wallet_address)
+            if token.native:
+                return self.tokens.from_base_units(token, self.w3.eth.get_balance(owner))
+
             # ERC20 token ABI (balanceOf function)
             erc20_abi = [
                 {
@@ -341,23 +583,90 @@ class FlareBlockchainService:
                 }
             ]
 
-            contract = self.w3.eth.contract(
-                address=Web3.to_checksum_address(token_address),
-                abi=erc20_abi
-            )
-
-            balance_wei = contract.functions.balanceOf(
-                Web3.to_checksum_address(wallet_address)
-            ).call()
+            contract = self.w3.eth.contract(address=token.address, abi=erc20_abi)
+            balance_raw = contract.functions.balanceOf(owner).call()
 
-            # Convert from wei to tokens (assuming 18 decimals)
-            balance = balance_wei / (10 ** 18)
-            return balance
+            self.ensure_token_decimals('flare')
+            return self.tokens.from_base_units(token, balance_raw)
 
         except Exception as e:
             logger.error(f"Error getting wallet balance: {e}")
             return 0.0
 
+    def get_wallet_raw_balances(self, wallet_addresses: List[str], token_symbols: List[str]) -> Dict[str, Dict[str, int]]:
+        """
+        Get balances in integer base units for many wallets and tokens in Multicall3 batches
+        Batches of multicall_batch_size calls are fetched in parallel.
+        Native FLR uses Multicall3.getEthBalance, other tokens ERC20 balanceOf.
+        Wallets with any failed call are left out, so an RPC error never reads as an empty wallet.
+        """
+        balances = {wallet: {} for wallet in wallet_addresses}
+
+        try:
+            if not self.w3.is_connected():
+                return {}
+
+            # Precomputed call data: selector + left-padded address
+            calls = []
+            for wallet in wallet_addresses:
+                owner = bytes(12) + bytes.fromhex(Web3.to_checksum_address(wallet)[2:])
+                for symbol in token_symbols:
+                    token = self.tokens.get(symbol)
+                    if token is None or token.address is None:
+                        continue
+                    if token.native:
+                        calls.append((wallet, symbol, self.multicall_address, self.GET_ETH_BALANCE_SELECTOR + owner))
+                    else:
+                        calls.append((wallet, symbol, token.address, self.BALANCE_OF_SELECTOR + owner))
+
+            batches = [calls[i:i + self.multicall_batch_size] for i in range(0, len(calls), self.multicall_batch_size)]
+            if not batches:
+                return balances
+
+            failed = set()
+            with ThreadPoolExecutor(max_workers=min(self.multicall_workers, len(batches))) as executor:
+                for batch, results in zip(batches, executor.map(self._multicall_batch, batches)):
+                    for (wallet, symbol, _, _), (success, return_data) in zip(batch, results):
+                        if success and len(return_data) >= 32:
+                            balances[wallet][symbol] = int.from_bytes(return_data[:32], 'big')
+                        else:
+                            failed.add(wallet)
+
+            if failed:
+                logger.warning(f"Balances unavailable for {len(failed)} of {len(wallet_addresses)} wallets")
+            logger.debug("Fetched %d balances for %d wallets in %d multicall batches",
+                         len(calls), len(wallet_addresses), len(batches))
+            return {wallet: held for wallet, held in balances.items() if wallet not in failed}
+
+        except Exception as e:
+            logger.error(f"Error getting wallet balances: {e}")
+            return {}
+
+    def get_wallet_balances(self, wallet_addresses: List[str], token_symbols: List[str]) -> Dict[str, Dict[str, float]]:
+        """Same as get_wallet_raw_balances, converted to token amounts with each token's decimals"""
+        raw_balances = self.get_wallet_raw_balances(wallet_addresses, token_symbols)
+        self.ensure_token_decimals('flare')
+        return {
+            wallet: {symbol: self.tokens.from_base_units(self.tokens.get(symbol), raw) for symbol, raw in held.items()}
+            for wallet, held in raw_balances.items()
+        }
+
+    def _multicall_batch(self, batch: List[tuple], chain: str = 'flare') -> List[Tuple[bool, bytes]]:
+        """Run one Multicall3 aggregate3 call for a batch of (wallet, symbol, target, call data)"""
+        try:
+            multicall = self.web3_connections[chain].eth.contract(
+                address=Web3.to_checksum_address(self.multicall_address),
+                abi=self.multicall_abi
+            )
+            return multicall.functions.aggregate3([
+                (Web3.to_checksum_address(target), True, call_data)
+                for _, _, target, call_data in batch
+            ]).call()
+
+        except Exception as e:
+            logger.error(f"Multicall batch of {len(batch)} calls on {chain} failed: {e}")
+            return [(False, b'')] * len(batch)
+
     def get_fdc_attestation_data(self, attestation_type: str, request_data: dict) -> Optional[dict]:
         """
         Get attestation data from Flare Data Connector (FDC)
@@ -379,7 +688,7 @@ class FlareBlockchainService:
                 "requestBytes": request_data.get('requestBytes', '')
             }
 
-            response = requests.post(url, json=payload, headers=headers, timeout=10)
+            response = external_request('fdc', 'POST', url, json=payload, headers=headers, timeout=10)
 
             if response.status_code == 200:
                 return response.json()
@@ -419,6 +728,11 @@ class FlareBlockchainService:
         # Simplified encoding - real implementation would use proper ABI encoding
         return f"0x4164647265737356616c696469747900000000000000000000000000000000{address.replace('0x', '')}"
 
+    def trade_contract_addresses(self, chain: str = 'flare') -> set:
+        """Lower-cased contracts a trade transaction may be sent to: our DEX and the chain's 1inch router"""
+        candidates = [self.dex_contract_address, self.dex_routers.get(chain, {}).get('oneinch')]
+        return {address.lower() for address in candidates if address and Web3.is_address(address)}
+
     def execute_dex_swap(self, from_token: str, to_token: str, amount: float, wallet_address: str, use_oneinch: bool = False) -> Tuple[bool, str]:
         """
         Execute a swap using our DEX contract with optional 1inch aggregation
@@ -449,7 +763,7 @@ class FlareBlockchainService:
             )
 
             # Convert amount to wei
-            amount_wei = Web3.to_wei(amount, 'ether')
+            amount_wei = self.tokens.to_base_units(from_token, amount)
 
             if from_token == 'FLR' and to_token == 'WFLR':
                 # Special case for FLR to WFLR wrapping
@@ -529,7 +843,7 @@ class FlareBlockchainService:
                 abi=self.dex_contract_abi
             )
 
-            amount_wei = Web3.to_wei(amount, 'ether')
+            amount_wei = self.tokens.to_base_units(from_token, amount)
 
             tx_data = dex_contract.functions.crossChainSwap(
                 Web3.to_checksum_address(from_token_address),
@@ -573,8 +887,8 @@ class FlareBlockchainService:
                 abi=self.dex_contract_abi
             )
 
-            amount_a_wei = Web3.to_wei(amount_a, 'ether')
-            amount_b_wei = Web3.to_wei(amount_b, 'ether')
+            amount_a_wei = self.tokens.to_base_units(token_a, amount_a)
+            amount_b_wei = self.tokens.to_base_units(token_b, amount_b)
 
             tx_data = dex_contract.functions.addLiquidity(
                 Web3.to_checksum_address(token_a_address),
@@ -601,7 +915,7 @@ class FlareBlockchainService:
         """
         try:
             # 1inch API for Flare (chainId 14)
-            url = "https://api.1inch.io/v5.0/14/swap"
+            url = f"{self.oneinch_api_url}/14/swap"
 
             from_token_address = self.token_addresses.get(from_token)
             to_token_address = self.token_addresses.get(to_token)
@@ -612,13 +926,13 @@ class FlareBlockchainService:
             params = {
                 'fromTokenAddress': from_token_address,
                 'toTokenAddress': to_token_address,
-                'amount': str(Web3.to_wei(amount, 'ether')),
+                'amount': str(self.tokens.to_base_units(from_token, amount)),
                 'fromAddress': self.dex_contract_address,
                 'slippage': 1,
                 'disableEstimate': True
             }
 
-            response = requests.get(url, params=params, timeout=10)
+            response = external_request('oneinch', 'GET', url, params=params, timeout=10)
             if response.status_code == 200:
                 return response.json()
             else:
@@ -725,9 +1039,24 @@ class FlareBlockchainService:
         """
         return self.execute_dex_swap(from_token, to_token, amount, wallet_address, use_oneinch=False)
 
-# Global service instance
-blockchain_service = FlareBlockchainService()
+# Global service instance, built on first use in each process
+_blockchain_service: Optional[FlareBlockchainService] = None
+_blockchain_service_pid: Optional[int] = None
+_blockchain_service_lock = threading.Lock()
 
 def get_blockchain_service() -> FlareBlockchainService:
-    """Getthe blockchain service instance"""
-    return blockchain_service
\ No newline at end of file
+    """Get the blockchain service instance (a forked process builds its own)"""
+    global _blockchain_service, _blockchain_service_pid
+    if _blockchain_service is None or _blockchain_service_pid != os.getpid():
+        with _blockchain_service_lock:
+            if _blockchain_service is None or _blockchain_service_pid != os.getpid():
+                _blockchain_service = FlareBlockchainService()
+                _blockchain_service_pid = os.getpid()
+    return _blockchain_service
+
+def reset_blockchain_service():
+    """Drop the instance so the next call builds fresh connections"""
+    global _blockchain_service, _blockchain_service_pid
+    with _blockchain_service_lock:
+        _blockchain_service = None
+        _blockchain_service_pid = None
\ No newline at end of file
@@ -0,0 +1,117 @@
+"""
+Database engine profiles
+Picks SQLAlchemy engine options for SQLite or PostgreSQL based on DATABASE_URL
+"""
+
+import os
+import sqlite3
+import logging
+from typing import Dict, Any
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+
+logger = logging.getLogger(__name__)
+
+# SQLite tuning (applied as PRAGMAs on every new connection)
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 16384))
+
+# PostgreSQL pool and session tuning
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 5000))
+DB_IDLE_TX_TIMEOUT_MS = int(os.environ.get('DB_IDLE_TX_TIMEOUT_MS', 30000))
+DB_PREPARE_THRESHOLD = int(os.environ.get('DB_PREPARE_THRESHOLD', 5))
+
+_pragmas_installed = False
+
+def normalize_database_url(database_url: str) -> str:
+    """Accept the legacy postgres:// scheme that some hosts still hand out"""
+    if database_url.startswith('postgres://'):
+        return 'postgresql://' + database_url[len('postgres://'):]
+    return database_url
+
+def get_profile_name(database_url: str) -> str:
+    """Return 'sqlite', 'postgresql' or 'default' for a database URL"""
+    backend = make_url(normalize_database_url(database_url)).get_backend_name()
+    if backend in ('sqlite', 'postgresql'):
+        return backend
+    return 'default'
+
+def sqlite_engine_options() -> Dict[str, Any]:
+    """Engine options for a file-backed SQLite database running in WAL mode"""
+    return {
+        'connect_args': {
+            'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000,
+            'check_same_thread': False,
+        },
+    }
+
+def postgres_engine_options(database_url: str) -> Dict[str, Any]:
+    """Engine options for PostgreSQL with a sized pool and server-side timeouts"""
+    driver = make_url(normalize_database_url(database_url)).get_driver_name()
+
+    connect_args: Dict[str, Any] = {
+        'options': (
+            f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS} "
+            f"-c idle_in_transaction_session_timeout={DB_IDLE_TX_TIMEOUT_MS}"
+        ),
+    }
+
+    # psycopg (v3) prepares repeated statements server-side after
+    # prepare_threshold executions; psycopg2 has no equivalent
+    if driver == 'psycopg':
+        connect_args['prepare_threshold'] = DB_PREPARE_THRESHOLD
+
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': 300,
+        'pool_pre_ping': True,
+        'pool_use_lifo': True,
+        'connect_args': connect_args,
+    }
+
+def get_engine_options(database_url: str) -> Dict[str, Any]:
+    """Get SQLALCHEMY_ENGINE_OPTIONS for the profile matching database_url"""
+    profile = get_profile_name(database_url)
+
+    if profile == 'sqlite':
+        install_sqlite_pragmas()
+        return sqlite_engine_options()
+    if profile == 'postgresql':
+        return postgres_engine_options(database_url)
+
+    return {
+        'pool_recycle': 300,
+        'pool_pre_ping': True,
+    }
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Apply WAL and related PRAGMAs to each new SQLite connection"""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+def install_sqlite_pragmas():
+    """Register the SQLite connect hook once for all engines"""
+    global _pragmas_installed
+    if _pragmas_installed:
+        return
+
+    event.listen(Engine, 'connect', _set_sqlite_pragmas)
+    _pragmas_installed = True
+    logger.info("SQLite WAL profile enabled")
@@ -0,0 +1,347 @@
+"""
+Incremental indexer for FlareCrossChainDEX events
+Pulls eth_getLogs in adaptive block-range chunks, decodes Swap, CrossChainSwap,
+LiquidityAdded, LiquidityRemoved and BridgeInitiated with precomputed topic
+hashes, and bulk-inserts them as Trade rows. The checkpoint is committed in
+the same transaction as the rows, so a restart resumes without gaps or
+duplicates.
+
+Swaps are priced from their own amounts (amount_out / amount_in, valued in
+token_out units). Events without an output amount are valued from the
+PriceHistory row nearest their block time, within INDEXER_PRICE_WINDOW;
+otherwise price and value stay NULL. Liquidity events are stored with
+is_liquidity set so they are not counted as trading volume.
+
+Usage:
+    python event_indexer.py [--from-block N] [--follow]
+"""
+
+import os
+import json
+import time
+import logging
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from eth_abi import decode
+from eth_utils import keccak, to_checksum_address
+from sqlalchemy import insert, select, update
+from app import db
+from models import PriceHistory, Trade, IndexerCheckpoint
+from blockchain_service import get_blockchain_service
+from fragment_cache import get_fragment_cache
+from metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+INDEXER_CHAIN = os.environ.get('INDEXER_CHAIN', 'flare')
+INDEXER_START_BLOCK = os.environ.get('INDEXER_START_BLOCK')
+INDEXER_CONFIRMATIONS = int(os.environ.get('INDEXER_CONFIRMATIONS', 2))
+INDEXER_CHUNK_SIZE = int(os.environ.get('INDEXER_CHUNK_SIZE', 500))
+INDEXER_MAX_CHUNK = int(os.environ.get('INDEXER_MAX_CHUNK', 5000))
+INDEXER_MAX_BLOCKS_PER_RUN = int(os.environ.get('INDEXER_MAX_BLOCKS_PER_RUN', 50000))
+# Successful chunks in a row before a range cap set by a failure is doubled again
+INDEXER_REGROW_AFTER = int(os.environ.get('INDEXER_REGROW_AFTER', 20))
+# Seconds between an event and the PriceHistory row used to value it
+INDEXER_PRICE_WINDOW = float(os.environ.get('INDEXER_PRICE_WINDOW', 3600))
+
+# Grow the range while a chunk returns fewer logs than this
+TARGET_LOGS_PER_CHUNK = 1000
+
+def _event(signature: str, trade_type: str, data_types: List[str], fields: List[str]) -> Tuple[bytes, Dict[str, Any]]:
+    return keccak(text=signature), {
+        'name': signature.split('(')[0],
+        'trade_type': trade_type,
+        'data_types': data_types,
+        'fields': fields
+    }
+
+# topic0 -> decoding spec; the first parameter (user / provider) is indexed in every event
+EVENTS = dict([
+    _event('Swap(address,address,address,uint256,uint256)', 'swap',
+           ['address', 'address', 'uint256', 'uint256'], ['token_in', 'token_out', 'amount_in', 'amount_out']),
+    _event('CrossChainSwap(address,address,uint256,string,address)', 'cross_chain',
+           ['address', 'uint256', 'string', 'address'], ['token_in', 'amount_in', 'destination_chain', 'token_out']),
+    _event('LiquidityAdded(address,address,address,uint256,uint256)', 'add_liquidity',
+           ['address', 'address', 'uint256', 'uint256'], ['token_in', 'token_out', 'amount_in', 'amount_out']),
+    _event('LiquidityRemoved(address,address,address,uint256,uint256)', 'remove_liquidity',
+           ['address', 'address', 'uint256', 'uint256'], ['token_in', 'token_out', 'amount_in', 'amount_out']),
+    _event('BridgeInitiated(address,address,uint256,string)', 'bridge',
+           ['address', 'uint256', 'string'], ['token_in', 'amount_in', 'destination_chain']),
+])
+TOPICS = ['0x' + topic.hex() for topic in EVENTS]
+LIQUIDITY_TYPES = ('add_liquidity', 'remove_liquidity')
+
+def decode_log(log: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Decode one raw log into event fields, or None for unknown topics"""
+    topics = log['topics']
+    if not topics:
+        return None
+    spec = EVENTS.get(bytes(topics[0]))
+    if spec is None:
+        return None
+
+    values = decode(spec['data_types'], bytes(log['data']))
+    event = dict(zip(spec['fields'], values))
+    event.update({
+        'event': spec['name'],
+        'trade_type': spec['trade_type'],
+        'user': to_checksum_address(bytes(topics[1])[-20:]),
+        'tx_hash': '0x' + bytes(log['transactionHash']).hex(),
+        'block_number': log['blockNumber'],
+        'log_index': log['logIndex']
+    })
+    return event
+
+class DexEventIndexer:
+    """Follows the DEX contract's logs from a checkpoint to the confirmed head"""
+
+    def __init__(self, chain: str = INDEXER_CHAIN):
+        self.chain = chain
+        self.checkpoint_name = f"dex_events:{chain}"
+        self.chunk_size = INDEXER_CHUNK_SIZE
+        # Growth cap, halved with the chunk on failure so it settles below a provider's limit,
+        # and doubled again after INDEXER_REGROW_AFTER clean chunks so one timeout is not permanent
+        self.chunk_limit = INDEXER_MAX_CHUNK
+        self.clean_chunks = 0
+        self.service = get_blockchain_service()
+
+    @property
+    def w3(self):
+        return self.service.web3_connections[self.chain]
+
+    def load_checkpoint(self) -> Optional[int]:
+        return db.session.execute(
+            select(IndexerCheckpoint.last_block).where(IndexerCheckpoint.name == self.checkpoint_name)
+        ).scalar()
+
+    def run_once(self, from_block: Optional[int] = None, max_blocks: int = INDEXER_MAX_BLOCKS_PER_RUN) -> int:
+        """Index up to max_blocks past the checkpoint; returns the number of trades inserted"""
+        contract = self.service.dex_contract_address
+        if not contract:
+            return 0
+
+        head = self.w3.eth.block_number - INDEXER_CONFIRMATIONS
+        last_block = self.load_checkpoint()
+        if from_block is None:
+            if last_block is not None:
+                from_block = last_block + 1
+            elif INDEXER_START_BLOCK:
+                from_block = int(INDEXER_START_BLOCK)
+            else:
+                # Fresh install without a start block: follow from the current head
+                from_block = head
+
+        end_block = min(head, from_block + max_blocks - 1)
+        inserted = 0
+        start = from_block
+        while start <= end_block:
+            stop = min(end_block, start + self.chunk_size - 1)
+            logs = self._get_logs(contract, start, stop)
+            if logs is None:
+                if self.chunk_size == 1:
+                    raise RuntimeError(f"eth_getLogs failed for single block {start}")
+                # Range or result-size limit: halve and retry the same start
+                self.chunk_size = max(1, self.chunk_size // 2)
+                self.chunk_limit = self.chunk_size
+                self.clean_chunks = 0
+                continue
+
+            inserted += self._store(logs, stop)
+            self.clean_chunks += 1
+            if self.clean_chunks >= INDEXER_REGROW_AFTER and self.chunk_limit < INDEXER_MAX_CHUNK:
+                self.chunk_limit = min(INDEXER_MAX_CHUNK, self.chunk_limit * 2)
+                self.clean_chunks = 0
+            if len(logs) < TARGET_LOGS_PER_CHUNK // 2:
+                self.chunk_size = min(self.chunk_limit, self.chunk_size * 2)
+            start = stop + 1
+
+        if inserted:
+            logger.info(f"Indexed {inserted} DEX events up to block {end_block}")
+        return inserted
+
+    def _get_logs(self, contract: str, start: int, stop: int) -> Optional[List[Dict[str, Any]]]:
+        try:
+            return self.w3.eth.get_logs({
+                'address': to_checksum_address(contract),
+                'fromBlock': start,
+                'toBlock': stop,
+                'topics': [TOPICS]
+            })
+        except Exception as e:
+            logger.warning(f"eth_getLogs {start}-{stop} failed ({self.chunk_size} blocks): {e}")
+            get_metrics().indexer_chunk_retries.inc(self.chain)
+            return None
+
+    def _block_times(self, block_numbers: List[int]) -> Dict[int, datetime]:
+        """Timestamps for the blocks that have events, in one JSON-RPC batch"""
+        if not block_numbers:
+            return {}
+        responses = self.w3.provider.make_batch_request([
+            ('eth_getBlockByNumber', [hex(number), False]) for number in block_numbers
+        ])
+        times = {}
+        for number, response in zip(block_numbers, responses if isinstance(responses, list) else []):
+            block = response.get('result') if isinstance(response, dict) else None
+            if block:
+                times[number] = datetime.fromtimestamp(int(block['timestamp'], 16), timezone.utc).replace(tzinfo=None)
+        return times
+
+    def _historical_prices(self, wanted: Dict[str, List[datetime]]) -> Dict[Tuple[str, datetime], float]:
+        """USD price of each (symbol, time) from the nearest PriceHistory row within INDEXER_PRICE_WINDOW"""
+        window = timedelta(seconds=INDEXER_PRICE_WINDOW)
+        prices = {}
+        for symbol, times in wanted.items():
+            rows = db.session.execute(
+                select(PriceHistory.timestamp, PriceHistory.price)
+                .where(PriceHistory.symbol == symbol,
+                       PriceHistory.timestamp.between(min(times) - window, max(times) + window))
+                .order_by(PriceHistory.timestamp)
+            ).all()
+            if not rows:
+                continue
+            stamps = [timestamp for timestamp, _ in rows]
+            for at in times:
+                i = bisect_left(stamps, at)
+                nearest = min((j for j in (i - 1, i) if 0 <= j < len(rows)), key=lambda j: abs(stamps[j] - at))
+                if abs(stamps[nearest] - at) <= window:
+                    prices[(symbol, at)] = rows[nearest][1]
+        return prices
+
+    def _store(self, logs: List[Dict[str, Any]], checkpoint_block: int) -> int:
+        events = [event for event in map(decode_log, logs) if event]
+
+        # BridgeInitiated repeats the CrossChainSwap emitted in the same transaction
+        cross_chain_txs = {e['tx_hash'] for e in events if e['trade_type'] == 'cross_chain'}
+        events = [e for e in events if not (e['trade_type'] == 'bridge' and e['tx_hash'] in cross_chain_txs)]
+
+        # Trades placed through the app already have a row, settled by the receipt tracker
+        if events:
+            known = set(db.session.execute(
+                select(Trade.tx_hash).where(Trade.tx_hash.in_({e['tx_hash'] for e in events}))
+            ).scalars())
+            events = [e for e in events if e['tx_hash'] not in known]
+
+        rows = []
+        if events:
+            registry = self.service.tokens
+            self.service.ensure_token_decimals('flare')
+            block_times = self._block_times(sorted({e['block_number'] for e in events}))
+
+            decoded = []
+            wanted: Dict[str, List[datetime]] = {}
+            for event in events:
+                token_in = registry.by_address(event['token_in'])
+                from_symbol = token_in.symbol if token_in else event['token_in'][:10]
+                to_token = event.get('token_out')
+                token_out = registry.by_address(to_token) if to_token else None
+                to_symbol = token_out.symbol if token_out else (to_token[:10] if to_token else from_symbol)
+                # Unknown tokens are assumed to have 18 decimals
+                amount = registry.from_base_units(token_in, event['amount_in']) if token_in else event['amount_in'] / 10 ** 18
+                amount_out = None
+                if 'amount_out' in event:
+                    amount_out = registry.from_base_units(token_out, event['amount_out']) if token_out \
+                        else event['amount_out'] / 10 ** 18
+                at = block_times.get(event['block_number'])
+                decoded.append((event, from_symbol, to_symbol, amount, amount_out, at))
+
+                # Swaps carry their own execution price; everything else needs a historical USD price
+                if at is not None and (event['trade_type'] != 'swap' or not amount):
+                    wanted.setdefault(from_symbol, []).append(at)
+                    if event['trade_type'] in LIQUIDITY_TYPES:
+                        wanted.setdefault(to_symbol, []).append(at)
+            history = self._historical_prices(wanted)
+
+            for event, from_symbol, to_symbol, amount, amount_out, at in decoded:
+                price = total_value = None
+                value_unit = 'USD'
+                if event['trade_type'] == 'swap' and amount and amount_out is not None:
+                    price, total_value, value_unit = amount_out / amount, amount_out, to_symbol
+                elif event['trade_type'] in LIQUIDITY_TYPES:
+                    # Both sides of the pool position, when both are priced
+                    price_in, price_out = history.get((from_symbol, at)), history.get((to_symbol, at))
+                    if price_in is not None and price_out is not None:
+                        total_value = amount * price_in + (amount_out or 0.0) * price_out
+                elif (from_symbol, at) in history:
+                    price = history[(from_symbol, at)]
+                    total_value = amount * price
+
+                rows.append({
+                    'trade_type': event['trade_type'],
+                    'from_token': from_symbol,
+                    'to_token': to_symbol,
+                    'amount': amount,
+                    'price': price,
+                    'total_value': total_value,
+                    'wallet_address': event['user'],
+                    'tx_hash': event['tx_hash'],
+                    'status': 'confirmed',
+                    'is_liquidity': event['trade_type'] in LIQUIDITY_TYPES,
+                    'block_number': event['block_number'],
+                    'created_at': at or datetime.utcnow(),
+                    'trade_metadata': json.dumps({
+                        'event': event['event'],
+                        'block_number': event['block_number'],
+                        'log_index': event['log_index'],
+                        'token_in': event['token_in'],
+                        'token_out': event.get('token_out'),
+                        'amount_in': str(event['amount_in']),
+                        'amount_out': str(event['amount_out']) if 'amount_out' in event else None,
+                        'destination_chain': event.get('destination_chain'),
+                        'value_unit': value_unit if total_value is not None else None
+                    })
+                })
+
+        try:
+            if rows:
+                # Core insert bypasses ORM events, so the trades fragment is bumped below
+                db.session.execute(insert(Trade), rows)
+            self._save_checkpoint(checkpoint_block)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        if rows:
+            get_fragment_cache().bump('trades')
+            get_metrics().indexer_events.inc(self.chain, amount=len(rows))
+        get_metrics().indexer_block.set(self.chain, value=checkpoint_block)
+        return len(rows)
+
+    def _save_checkpoint(self, block: int):
+        updated = db.session.execute(
+            update(IndexerCheckpoint)
+            .where(IndexerCheckpoint.name == self.checkpoint_name)
+            .values(last_block=block, updated_at=datetime.utcnow())
+        ).rowcount
+        if not updated:
+            db.session.add(IndexerCheckpoint(name=self.checkpoint_name, last_block=block))
+
+_indexer: Optional[DexEventIndexer] = None
+
+def get_event_indexer() -> DexEventIndexer:
+    """Get the DEX event indexer instance"""
+    global _indexer
+    if _indexer is None:
+        _indexer = DexEventIndexer()
+    return _indexer
+
+if __name__ == '__main__':
+    import argparse
+    from app import app
+
+    parser = argparse.ArgumentParser(description='Index FlareCrossChainDEX events into the trades table')
+    parser.add_argument('--from-block', type=int, help='Start here instead of the checkpoint')
+    parser.add_argument('--follow', action='store_true', help='Keep following the head')
+    args = parser.parse_args()
+
+    with app.app_context():
+        indexer = get_event_indexer()
+        from_block = args.from_block
+        while True:
+            count = indexer.run_once(from_block)
+            from_block = None
+            print(f"Indexed {count} events; checkpoint {indexer.load_checkpoint()}")
+            if not args.follow:
+                break
+            time.sleep(indexer.service.web3_connections[indexer.chain].provider.head_tracker.interval)
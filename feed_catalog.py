@@ -0,0 +1,173 @@
+"""
+FTSO feed catalog
+Feed IDs are bytes21: one category byte followed by the feed name in ASCII,
+zero-padded to 20 bytes (FLR/USD -> 0x01464c522f555344 + 13 zero bytes).
+The catalog discovers the IDs the FTSO system publishes, validates their
+encoding and keeps them in the ftso_feed table together with the tokens
+each feed prices, so new feeds and token mappings need no code change.
+Workers read the table at most every FEED_CATALOG_TTL seconds.
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from sqlalchemy import select
+from models import FtsoFeed
+from token_registry import get_token_registry
+from app import db
+
+logger = logging.getLogger(__name__)
+
+FEED_CATALOG_TTL = float(os.environ.get('FEED_CATALOG_TTL', 300))
+
+FEED_ID_SIZE = 21
+FEED_CATEGORIES = {1: 'crypto', 2: 'forex', 3: 'commodity', 4: 'stock'}
+
+# Used when discovery is unavailable and the table is empty
+DEFAULT_FEEDS = ['FLR/USD', 'BTC/USD', 'ETH/USD', 'XRP/USD', 'USDT/USD', 'POL/USD', 'AVAX/USD', 'BNB/USD']
+
+# Feed base -> tokens it prices, where the feed and token symbols differ or one feed prices several tokens
+FEED_TOKEN_OVERRIDES = {
+    'FLR': ('FLR', 'WFLR'),
+    'POL': ('MATIC',)
+}
+
+class FeedEntry(NamedTuple):
+    """One enabled feed and the tokens it prices"""
+    feed_id: bytes
+    name: str
+    symbols: Tuple[str, ...]
+
+def encode_feed_id(name: str, category: int = 1) -> bytes:
+    """bytes21 feed ID for a feed name"""
+    encoded = name.encode('ascii')
+    if not 0 < len(encoded) < FEED_ID_SIZE or category not in FEED_CATEGORIES:
+        raise ValueError(f"Invalid feed {category}:{name}")
+    return bytes([category]) + encoded.ljust(FEED_ID_SIZE - 1, b'\0')
+
+def decode_feed_id(feed_id: bytes) -> Optional[Tuple[int, str]]:
+    """(category, name) for a well-formed feed ID, else None"""
+    if len(feed_id) != FEED_ID_SIZE or feed_id[0] not in FEED_CATEGORIES:
+        return None
+    name = feed_id[1:].rstrip(b'\0')
+    # Padding must be all zeros and the name printable ASCII
+    if not name or b'\0' in name or not all(0x20 < c < 0x7f for c in name):
+        return None
+    return feed_id[0], name.decode('ascii')
+
+def default_token_symbols(name: str) -> Tuple[str, ...]:
+    """Tokens a USD feed prices by default: overrides, else the registry token with the base symbol"""
+    base, _, quote = name.partition('/')
+    if quote != 'USD':
+        return ()
+    if base in FEED_TOKEN_OVERRIDES:
+        return FEED_TOKEN_OVERRIDES[base]
+    return (base,) if get_token_registry().get(base) else ()
+
+class FeedCatalog:
+    """Enabled feeds from the ftso_feed table, cached per process"""
+
+    def __init__(self, ttl: float = FEED_CATALOG_TTL):
+        self.ttl = ttl
+        self._entries: List[FeedEntry] = self._defaults()
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _defaults() -> List[FeedEntry]:
+        return [FeedEntry(encode_feed_id(name), name, default_token_symbols(name)) for name in DEFAULT_FEEDS]
+
+    def entries(self) -> List[FeedEntry]:
+        """Current feeds without touching the database (defaults until load() has run)"""
+        return self._entries
+
+    def load(self, discover: Callable[[], Iterable[bytes]]):
+        """Reload the table if the cached copy is stale; seeds it by discovery when empty (needs an app context)"""
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return
+        with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return
+            try:
+                rows = self._enabled_rows()
+                if not rows and not db.session.execute(select(FtsoFeed.id).limit(1)).first():
+                    self._sync(discover)
+                    rows = self._enabled_rows()
+
+                self._entries = [
+                    FeedEntry(bytes.fromhex(feed_id[2:]), name,
+                              tuple(symbol for symbol in (token_symbols or '').split(',') if symbol))
+                    for feed_id, name, token_symbols in rows
+                ]
+                self._loaded_at = time.monotonic()
+
+            except Exception as e:
+                logger.error(f"Error loading FTSO feed catalog: {e}")
+                db.session.rollback()
+                # Keep the previous entries and retry after the next interval
+                self._loaded_at = time.monotonic()
+
+    @staticmethod
+    def _enabled_rows():
+        return db.session.execute(
+            select(FtsoFeed.feed_id, FtsoFeed.name, FtsoFeed.token_symbols)
+            .where(FtsoFeed.enabled.is_(True))
+            .order_by(FtsoFeed.id)
+        ).all()
+
+    def sync(self, discover: Callable[[], Iterable[bytes]]) -> int:
+        """Add newly discovered feeds to the table; existing rows and their mappings are left alone"""
+        with self._lock:
+            return self._sync(discover)
+
+    def _sync(self, discover: Callable[[], Iterable[bytes]]) -> int:
+        try:
+            feed_ids = list(discover() or [])
+        except Exception as e:
+            logger.error(f"FTSO feed discovery failed: {e}")
+            feed_ids = []
+        if not feed_ids:
+            logger.warning("No FTSO feeds discovered; using the default feed list")
+            feed_ids = [entry.feed_id for entry in self._defaults()]
+
+        known = set(db.session.execute(select(FtsoFeed.feed_id)).scalars())
+        added, invalid = 0, 0
+        for feed_id in feed_ids:
+            decoded = decode_feed_id(feed_id)
+            if decoded is None:
+                invalid += 1
+                continue
+            hex_id = '0x' + feed_id.hex()
+            if hex_id in known:
+                continue
+            category, name = decoded
+            db.session.add(FtsoFeed(feed_id=hex_id, name=name, category=category,
+                                    token_symbols=','.join(default_token_symbols(name)) or None))
+            known.add(hex_id)
+            added += 1
+        db.session.commit()
+
+        if invalid:
+            logger.warning(f"Ignored {invalid} malformed FTSO feed IDs")
+        logger.info(f"FTSO feed catalog: {added} feeds added, {len(known)} known")
+        self._loaded_at = None
+        return added
+
+    def token_prices(self, feed_prices: Dict[str, float]) -> Dict[str, float]:
+        """Map {feed name: price} to {token symbol: price} through the catalog"""
+        prices = {}
+        for entry in self._entries:
+            price = feed_prices.get(entry.name)
+            if price:
+                for symbol in entry.symbols:
+                    prices[symbol] = price
+        return prices
+
+# Global catalog instance
+feed_catalog = FeedCatalog()
+
+def get_feed_catalog() -> FeedCatalog:
+    """Get the feed catalog instance"""
+    return feed_catalog
@@ -6,6 +6,7 @@ Integrates with official APIs from dev.flare.network
 import os
 import logging
 import requests
+from metrics import external_request
 from typing import Dict, List, Optional, Any
 from datetime import datetime
 
@@ -15,9 +16,9 @@ class FlareAPIClient:
     """Client for direct API access to Flare Network services"""
     
     def __init__(self):
-        self.base_url = "https://dev.flare.network/api"
-        self.ftso_endpoint = "https://api.flare.network/ftso/v1"
-        self.fdc_endpoint = "https://api.flare.network/fdc/v1"
+        self.base_url = os.environ.get('FLARE_DEV_API_URL', "https://dev.flare.network/api")
+        self.ftso_endpoint = os.environ.get('FLARE_FTSO_API_URL', "https://api.flare.network/ftso/v1")
+        self.fdc_endpoint = os.environ.get('FLARE_FDC_API_URL', "https://api.flare.network/fdc/v1")
         
         # API configuration
         self.timeout = 10
@@ -39,7 +40,7 @@ class FlareAPIClient:
             url = f"{self.ftso_endpoint}/feeds"
             params = {'symbols': ','.join(feeds)}
             
-            response = requests.get(url, params=params, headers=self.headers, timeout=self.timeout)
+            response = external_request('flare_api', 'GET', url, params=params, headers=self.headers, timeout=self.timeout)
             
             if response.status_code == 200:
                 data = response.json()
@@ -63,7 +64,7 @@ class FlareAPIClient:
         try:
             url = f"{self.base_url}/network/stats"
             
-            response = requests.get(url, headers=self.headers, timeout=self.timeout)
+            response = external_request('flare_api', 'GET', url, headers=self.headers, timeout=self.timeout)
             
             if response.status_code == 200:
                 return response.json()
@@ -104,7 +105,7 @@ class FlareAPIClient:
         try:
             url = f"{self.base_url}/tokens/{token_address}"
             
-            response = requests.get(url, headers=self.headers, timeout=self.timeout)
+            response = external_request('flare_api', 'GET', url, headers=self.headers, timeout=self.timeout)
             
             if response.status_code == 200:
                 return response.json()
@@ -139,7 +140,7 @@ class FlareAPIClient:
                 'timestamp': int(datetime.now().timestamp())
             }
             
-            response = requests.post(url, json=payload, headers=self.headers, timeout=self.timeout)
+            response = external_request('flare_api', 'POST', url, json=payload, headers=self.headers, timeout=self.timeout)
             
             if response.status_code == 200:
                 return response.json()
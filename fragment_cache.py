@@ -0,0 +1,110 @@
+"""
+Fragment cache for rendered template parts
+Market-wide fragments (token lists, recent trades) are rendered once per
+price-snapshot / trade version instead of on every request. ORM changes to
+tokens and trades bump the versions when their transaction commits, so a
+render between flush and commit cannot cache uncommitted rows under the new
+version.
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable
+from flask import render_template
+from markupsafe import Markup
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import Token, Trade
+from metrics import get_metrics
+from shared_prices import shared_prices_version
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on staleness when another worker changed the data
+FRAGMENT_CACHE_TTL = float(os.environ.get('FRAGMENT_CACHE_TTL', 30))
+
+class FragmentCache:
+    """Rendered HTML fragments keyed by name and the versions they depend on"""
+
+    def __init__(self, ttl: float = FRAGMENT_CACHE_TTL):
+        self.ttl = ttl
+        self.versions = {'prices': 0, 'trades': 0}
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def bump(self, dependency: str):
+        """Invalidate every fragment that depends on 'prices' or 'trades'"""
+        with self._lock:
+            self.versions[dependency] = self.versions.get(dependency, 0) + 1
+
+    def render(self, name: str, template_name: str, loader: Callable[[], Dict[str, Any]],
+               depends: Iterable[str] = ('prices',)) -> Markup:
+        """
+        Render a fragment or return the cached copy
+        loader is only called on a miss, so cached hits skip the DB query too.
+        """
+        key = tuple(self._version(dependency) for dependency in depends)
+        now = time.monotonic()
+
+        entry = self._entries.get(name)
+        if entry and entry[0] == key and entry[1] > now:
+            self.hits += 1
+            get_metrics().cache_events.inc('fragment', 'hit')
+            return entry[2]
+
+        self.misses += 1
+        get_metrics().cache_events.inc('fragment', 'miss')
+        html = Markup(render_template(template_name, **loader()))
+        self._entries[name] = (key, now + self.ttl, html)
+        return html
+
+    def _version(self, dependency: str):
+        # Prices published by another worker move the shared seq instead of the local counter
+        if dependency == 'prices':
+            return self.versions.get('prices', 0), shared_prices_version()
+        return self.versions.get(dependency, 0)
+
+    def clear(self):
+        """Drop all cached fragments"""
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache hit/miss counters and current versions"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self._entries),
+            'versions': dict(self.versions)
+        }
+
+# Global cache instance
+fragment_cache = FragmentCache()
+
+def get_fragment_cache() -> FragmentCache:
+    """Get the fragment cache instance"""
+    return fragment_cache
+
+# Dependency invalidated by flushed changes to each model
+INVALIDATES = {Token: 'prices', Trade: 'trades'}
+
+@event.listens_for(Session, 'after_flush')
+def _collect_invalidations(session, flush_context):
+    # new/dirty still list what this flush wrote; bump once the transaction commits
+    pending = session.info.setdefault('fragment_invalidations', set())
+    for instance in list(session.new) + list(session.dirty):
+        dependency = INVALIDATES.get(type(instance))
+        if dependency:
+            pending.add(dependency)
+
+@event.listens_for(Session, 'after_commit')
+def _apply_invalidations(session):
+    for dependency in session.info.pop('fragment_invalidations', ()):
+        fragment_cache.bump(dependency)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_invalidations(session):
+    session.info.pop('fragment_invalidations', None)
@@ -0,0 +1,28 @@
+"""
+Gunicorn settings (picked up automatically from the working directory)
+The master imports the app once and workers fork from it, sharing the loaded
+code copy-on-write. Nothing that holds a socket or a thread is created before
+the fork: the schema step disposes its connections, and RPC connections and
+the head scheduler are built per worker in post_fork.
+Workers merge their metrics through files in METRICS_DIR, which the master
+empties on start.
+"""
+
+import os
+
+# Read by metrics.py, so it has to be set before the app is imported
+os.environ.setdefault('METRICS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'metrics'))
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+
+def on_starting(server):
+    from metrics import reset_metrics_dir
+    reset_metrics_dir(os.environ['METRICS_DIR'])
+    if os.environ.get('INIT_SCHEMA_ON_START', 'true').lower() == 'true':
+        from app import app, init_schema
+        init_schema(app)
+
+def post_fork(server, worker):
+    from app import app, init_worker
+    init_worker(app)
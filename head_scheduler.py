@@ -0,0 +1,239 @@
+"""
+New-head-driven refresh scheduler
+Follows the chain head and runs refresh jobs only when something can have
+changed: block jobs once per new block, epoch jobs once per FTSO voting
+epoch. Between blocks no RPC calls are made beyond the head poll itself.
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+HEAD_SCHEDULER_ENABLED = os.environ.get('HEAD_SCHEDULER_ENABLED', 'false').lower() == 'true'
+HEAD_SCHEDULER_CHAIN = os.environ.get('HEAD_SCHEDULER_CHAIN', 'flare')
+PRICE_REFRESH_TRIGGER = os.environ.get('PRICE_REFRESH_TRIGGER', 'epoch')
+WATCHED_WALLET_TTL = float(os.environ.get('WATCHED_WALLET_TTL', 900))
+WATCHED_BALANCE_EVERY_BLOCKS = int(os.environ.get('WATCHED_BALANCE_EVERY_BLOCKS', 1))
+INDEXER_EVERY_BLOCKS = int(os.environ.get('INDEXER_EVERY_BLOCKS', 1))
+RECEIPT_EVERY_BLOCKS = int(os.environ.get('RECEIPT_EVERY_BLOCKS', 1))
+# 40 voting epochs of 90s: hourly
+PRICE_HISTORY_PRUNE_EVERY_EPOCHS = int(os.environ.get('PRICE_HISTORY_PRUNE_EVERY_EPOCHS', 40))
+
+# Flare FTSO voting epochs (FlareSystemsManager firstVotingRoundStartTs / votingEpochDurationSeconds)
+FIRST_VOTING_ROUND_START = int(os.environ.get('FTSO_FIRST_VOTING_ROUND_START', 1658430000))
+VOTING_EPOCH_SECONDS = int(os.environ.get('FTSO_VOTING_EPOCH_SECONDS', 90))
+
+def current_voting_epoch(now: Optional[float] = None) -> int:
+    """FTSO voting epoch id for a Unix time"""
+    now = time.time() if now is None else now
+    return int((now - FIRST_VOTING_ROUND_START) // VOTING_EPOCH_SECONDS)
+
+class Job:
+    """A refresh job run on new blocks ('block') or new voting epochs ('epoch')"""
+
+    def __init__(self, name: str, func: Callable[[], Any], trigger: str = 'block', every: int = 1,
+                 elected: bool = False):
+        if trigger not in ('block', 'epoch'):
+            raise ValueError(f"Unknown trigger: {trigger}")
+        self.name = name
+        self.func = func
+        self.trigger = trigger
+        self.every = max(1, every)
+        # Elected jobs run only in the process holding the poller lock
+        self.elected = elected
+        self.last_key: Optional[int] = None
+        self.runs = 0
+        self.errors = 0
+        self.last_duration_ms: Optional[float] = None
+
+    def due(self, key: int) -> bool:
+        return self.last_key is None or key - self.last_key >= self.every
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'trigger': self.trigger,
+            'every': self.every,
+            'elected': self.elected,
+            'last_run_at': self.last_key,
+            'runs': self.runs,
+            'errors': self.errors,
+            'last_duration_ms': self.last_duration_ms
+        }
+
+class HeadScheduler:
+    """Polls the head of one chain and dispatches jobs on new blocks and epochs"""
+
+    def __init__(self, chain: str = HEAD_SCHEDULER_CHAIN):
+        self.chain = chain
+        self.jobs: List[Job] = []
+        self.head: Optional[int] = None
+        self.epoch: Optional[int] = None
+        self.poller = False
+        self.app = None
+        self._watched: Dict[str, float] = {}
+        self._watch_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def add_job(self, name: str, func: Callable[[], Any], trigger: str = 'block', every: int = 1,
+                elected: bool = False) -> Job:
+        job = Job(name, func, trigger, every, elected)
+        self.jobs.append(job)
+        return job
+
+    def watch_wallet(self, wallet_address: str):
+        """Keep a wallet's balances fresh for WATCHED_WALLET_TTL seconds"""
+        if wallet_address:
+            with self._watch_lock:
+                self._watched[wallet_address] = time.monotonic() + WATCHED_WALLET_TTL
+
+    def watched_wallets(self) -> List[str]:
+        """Wallets still within their watch window (expired ones are dropped)"""
+        now = time.monotonic()
+        with self._watch_lock:
+            for wallet in [w for w, expires in self._watched.items() if expires <= now]:
+                del self._watched[wallet]
+            return list(self._watched)
+
+    def start(self, app):
+        if self.running:
+            return
+        self.app = app
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f'head-scheduler-{self.chain}', daemon=True)
+        self._thread.start()
+        logger.info(f"Head scheduler started for {self.chain} with jobs: {[job.name for job in self.jobs]}")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        from blockchain_service import get_blockchain_service
+
+        while not self._stop.is_set():
+            interval = 1.0
+            try:
+                provider = get_blockchain_service().web3_connections[self.chain].provider
+                interval = provider.head_tracker.interval
+                self.tick(provider.head_tracker.head())
+            except Exception as e:
+                logger.error(f"Head scheduler tick failed: {e}")
+            self._stop.wait(interval)
+
+    def tick(self, head: Optional[int], now: Optional[float] = None) -> List[str]:
+        """Run jobs made due by this head / epoch; returns the names of jobs run"""
+        from shared_prices import is_price_poller
+
+        ran = []
+        # Another worker may have died since the last tick; the lock is free then
+        self.poller = is_price_poller()
+        new_block = head is not None and (self.head is None or head > self.head)
+        if new_block:
+            self.head = head
+            for job in self.jobs:
+                if job.trigger == 'block' and job.due(head) and (self.poller or not job.elected):
+                    self._run_job(job, head)
+                    ran.append(job.name)
+
+        epoch = current_voting_epoch(now)
+        if epoch != self.epoch:
+            self.epoch = epoch
+            for job in self.jobs:
+                if job.trigger == 'epoch' and job.due(epoch) and (self.poller or not job.elected):
+                    self._run_job(job, epoch)
+                    ran.append(job.name)
+        return ran
+
+    def _run_job(self, job: Job, key: int):
+        from metrics import get_metrics
+
+        job.last_key = key
+        start = time.perf_counter()
+        try:
+            if self.app is not None:
+                with self.app.app_context():
+                    job.func()
+            else:
+                job.func()
+            job.runs += 1
+            outcome = 'ok'
+        except Exception as e:
+            job.errors += 1
+            outcome = 'error'
+            logger.error(f"Scheduled job {job.name} failed: {e}")
+        duration = time.perf_counter() - start
+        job.last_duration_ms = round(duration * 1000, 3)
+        get_metrics().scheduler_job_duration.observe(job.name, value=duration)
+        get_metrics().scheduler_job_runs.inc(job.name, outcome)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'chain': self.chain,
+            'running': self.running,
+            'poller': self.poller,
+            'head': self.head,
+            'epoch': self.epoch,
+            'watched_wallets': len(self.watched_wallets()),
+            'jobs': {job.name: job.status() for job in self.jobs}
+        }
+
+def refresh_prices_job():
+    """FTSO snapshot -> Token rows (skipped inside update_token_prices if the round is unchanged)"""
+    from blockchain_service import get_blockchain_service
+    get_blockchain_service().refresh_token_prices()
+
+def refresh_watched_balances_job():
+    """Re-read balances of recently active wallets in Multicall3 batches"""
+    from blockchain_service import get_blockchain_service
+    from mock_data import apply_wallet_balances
+    from models import Token
+
+    wallets = head_scheduler.watched_wallets()
+    if not wallets:
+        return
+    symbols = [symbol for (symbol,) in Token.query.with_entities(Token.symbol).all()]
+    apply_wallet_balances(get_blockchain_service().get_wallet_raw_balances(wallets, symbols))
+
+def index_dex_events_job():
+    """Index FlareCrossChainDEX logs up to the confirmed head"""
+    from event_indexer import get_event_indexer
+    get_event_indexer().run_once()
+
+def track_receipts_job():
+    """Settle pending trades from their receipts in one batch request"""
+    from receipt_tracker import get_receipt_tracker
+    get_receipt_tracker().run_once()
+
+def prune_price_history_job():
+    """Downsample and expire old PriceHistory rows"""
+    from price_retention import get_price_history_retention
+    get_price_history_retention().run_once()
+
+# Global scheduler instance
+head_scheduler = HeadScheduler()
+# Shared state is refreshed by one elected worker; watched wallets are tracked per worker
+head_scheduler.add_job('prices', refresh_prices_job, trigger=PRICE_REFRESH_TRIGGER, elected=True)
+head_scheduler.add_job('watched_balances', refresh_watched_balances_job, every=WATCHED_BALANCE_EVERY_BLOCKS)
+head_scheduler.add_job('dex_events', index_dex_events_job, every=INDEXER_EVERY_BLOCKS, elected=True)
+head_scheduler.add_job('receipts', track_receipts_job, every=RECEIPT_EVERY_BLOCKS, elected=True)
+head_scheduler.add_job('price_history_retention', prune_price_history_job, trigger='epoch',
+                       every=PRICE_HISTORY_PRUNE_EVERY_EPOCHS, elected=True)
+
+def get_head_scheduler() -> HeadScheduler:
+    """Get the head scheduler instance"""
+    return head_scheduler
+
+def start_head_scheduler(app):
+    """Start the scheduler thread when HEAD_SCHEDULER_ENABLED=true"""
+    if HEAD_SCHEDULER_ENABLED:
+        head_scheduler.start(app)
@@ -0,0 +1,117 @@
+"""
+Non-blocking logging pipeline
+Loggers hand records to a bounded in-memory queue and a background thread
+formats and writes them, so a request never waits on stderr. When the queue
+is full records are dropped and counted instead of blocking. Repetitive
+hot-path events go through log_throttled, which emits one line per interval
+with a count of what it suppressed.
+"""
+
+import os
+import sys
+import time
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
+from metrics import get_metrics
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# Per-module overrides, e.g. "blockchain_service=DEBUG,web3=WARNING"
+LOG_LEVELS = os.environ.get('LOG_LEVELS', 'web3=WARNING,urllib3=WARNING')
+LOG_FORMAT = os.environ.get('LOG_FORMAT', '%(asctime)s %(levelname)s %(name)s: %(message)s')
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+LOG_THROTTLE_SECONDS = float(os.environ.get('LOG_THROTTLE_SECONDS', 60))
+
+IMMUTABLE_ARG_TYPES = (str, int, float, bool, bytes, type(None))
+
+def parse_log_levels(value: str) -> Dict[str, int]:
+    """Parse "module=LEVEL,..." into logger names and numeric levels"""
+    levels = {}
+    for item in (value or '').split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = logging.getLevelName(level.strip().upper())
+    return levels
+
+class DroppingQueueHandler(QueueHandler):
+    """Queue handler that drops records instead of blocking when the writer falls behind"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting is left to the writer thread unless an argument could change before it runs
+        args = record.args if isinstance(record.args, tuple) else (record.args,)
+        if all(isinstance(arg, IMMUTABLE_ARG_TYPES) for arg in args):
+            return record
+        return super().prepare(record)
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            get_metrics().log_records_dropped.inc(record.levelname)
+
+_handler: Optional[DroppingQueueHandler] = None
+_listener: Optional[QueueListener] = None
+_listener_pid: Optional[int] = None
+_configure_lock = threading.Lock()
+
+def configure_logging():
+    """
+    Route the root logger through the queue and start the writer thread
+    Safe to call repeatedly; in a forked child it replaces the queue and
+    writer, since the parent's thread does not survive the fork.
+    """
+    global _handler, _listener, _listener_pid
+    with _configure_lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            return
+
+        stream = logging.StreamHandler(sys.stderr)
+        stream.setFormatter(logging.Formatter(LOG_FORMAT))
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+
+        root = logging.getLogger()
+        if _handler is None:
+            _handler = DroppingQueueHandler(log_queue)
+            for handler in list(root.handlers):
+                root.removeHandler(handler)
+            root.addHandler(_handler)
+            root.setLevel(LOG_LEVEL)
+            for name, level in parse_log_levels(LOG_LEVELS).items():
+                logging.getLogger(name).setLevel(level)
+            atexit.register(_stop_listener)
+        else:
+            _handler.queue = log_queue
+
+        _listener = QueueListener(log_queue, stream, respect_handler_level=True)
+        _listener.start()
+        _listener_pid = os.getpid()
+
+def _stop_listener():
+    # Flush what is queued on a clean exit (only the process that started the writer)
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+
+# (logger name, key) -> (window start, records suppressed in the window)
+_throttle: Dict[Tuple[str, str], Tuple[float, int]] = {}
+_throttle_lock = threading.Lock()
+
+def log_throttled(logger: logging.Logger, level: int, key: str, msg: str, *args,
+                  interval: float = LOG_THROTTLE_SECONDS):
+    """Log at most once per interval for a key; the next line reports how many were suppressed"""
+    if not logger.isEnabledFor(level):
+        return
+    now = time.monotonic()
+    throttle_key = (logger.name, key)
+    with _throttle_lock:
+        started, suppressed = _throttle.get(throttle_key, (None, 0))
+        if started is not None and now - started < interval:
+            _throttle[throttle_key] = (started, suppressed + 1)
+            return
+        _throttle[throttle_key] = (now, 0)
+    if suppressed:
+        msg = f"{msg} (%d similar suppressed)"
+        args = args + (suppressed,)
+    logger.log(level, msg, *args)
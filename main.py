@@ -1,4 +1,6 @@
-from app import app
+from app import app, init_schema, init_worker
 
 if __name__ == '__main__':
+    init_schema(app)
+    init_worker(app)
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,174 @@
+"""
+Rolling 24h market statistics
+Sliding-window price ticks per token with O(1) change, high, low and VWAP reads
+"""
+
+import time
+import threading
+from collections import deque
+from typing import Dict, Iterable, Optional, Tuple
+
+WINDOW_SECONDS = 24 * 60 * 60
+BUCKET_SECONDS = 60
+
+class RollingWindow:
+    """
+    Sliding time window over price ticks
+    Ticks are folded into fixed-size buckets so memory is bounded by
+    window_seconds / bucket_seconds no matter how often prices arrive.
+    High and low are kept in monotonic deques, sums are kept running.
+    """
+
+    def __init__(self, window_seconds: int = WINDOW_SECONDS, bucket_seconds: int = BUCKET_SECONDS):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+
+        # Buckets: [start, open, close, high, low, price_volume, volume, price_sum, count]
+        self.buckets = deque()
+        self._highs = deque()  # (bucket_start, high), decreasing
+        self._lows = deque()   # (bucket_start, low), increasing
+
+        self._pv_sum = 0.0
+        self._volume_sum = 0.0
+        self._price_sum = 0.0
+        self._count = 0
+
+    def add(self, price: float, volume: float = 0.0, ts: Optional[float] = None):
+        """Add a price tick (volume is optional; ticks are equally weighted without it)"""
+        ts = time.time() if ts is None else ts
+        start = int(ts // self.bucket_seconds) * self.bucket_seconds
+
+        if self.buckets and start < self.buckets[-1][0]:
+            # Out-of-order tick older than the newest bucket; ignore
+            return
+
+        if self.buckets and self.buckets[-1][0] == start:
+            bucket = self.buckets[-1]
+            bucket[2] = price
+            if price > bucket[3]:
+                bucket[3] = price
+                self._push_high(start, price)
+            if price < bucket[4]:
+                bucket[4] = price
+                self._push_low(start, price)
+        else:
+            bucket = [start, price, price, price, price, 0.0, 0.0, 0.0, 0]
+            self.buckets.append(bucket)
+            self._push_high(start, price)
+            self._push_low(start, price)
+
+        bucket[5] += price * volume
+        bucket[6] += volume
+        bucket[7] += price
+        bucket[8] += 1
+
+        self._pv_sum += price * volume
+        self._volume_sum += volume
+        self._price_sum += price
+        self._count += 1
+
+        self._evict(ts)
+
+    def _push_high(self, start: int, price: float):
+        while self._highs and self._highs[-1][1] <= price:
+            self._highs.pop()
+        self._highs.append((start, price))
+
+    def _push_low(self, start: int, price: float):
+        while self._lows and self._lows[-1][1] >= price:
+            self._lows.pop()
+        self._lows.append((start, price))
+
+    def _evict(self, now: float):
+        """Drop buckets that have slid out of the window"""
+        cutoff = now - self.window_seconds
+        while self.buckets and self.buckets[0][0] + self.bucket_seconds <= cutoff:
+            bucket = self.buckets.popleft()
+            self._pv_sum -= bucket[5]
+            self._volume_sum -= bucket[6]
+            self._price_sum -= bucket[7]
+            self._count -= bucket[8]
+            if self._highs and self._highs[0][0] == bucket[0]:
+                self._highs.popleft()
+            if self._lows and self._lows[0][0] == bucket[0]:
+                self._lows.popleft()
+
+    def stats(self, now: Optional[float] = None) -> Optional[Dict[str, float]]:
+        """Get window statistics, or None if the window is empty"""
+        self._evict(time.time() if now is None else now)
+        if not self.buckets:
+            return None
+
+        open_price = self.buckets[0][1]
+        last_price = self.buckets[-1][2]
+
+        if self._volume_sum > 0:
+            vwap = self._pv_sum / self._volume_sum
+        else:
+            vwap = self._price_sum / self._count
+
+        return {
+            'price': last_price,
+            'open_24h': open_price,
+            'change_24h': ((last_price - open_price) / open_price * 100) if open_price > 0 else 0.0,
+            'high_24h': self._highs[0][1],
+            'low_24h': self._lows[0][1],
+            'vwap_24h': vwap,
+            'volume_24h': self._volume_sum,
+            'samples': self._count,
+            'window_start': self.buckets[0][0]
+        }
+
+class MarketStats:
+    """Per-token rolling windows fed by every price tick"""
+
+    def __init__(self, window_seconds: int = WINDOW_SECONDS, bucket_seconds: int = BUCKET_SECONDS):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.windows: Dict[str, RollingWindow] = {}
+        self._lock = threading.Lock()
+
+    def record_tick(self, symbol: str, price: float, volume: float = 0.0, ts: Optional[float] = None):
+        """Feed one price tick for a token"""
+        if price is None or price <= 0:
+            return
+
+        with self._lock:
+            window = self.windows.get(symbol)
+            if window is None:
+                window = RollingWindow(self.window_seconds, self.bucket_seconds)
+                self.windows[symbol] = window
+            window.add(price, volume, ts)
+
+    def record_prices(self, prices: Dict[str, float], ts: Optional[float] = None):
+        """Feed a full price snapshot"""
+        for symbol, price in prices.items():
+            self.record_tick(symbol, price, ts=ts)
+
+    def seed(self, ticks: Iterable[Tuple[str, float, float]]):
+        """Seed windows from persisted (symbol, price, unix timestamp) ticks in time order"""
+        for symbol, price, ts in ticks:
+            self.record_tick(symbol, price, ts=ts)
+
+    def get_stats(self, symbol: str) -> Optional[Dict[str, float]]:
+        """Get rolling 24h statistics for one token"""
+        with self._lock:
+            window = self.windows.get(symbol)
+            return window.stats() if window else None
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Get rolling 24h statistics for every tracked token"""
+        with self._lock:
+            result = {}
+            for symbol, window in self.windows.items():
+                stats = window.stats()
+                if stats:
+                    result[symbol] = stats
+            return result
+
+# Global stats instance
+market_stats = MarketStats()
+
+def get_market_stats() -> MarketStats:
+    """Get the market stats instance"""
+    return market_stats
@@ -0,0 +1,508 @@
+"""
+In-process metrics in the Prometheus text exposition format
+Counters, gauges and histograms for RPC calls, external APIs, DB queries,
+routes and caches. Recording a sample is a dict lookup plus a bisect under
+a lock, so instrumentation stays on in production.
+
+Under gunicorn each worker has its own registry. With METRICS_DIR set, every
+worker writes its values to <pid>.json there every METRICS_FLUSH_SECONDS, and a
+scrape of any worker merges them: counters and histograms are summed over all
+files (a dead worker's totals stay in), gauges are combined over live workers
+only, by the mode each gauge declares.
+"""
+
+import os
+import hmac
+import json
+import time
+import atexit
+import logging
+import threading
+import requests
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from web3 import Web3
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() != 'false'
+# Scrapes must send "Authorization: Bearer <METRICS_TOKEN>"; unset disables /metrics
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', 5))
+
+# Latency buckets in seconds, from local SQLite reads up to provider timeouts
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """Base class for a metric family with a fixed set of label names"""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def state(self) -> Dict[Tuple[str, ...], object]:
+        """Current values per label set"""
+        raise NotImplementedError
+
+    def merge(self, states: List[Dict[Tuple[str, ...], object]]) -> Dict[Tuple[str, ...], object]:
+        """Combine the values of several processes"""
+        raise NotImplementedError
+
+    def render(self, state: Optional[Dict[Tuple[str, ...], object]] = None) -> List[str]:
+        raise NotImplementedError
+
+class Counter(Metric):
+    """Monotonically increasing value per label set"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def state(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, states: List[Dict[Tuple[str, ...], float]]) -> Dict[Tuple[str, ...], float]:
+        merged: Dict[Tuple[str, ...], float] = {}
+        for state in states:
+            for labels, value in state.items():
+                merged[labels] = merged.get(labels, 0.0) + value
+        return merged
+
+    def render(self, state: Optional[Dict[Tuple[str, ...], float]] = None) -> List[str]:
+        items = sorted((self.state() if state is None else state).items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in items]
+
+class Gauge(Metric):
+    """
+    Value that can go up and down
+    A callback, when given, is evaluated at scrape time instead of stored values.
+    mode (max, min or sum) combines the values of several workers.
+    """
+
+    kind = 'gauge'
+    MODES = {'max': max, 'min': min, 'sum': sum}
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None, mode: str = 'max'):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self.callback = callback
+        self.mode = mode
+
+    def set(self, *labels: str, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+    def state(self) -> Dict[Tuple[str, ...], float]:
+        if self.callback:
+            try:
+                return self.callback()
+            except Exception as e:
+                logger.error(f"Metric callback {self.name} failed: {e}")
+                return {}
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, states: List[Dict[Tuple[str, ...], float]]) -> Dict[Tuple[str, ...], float]:
+        grouped: Dict[Tuple[str, ...], List[float]] = {}
+        for state in states:
+            for labels, value in state.items():
+                grouped.setdefault(labels, []).append(value)
+        combine = self.MODES[self.mode]
+        return {labels: combine(values) for labels, values in grouped.items()}
+
+    def render(self, state: Optional[Dict[Tuple[str, ...], float]] = None) -> List[str]:
+        values = self.state() if state is None else state
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+                for labels, value in sorted(values.items())]
+
+class Histogram(Metric):
+    """Cumulative-bucket histogram per label set"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count], sum
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, *labels: str, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, *labels: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(*labels, value=time.perf_counter() - start)
+
+    def state(self) -> Dict[Tuple[str, ...], list]:
+        with self._lock:
+            return {labels: [list(counts), total] for labels, (counts, total) in self._series.items()}
+
+    def merge(self, states: List[Dict[Tuple[str, ...], list]]) -> Dict[Tuple[str, ...], list]:
+        merged: Dict[Tuple[str, ...], list] = {}
+        for state in states:
+            for labels, (counts, total) in state.items():
+                series = merged.get(labels)
+                if series is None:
+                    merged[labels] = [list(counts), total]
+                elif len(counts) == len(series[0]):
+                    series[0] = [a + b for a, b in zip(series[0], counts)]
+                    series[1] += total
+        return merged
+
+    def render(self, state: Optional[Dict[Tuple[str, ...], list]] = None) -> List[str]:
+        items = sorted((self.state() if state is None else state).items())
+
+        lines = []
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """All application metrics and their text exposition"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+        self.rpc_duration = self.register(Histogram(
+            'flare_rpc_request_duration_seconds', 'JSON-RPC request latency', ('chain', 'method')))
+        self.rpc_errors = self.register(Counter(
+            'flare_rpc_errors_total', 'JSON-RPC requests that raised or returned an error', ('chain', 'method')))
+
+        self.rpc_failovers = self.register(Counter(
+            'flare_rpc_failovers_total', 'Requests retried on another endpoint after a failure', ('chain',)))
+        self.rpc_hedges = self.register(Counter(
+            'flare_rpc_hedged_requests_total', 'Reads also sent to a backup endpoint', ('chain', 'reason')))
+        self.rpc_hedge_wins = self.register(Counter(
+            'flare_rpc_hedge_wins_total', 'Which request answered first after hedging', ('chain', 'winner')))
+
+        self.external_duration = self.register(Histogram(
+            'flare_external_api_duration_seconds', 'External REST API latency', ('api',)))
+        self.external_errors = self.register(Counter(
+            'flare_external_api_errors_total', 'External REST API failures and non-2xx responses', ('api',)))
+
+        self.db_duration = self.register(Histogram(
+            'flare_db_query_duration_seconds', 'Database statement latency', ('statement',)))
+
+        self.http_duration = self.register(Histogram(
+            'flare_http_request_duration_seconds', 'Route latency', ('endpoint', 'method')))
+        self.http_responses = self.register(Counter(
+            'flare_http_responses_total', 'Responses by route and status code', ('endpoint', 'status')))
+
+        self.cache_events = self.register(Counter(
+            'flare_cache_events_total', 'Cache lookups by cache and result', ('cache', 'result')))
+
+        self.scheduler_job_duration = self.register(Histogram(
+            'flare_scheduler_job_duration_seconds', 'Head scheduler job run time', ('job',)))
+        self.scheduler_job_runs = self.register(Counter(
+            'flare_scheduler_job_runs_total', 'Head scheduler job runs by outcome', ('job', 'outcome')))
+
+        self.indexer_events = self.register(Counter(
+            'flare_indexer_events_total', 'DEX events indexed into trades', ('chain',)))
+        self.indexer_block = self.register(Gauge(
+            'flare_indexer_checkpoint_block', 'Last block covered by the DEX event indexer', ('chain',), mode='max'))
+        self.indexer_chunk_retries = self.register(Counter(
+            'flare_indexer_chunk_retries_total', 'eth_getLogs ranges split after a failure', ('chain',)))
+        self.receipt_updates = self.register(Counter(
+            'flare_receipt_updates_total', 'Pending trades settled by the receipt tracker', ('status',)))
+
+        self.admission_rejections = self.register(Counter(
+            'flare_admission_rejections_total', 'Requests answered 429 by endpoint class and the limit hit',
+            ('endpoint_class', 'scope')))
+
+        self.wallet_auth = self.register(Counter(
+            'flare_wallet_auth_total', 'Wallet token checks by outcome (cached, recovered, expired, revoked, rejected)', ('outcome',)))
+
+        self.log_records_dropped = self.register(Counter(
+            'flare_log_records_dropped_total', 'Log records dropped because the writer queue was full', ('level',)))
+
+        self.price_refreshes = self.register(Counter(
+            'flare_price_refreshes_total', 'Price refreshes by outcome', ('outcome',)))
+        self.price_source_results = self.register(Counter(
+            'flare_price_source_results_total', 'Price source answers per refresh (ok, cached, empty, failed, late, busy, outlier)',
+            ('source', 'outcome')))
+        self.price_rows_written = self.register(Counter(
+            'flare_price_rows_written_total', 'Token rows written by price refreshes'))
+        self.price_snapshot_timestamp = self.register(Gauge(
+            'flare_price_snapshot_timestamp_seconds', 'Unix time of the current price snapshot', ('source',), mode='max'))
+        # Derived from the merged timestamps at scrape time, see collect()
+        self.price_snapshot_age = self.register(Gauge(
+            'flare_price_snapshot_age_seconds', 'Seconds since the current price snapshot was taken'))
+        self.price_poller = self.register(Gauge(
+            'flare_price_poller', 'Workers holding the price poller lock (1 when healthy)', mode='sum'))
+
+        self.directory = ''
+        self._flusher: Optional[threading.Thread] = None
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def start(self, directory: str = METRICS_DIR, interval: float = METRICS_FLUSH_SECONDS):
+        """Share this process's values through directory (run per worker, after the fork)"""
+        if not directory:
+            return
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # A file under our pid was left by an earlier process; keep its totals under another name
+            path = os.path.join(directory, f"{os.getpid()}.json")
+            if os.path.exists(path):
+                os.replace(path, os.path.join(directory, f"dead-{os.getpid()}-{time.time_ns()}.json"))
+        except OSError as e:
+            logger.error(f"Metrics directory {directory} unavailable, serving this worker's metrics only: {e}")
+            return
+        self.directory = directory
+        self.flush()
+        atexit.register(self.flush)
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(target=self._flush_loop, args=(interval,), name='metrics-flush', daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self, interval: float):
+        while True:
+            time.sleep(interval)
+            self.flush()
+
+    def flush(self):
+        """Write this process's values to <pid>.json"""
+        if not self.directory:
+            return
+        data = {name: [[list(labels), value] for labels, value in metric.state().items()]
+                for name, metric in self._metrics.items() if metric is not self.price_snapshot_age}
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        try:
+            with open(path + '.tmp', 'w') as f:
+                json.dump(data, f)
+            os.replace(path + '.tmp', path)
+        except (OSError, TypeError, ValueError) as e:
+            from logging_config import log_throttled
+            log_throttled(logger, logging.ERROR, 'metrics-flush', f"Error writing metrics to {path}: {e}")
+
+    def _other_processes(self) -> List[Tuple[bool, Dict[str, dict]]]:
+        """(alive, values by metric) for every other process that wrote to the directory"""
+        others = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json') or filename == f"{os.getpid()}.json":
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            alive = not filename.startswith('dead-') and _pid_alive(int(filename[:-len('.json')]))
+            others.append((alive, {name: {tuple(labels): value for labels, value in items}
+                                   for name, items in data.items()}))
+        return others
+
+    def collect(self) -> Dict[str, dict]:
+        """Values per metric, merged over all workers when a directory is shared"""
+        states = {name: metric.state() for name, metric in self._metrics.items()}
+        if self.directory:
+            try:
+                others = self._other_processes()
+            except OSError as e:
+                from logging_config import log_throttled
+                log_throttled(logger, logging.ERROR, 'metrics-collect', f"Error reading metrics from {self.directory}: {e}")
+                others = []
+            for name, metric in self._metrics.items():
+                # Counters and histograms keep a dead worker's totals; gauges only describe live workers
+                states[name] = metric.merge([states[name]] + [
+                    values.get(name, {}) for alive, values in others if alive or not isinstance(metric, Gauge)])
+
+        timestamps = states[self.price_snapshot_timestamp.name].values()
+        states[self.price_snapshot_age.name] = {(): round(time.time() - max(timestamps), 3)} if timestamps else {}
+        return states
+
+    def render(self) -> str:
+        """Prometheus text exposition (format version 0.0.4)"""
+        lines = []
+        for name, state in self.collect().items():
+            metric = self._metrics[name]
+            samples = metric.render(state)
+            if samples:
+                lines.extend(metric.header())
+                lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def reset_metrics_dir(directory: str = METRICS_DIR):
+    """Remove the previous run's worker files (run once in the gunicorn master)"""
+    if not directory or not os.path.isdir(directory):
+        return
+    for filename in os.listdir(directory):
+        if filename.endswith(('.json', '.tmp')):
+            try:
+                os.remove(os.path.join(directory, filename))
+            except OSError:
+                pass
+
+def is_scrape_authorized(headers) -> bool:
+    """True when the request carries METRICS_TOKEN as a bearer token"""
+    scheme, _, token = (headers.get('Authorization') or '').partition(' ')
+    return bool(METRICS_TOKEN) and scheme.lower() == 'bearer' and \
+        hmac.compare_digest(token.strip().encode(), METRICS_TOKEN.encode())
+
+# Global registry instance
+metrics = MetricsRegistry()
+
+def get_metrics() -> MetricsRegistry:
+    """Get the metrics registry instance"""
+    return metrics
+
+@contextmanager
+def track_external(api: str):
+    """Time an external API call; exceptions count as errors and are re-raised"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        metrics.external_errors.inc(api)
+        raise
+    finally:
+        metrics.external_duration.observe(api, value=time.perf_counter() - start)
+
+def external_request(api: str, method: str, url: str, **kwargs) -> requests.Response:
+    """requests.request with latency recorded under api; non-2xx responses count as errors"""
+    with track_external(api):
+        response = requests.request(method, url, **kwargs)
+    if response.status_code >= 300:
+        metrics.external_errors.inc(api)
+    return response
+
+class InstrumentedHTTPProvider(Web3.HTTPProvider):
+    """HTTPProvider that records per-chain, per-method latency and errors"""
+
+    def __init__(self, endpoint_uri: str, chain: str, **kwargs):
+        super().__init__(endpoint_uri, **kwargs)
+        self.chain = chain
+
+    def make_request(self, method, params):
+        start = time.perf_counter()
+        try:
+            response = super().make_request(method, params)
+        except Exception:
+            metrics.rpc_errors.inc(self.chain, method)
+            raise
+        finally:
+            metrics.rpc_duration.observe(self.chain, method, value=time.perf_counter() - start)
+
+        if isinstance(response, dict) and response.get('error'):
+            metrics.rpc_errors.inc(self.chain, method)
+        return response
+
+    def make_batch_request(self, batch_requests):
+        start = time.perf_counter()
+        try:
+            return super().make_batch_request(batch_requests)
+        except Exception:
+            metrics.rpc_errors.inc(self.chain, 'batch')
+            raise
+        finally:
+            metrics.rpc_duration.observe(self.chain, 'batch', value=time.perf_counter() - start)
+
+# SQLAlchemy statement timing, keyed by the leading SQL verb
+_query_metrics_installed = False
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_start', {})[id(context)] = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.get('metrics_query_start', {}).pop(id(context), None)
+    if start is None:
+        return
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement else 'UNKNOWN'
+    metrics.db_duration.observe(verb, value=time.perf_counter() - start)
+
+def _handle_error(exception_context):
+    # after_cursor_execute never runs for a failed statement; drop its start time
+    conn = exception_context.connection
+    if conn is not None:
+        conn.info.get('metrics_query_start', {}).pop(id(exception_context.execution_context), None)
+
+def install_query_metrics():
+    """Register the cursor timing hooks once for all engines"""
+    global _query_metrics_installed
+    if _query_metrics_installed or not METRICS_ENABLED:
+        return
+
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(Engine, 'handle_error', _handle_error)
+    _query_metrics_installed = True
+
+def install_route_metrics(app):
+    """Time every request by endpoint and count responses by status"""
+    if not METRICS_ENABLED:
+        return
+
+    from flask import g, request
+
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_request_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop('metrics_request_start', None)
+        if start is not None:
+            endpoint = request.endpoint or 'unmatched'
+            metrics.http_duration.observe(endpoint, request.method, value=time.perf_counter() - start)
+            metrics.http_responses.inc(endpoint, str(response.status_code))
+        return response
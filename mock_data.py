@@ -7,6 +7,7 @@ Removes all mock/fake data and uses real blockchain sources
 from app import db
 from models import Token, Portfolio, Trade
 from blockchain_service import get_blockchain_service
+from token_registry import get_token_registry
 from datetime import datetime
 import logging
 
@@ -21,15 +22,7 @@ def initialize_real_data():
         return
     
     # Real tokens available on Flare Network and cross-chain
-    real_tokens = [
-        {'symbol': 'FLR', 'name': 'Flare', 'contract_address': '0x0000000000000000000000000000000000000001'},
-        {'symbol': 'WFLR', 'name': 'Wrapped Flare', 'contract_address': '0x1D80c49BbBCd1C0911346656B529DF9E5c2F783d'},
-        {'symbol': 'ETH', 'name': 'Ethereum', 'contract_address': '0x6B7a87899490EcE95443e979cA9485CBE7E71522'},
-        {'symbol': 'USDT', 'name': 'Tether USD', 'contract_address': '0xf56e6317dC9B91F36bCDBEA4ee6c1aFd6C537e30'},
-        {'symbol': 'MATIC', 'name': 'Polygon', 'contract_address': '0x2C78f1b70Ccf63CDEe49F9233e9fAa99D43AA07e'},
-        {'symbol': 'METIS', 'name': 'Metis', 'contract_address': '0x8bE71B7871C8B4B0BA2d3aD0b1C0b7f7a83b4B2f'},
-        {'symbol': 'APE', 'name': 'ApeCoin', 'contract_address': '0x3c78f1b70Ccf63CDEe49F9233e9fAa99D43AA07e'}
-    ]
+    real_tokens = get_token_registry().tokens('flare')
     
     # Get real prices from blockchain service
     blockchain_service = get_blockchain_service()
@@ -37,11 +30,11 @@ def initialize_real_data():
     
     for token_data in real_tokens:
         # Use real price if available, otherwise set to 0 until first update
-        real_price = live_prices.get(token_data['symbol'], 0.0)
+        real_price = live_prices.get(token_data.symbol, 0.0)
         
         token = Token(
-            symbol=token_data['symbol'],
-            name=token_data['name'],
+            symbol=token_data.symbol,
+            name=token_data.name,
             price=real_price,
             market_cap=0,  # Will be updated by real data fetch
             volume_24h=0,  # Will be updated by real data fetch
@@ -59,7 +52,7 @@ def update_real_prices():
     """Update token prices with real market data."""
     try:
         blockchain_service = get_blockchain_service()
-        blockchain_service.update_token_prices()
+        blockchain_service.refresh_token_prices()
         logger.info("Token prices updated with real data")
     except Exception as e:
         logger.error(f"Error updating real prices: {e}")
@@ -97,7 +90,8 @@ def execute_real_trade(trade_type, token_symbol, amount, from_token=None, wallet
                     amount=amount,
                     price=token.price,
                     total_value=amount * token.price,
-                    wallet_address=wallet_address
+                    wallet_address=wallet_address,
+                    status='pending'
                 )
                 db.session.add(trade)
                 db.session.commit()
@@ -106,13 +100,14 @@ def execute_real_trade(trade_type, token_symbol, amount, from_token=None, wallet
                     'success': True,
                     'message': message,
                     'trade': {
+                        'id': trade.id,
                         'type': trade_type,
                         'from_token': from_token.upper(),
                         'to_token': token_symbol.upper(),
                         'amount': amount,
                         'price': token.price,
                         'total_value': amount * token.price,
-                        'tx_hash': 'pending'  # Would be real tx hash from blockchain
+                        'status': 'pending'  # Confirmed once the signed tx hash is posted and mined
                     }
                 }
             else:
@@ -132,7 +127,8 @@ def execute_real_trade(trade_type, token_symbol, amount, from_token=None, wallet
                     amount=amount,
                     price=token.price,
                     total_value=amount * token.price,
-                    wallet_address=wallet_address
+                    wallet_address=wallet_address,
+                    status='pending'
                 )
                 db.session.add(trade)
                 db.session.commit()
@@ -141,6 +137,7 @@ def execute_real_trade(trade_type, token_symbol, amount, from_token=None, wallet
                     'success': True,
                     'message': message,
                     'trade': {
+                        'id': trade.id,
                         'type': trade_type,
                         'token': token_symbol.upper(),
                         'amount': amount,
@@ -175,26 +172,62 @@ def sync_real_portfolio(wallet_address: str):
         if not wallet_address:
             return
 
-        # Clear existing portfolio for this wallet
-        Portfolio.query.filter_by(wallet_address=wallet_address).delete()
-
-        # Get real balances for all tokens
-        tokens = Token.query.all()
-        for token in tokens:
-            real_balance = get_real_portfolio_balance(wallet_address, token.symbol)
-            
-            if real_balance > 0:
-                portfolio_entry = Portfolio(
-                    token_symbol=token.symbol,
-                    balance=real_balance,
-                    avg_buy_price=token.price,
-                    wallet_address=wallet_address
-                )
-                db.session.add(portfolio_entry)
-
-        db.session.commit()
-        logger.info(f"Portfolio synced with real balances for {wallet_address}")
+        # Real balances for all tokens in one multicall; only changed balances are written
+        symbols = [symbol for (symbol,) in Token.query.with_entities(Token.symbol).all()]
+        apply_wallet_balances(get_blockchain_service().get_wallet_raw_balances([wallet_address], symbols))
+        logger.debug("Portfolio synced with real balances for %s", wallet_address)
 
     except Exception as e:
         logger.error(f"Error syncing real portfolio: {e}")
         db.session.rollback()
+
+def apply_wallet_balances(raw_balances: dict):
+    """
+    Write fetched balances ({wallet: {symbol: base units}}) for the symbols whose holding changed.
+    Only wallets and symbols present in raw_balances are touched; failed fetches are left out by the caller.
+    Changed rows keep their avg_buy_price; new holdings start at the current price.
+    """
+    try:
+        if not raw_balances:
+            return
+
+        # Holdings compare as exact integers; rows written before raw_balance existed never match
+        rows = {}
+        for row in Portfolio.query.filter(Portfolio.wallet_address.in_(raw_balances.keys())):
+            rows[(row.wallet_address, row.token_symbol)] = row
+
+        registry = get_token_registry()
+        get_blockchain_service().ensure_token_decimals('flare')
+        prices = None
+        changed = 0
+        for wallet, wallet_balances in raw_balances.items():
+            for symbol, raw in wallet_balances.items():
+                row = rows.get((wallet, symbol))
+                if row is None:
+                    if raw <= 0:
+                        continue
+                    if prices is None:
+                        prices = dict(Token.query.with_entities(Token.symbol, Token.price).all())
+                    db.session.add(Portfolio(
+                        token_symbol=symbol,
+                        balance=registry.from_base_units(registry.get(symbol), raw),
+                        raw_balance=str(raw),
+                        avg_buy_price=prices.get(symbol, 0.0),
+                        wallet_address=wallet
+                    ))
+                elif raw <= 0:
+                    db.session.delete(row)
+                elif row.raw_balance is None or int(row.raw_balance) != raw:
+                    row.balance = registry.from_base_units(registry.get(symbol), raw)
+                    row.raw_balance = str(raw)
+                else:
+                    continue
+                changed += 1
+
+        if changed:
+            db.session.commit()
+            logger.info(f"{changed} balances updated across {len(raw_balances)} watched wallets")
+
+    except Exception as e:
+        logger.error(f"Error applying wallet balances: {e}")
+        db.session.rollback()
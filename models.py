@@ -1,6 +1,6 @@
 from app import db
 from datetime import datetime
-from sqlalchemy import Float, String, DateTime, Integer, Text
+from sqlalchemy import Boolean, Float, String, DateTime, Integer, Text, inspect, text
 
 class Token(db.Model):
     id = db.Column(Integer, primary_key=True)
@@ -20,6 +20,7 @@ class Portfolio(db.Model):
     wallet_address = db.Column(String(42), nullable=True)  # Real wallet address
     created_at = db.Column(DateTime, default=datetime.utcnow)
     updated_at = db.Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    raw_balance = db.Column(String(78), nullable=True)  # Exact on-chain balance in base units (uint256 as text)
 
 class Trade(db.Model):
     id = db.Column(Integer, primary_key=True)
@@ -27,17 +28,116 @@ class Trade(db.Model):
     from_token = db.Column(String(10), nullable=True)
     to_token = db.Column(String(10), nullable=False)
     amount = db.Column(Float, nullable=False)
-    price = db.Column(Float, nullable=False)
-    total_value = db.Column(Float, nullable=False)
+    price = db.Column(Float, nullable=True)  # NULL when no price was known at execution time
+    total_value = db.Column(Float, nullable=True)
     wallet_address = db.Column(String(42), nullable=True)  # Real wallet address
     tx_hash = db.Column(String(66), nullable=True)  # Blockchain transaction hash
-    status = db.Column(String(20), default='completed')
+    status = db.Column(String(20), default='completed')  # 'pending' until its receipt arrives, then 'confirmed' / 'failed' / 'expired'
     created_at = db.Column(DateTime, default=datetime.utcnow)
-    metadata = db.Column(Text, nullable=True)  # JSON metadata for additional info
+    # 'metadata' is reserved on declarative models, so map the column under another attribute name
+    trade_metadata = db.Column('metadata', Text, nullable=True)  # JSON metadata for additional info
+    gas_used = db.Column(Integer, nullable=True)
+    block_number = db.Column(Integer, nullable=True)
+    # Liquidity deposits and withdrawals are kept with trades but are not volume or P&L
+    is_liquidity = db.Column(Boolean, nullable=True, default=False)
+
+    __table_args__ = (
+        db.Index('ix_trade_status', 'status'),
+    )
+
+class PriceHistory(db.Model):
+    id = db.Column(Integer, primary_key=True)
+    symbol = db.Column(String(10), nullable=False)
+    price = db.Column(Float, nullable=False)
+    source = db.Column(String(20), nullable=True)  # 'ftso', 'coingecko', 'consensus', 'backfill'
+    timestamp = db.Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_price_history_symbol_timestamp', 'symbol', 'timestamp'),
+    )
 
 class ChatMessage(db.Model):
     id = db.Column(Integer, primary_key=True)
     message = db.Column(Text, nullable=False)
     response = db.Column(Text, nullable=False)
     trade_executed = db.Column(String(200))
-    created_at = db.Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = db.Column(DateTime, default=datetime.utcnow)
+
+class IndexerCheckpoint(db.Model):
+    id = db.Column(Integer, primary_key=True)
+    name = db.Column(String(50), unique=True, nullable=False)  # e.g. 'dex_events:flare'
+    last_block = db.Column(Integer, nullable=False)
+    updated_at = db.Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class PriceRetentionCheckpoint(db.Model):
+    id = db.Column(Integer, primary_key=True)  # Single row
+    downsampled_day = db.Column(Integer, nullable=True)  # Unix day number: days before it are downsampled
+    seen_id = db.Column(Integer, nullable=True)  # Highest PriceHistory.id when downsampling last started
+    updated_at = db.Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class WalletSession(db.Model):
+    id = db.Column(Integer, primary_key=True)
+    nonce = db.Column(String(32), unique=True, nullable=False)  # SIWE nonce issued by /api/wallet/sign_in
+    address = db.Column(String(42), nullable=False)  # Checksum address
+    issued_at = db.Column(Integer, nullable=False)  # Unix seconds, as in the token
+    expires_at = db.Column(Integer, nullable=False)
+    signed_in_at = db.Column(DateTime, nullable=True)  # Set once, when the signed message is accepted
+    revoked_at = db.Column(DateTime, nullable=True)  # Set by /api/wallet/disconnect
+
+class TokenDecimals(db.Model):
+    id = db.Column(Integer, primary_key=True)
+    chain = db.Column(String(20), nullable=False)
+    address = db.Column(String(42), nullable=False)  # Checksum address
+    decimals = db.Column(Integer, nullable=False)  # As returned by the token's decimals()
+    created_at = db.Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('chain', 'address', name='uq_token_decimals_chain_address'),
+    )
+
+class FtsoFeed(db.Model):
+    id = db.Column(Integer, primary_key=True)
+    feed_id = db.Column(String(44), unique=True, nullable=False)  # bytes21 as 0x-prefixed hex
+    name = db.Column(String(20), nullable=False)  # e.g. 'FLR/USD'
+    category = db.Column(Integer, nullable=False)  # 1 crypto, 2 forex, 3 commodity, 4 stock
+    token_symbols = db.Column(String(100), nullable=True)  # Comma-separated tokens priced by this feed
+    enabled = db.Column(Boolean, nullable=False, default=True)
+    created_at = db.Column(DateTime, default=datetime.utcnow)
+
+def add_missing_columns():
+    """Add nullable columns introduced after a table was first created (create_all skips existing tables)"""
+    inspector = inspect(db.engine)
+    for model in (Portfolio, Trade):
+        table = model.__table__
+        if not inspector.has_table(table.name):
+            continue
+        columns = {column['name']: column for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns and column.nullable:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                with db.engine.begin() as connection:
+                    connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+        relaxed = [column.name for column in table.columns
+                   if column.name in columns and column.nullable and not columns[column.name]['nullable']]
+        if relaxed:
+            drop_not_null(table, relaxed)
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+def drop_not_null(table, column_names):
+    """Make existing columns nullable; SQLite cannot alter a column, so the table is rebuilt"""
+    with db.engine.begin() as connection:
+        if db.engine.dialect.name != 'sqlite':
+            for name in column_names:
+                connection.execute(text(f'ALTER TABLE {table.name} ALTER COLUMN {name} DROP NOT NULL'))
+            return
+
+        old_name = f'{table.name}_old'
+        shared = ', '.join(column.name for column in table.columns
+                           if column.name in {c['name'] for c in inspect(connection).get_columns(table.name)})
+        for index in inspect(connection).get_indexes(table.name):
+            connection.execute(text(f'DROP INDEX {index["name"]}'))
+        connection.execute(text(f'ALTER TABLE {table.name} RENAME TO {old_name}'))
+        table.create(connection)
+        connection.execute(text(f'INSERT INTO {table.name} ({shared}) SELECT {shared} FROM {old_name}'))
+        connection.execute(text(f'DROP TABLE {old_name}'))
@@ -0,0 +1,285 @@
+"""
+Vectorized portfolio valuation engine
+Loads holdings into columnar NumPy arrays and values them against one price snapshot
+"""
+
+import logging
+import numpy as np
+from typing import Dict, List, Any, Iterable, Optional, Sequence
+from sqlalchemy import select
+from web3 import Web3
+from models import Token, Portfolio
+from app import db
+from shared_prices import read_shared_prices
+
+logger = logging.getLogger(__name__)
+
+class PriceSnapshot:
+    """Token prices as a sorted symbol index plus aligned price/name columns"""
+
+    def __init__(self, symbols: Sequence[str], prices: Sequence[float], names: Optional[Sequence[str]] = None):
+        order = np.argsort(np.asarray(symbols, dtype=str), kind='stable')
+        self.symbols = np.asarray(symbols, dtype=str)[order]
+        self.prices = np.asarray(prices, dtype=np.float64)[order]
+        self.names = [names[i] for i in order] if names is not None else list(self.symbols)
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def lookup(self, symbols: np.ndarray) -> np.ndarray:
+        """Map an array of symbols to snapshot indexes (-1 where the symbol is unknown)"""
+        if len(self.symbols) == 0:
+            return np.full(len(symbols), -1, dtype=np.int64)
+
+        index = np.searchsorted(self.symbols, symbols)
+        index = np.minimum(index, len(self.symbols) - 1)
+        return np.where(self.symbols[index] == symbols, index, -1)
+
+class Holdings:
+    """Columnar holdings: one row per (wallet, token) position"""
+
+    def __init__(self, wallets: Sequence[str], symbols: Sequence[str], balances: Sequence[float], avg_buy_prices: Sequence[float]):
+        # Factorize wallets once so grouping is an integer bincount
+        positions: Dict[str, int] = {}
+        self.wallet_index = np.fromiter(
+            (positions.setdefault(wallet, len(positions)) for wallet in wallets),
+            dtype=np.int64, count=len(wallets)
+        )
+        self.wallet_ids = list(positions)
+        self.symbols = np.asarray(symbols, dtype=str)
+        self.balances = np.asarray(balances, dtype=np.float64)
+        self.avg_buy_prices = np.asarray(avg_buy_prices, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+def value_holdings(holdings: Holdings, snapshot: PriceSnapshot) -> Dict[str, np.ndarray]:
+    """
+    Compute per-holding metrics in vectorized passes
+    Holdings with zero balance or no price in the snapshot are masked out.
+    """
+    token_index = snapshot.lookup(holdings.symbols)
+    mask = (token_index >= 0) & (holdings.balances > 0)
+
+    token_index = token_index[mask]
+    balances = holdings.balances[mask]
+    avg_buy_prices = holdings.avg_buy_prices[mask]
+    prices = snapshot.prices[token_index]
+
+    current_value = balances * prices
+    cost_basis = balances * avg_buy_prices
+    pnl = current_value - cost_basis
+    pnl_percent = np.divide(pnl * 100, cost_basis, out=np.zeros_like(pnl), where=cost_basis > 0)
+
+    return {
+        'mask': mask,
+        'token_index': token_index,
+        'balance': balances,
+        'avg_buy_price': avg_buy_prices,
+        'price': prices,
+        'current_value': current_value,
+        'cost_basis': cost_basis,
+        'pnl': pnl,
+        'pnl_percent': pnl_percent
+    }
+
+def summarize(total_value: float, total_cost: float) -> Dict[str, float]:
+    """Portfolio totals from value and cost"""
+    total_pnl = total_value - total_cost
+    return {
+        'total_value': total_value,
+        'total_cost': total_cost,
+        'total_pnl': total_pnl,
+        'total_pnl_percent': (total_pnl / total_cost * 100) if total_cost > 0 else 0
+    }
+
+def value_wallet_batch(holdings: Holdings, snapshot: PriceSnapshot) -> Dict[str, Dict[str, float]]:
+    """Per-wallet totals for many wallets at once, grouped with bincount"""
+    metrics = value_holdings(holdings, snapshot)
+    wallet_index = holdings.wallet_index[metrics['mask']]
+    n_wallets = len(holdings.wallet_ids)
+
+    totals_value = np.bincount(wallet_index, weights=metrics['current_value'], minlength=n_wallets)
+    totals_cost = np.bincount(wallet_index, weights=metrics['cost_basis'], minlength=n_wallets)
+    positions = np.bincount(wallet_index, minlength=n_wallets)
+
+    result = {}
+    for wallet, value, cost, count in zip(holdings.wallet_ids, totals_value.tolist(), totals_cost.tolist(), positions.tolist()):
+        if count == 0:
+            continue
+        result[wallet] = summarize(value, cost)
+        result[wallet]['positions'] = count
+    return result
+
+class PortfolioValuationEngine:
+    """Values wallet portfolios from the database in vectorized passes"""
+
+    def load_price_snapshot(self) -> PriceSnapshot:
+        """Current token prices from the shared snapshot, or in one query before the first publish"""
+        shared = read_shared_prices()
+        if shared is not None:
+            return PriceSnapshot(shared.symbols, shared.prices, list(shared.names))
+
+        rows = db.session.execute(select(Token.symbol, Token.price, Token.name)).all()
+        if not rows:
+            return PriceSnapshot([], [], [])
+        symbols, prices, names = zip(*rows)
+        return PriceSnapshot(symbols, prices, names)
+
+    def load_holdings(self, wallet_addresses: Iterable[str]) -> Holdings:
+        """Load positive holdings for the given wallets in one query"""
+        rows = db.session.execute(
+            select(Portfolio.wallet_address, Portfolio.token_symbol, Portfolio.balance, Portfolio.avg_buy_price)
+            .where(Portfolio.balance > 0, Portfolio.wallet_address.in_(list(wallet_addresses)))
+            .order_by(Portfolio.id)
+        ).all()
+        if not rows:
+            return Holdings([], [], [], [])
+        return Holdings(*zip(*rows))
+
+    def value_wallet(self, wallet_address: Optional[str], snapshot: Optional[PriceSnapshot] = None) -> Dict[str, Any]:
+        """Per-holding rows and totals for one wallet"""
+        if not wallet_address:
+            result = summarize(0.0, 0.0)
+            result['holdings'] = []
+            result['holding_count'] = 0
+            return result
+
+        snapshot = snapshot or self.load_price_snapshot()
+        holdings = self.load_holdings([wallet_address])
+        metrics = value_holdings(holdings, snapshot)
+
+        total_value = float(metrics['current_value'].sum())
+        total_cost = float(metrics['cost_basis'].sum())
+
+        result = summarize(total_value, total_cost)
+        result['holdings'] = self._to_rows(metrics, snapshot)
+        # Every positive holding, including tokens without a price that the rows leave out
+        result['holding_count'] = len(holdings)
+        return result
+
+    def value_wallets(self, wallet_addresses: List[str], snapshot: Optional[PriceSnapshot] = None) -> Dict[str, Dict[str, float]]:
+        """Per-wallet totals for a batch of wallets"""
+        snapshot = snapshot or self.load_price_snapshot()
+        holdings = self.load_holdings(wallet_addresses)
+        return value_wallet_batch(holdings, snapshot)
+
+    def value_balances(self, balances: Dict[str, Dict[str, float]], snapshot: Optional[PriceSnapshot] = None) -> Dict[str, Any]:
+        """
+        Value on-chain balances for many wallets against one price snapshot
+        Cost basis comes from stored avg_buy_price where known, else the current price.
+        Returns per-wallet breakdowns and combined per-token exposure.
+        """
+        snapshot = snapshot or self.load_price_snapshot()
+
+        # Portfolio rows may spell an address differently from the request; match case-insensitively
+        spellings = set()
+        for wallet in balances:
+            spellings.update((wallet, wallet.lower()))
+            if Web3.is_address(wallet):
+                spellings.add(Web3.to_checksum_address(wallet))
+        stored = self.load_holdings(spellings)
+        stored_avg = {
+            (stored.wallet_ids[w].lower(), symbol): avg
+            for w, symbol, avg in zip(stored.wallet_index.tolist(), stored.symbols.tolist(), stored.avg_buy_prices.tolist())
+        }
+
+        wallets, symbols, amounts = [], [], []
+        for wallet, tokens in balances.items():
+            for symbol, amount in tokens.items():
+                wallets.append(wallet)
+                symbols.append(symbol)
+                amounts.append(amount)
+
+        holdings = Holdings(wallets, symbols, amounts, np.zeros(len(amounts)))
+        token_index = snapshot.lookup(holdings.symbols)
+        known = token_index >= 0
+        current_prices = np.where(known, snapshot.prices[np.maximum(token_index, 0)], 0.0)
+        holdings.avg_buy_prices = np.fromiter(
+            (stored_avg.get((wallet.lower(), symbol), price)
+             for wallet, symbol, price in zip(wallets, symbols, current_prices.tolist())),
+            dtype=np.float64, count=len(wallets)
+        )
+
+        metrics = value_holdings(holdings, snapshot)
+        wallet_index = holdings.wallet_index[metrics['mask']]
+        n_tokens = len(snapshot)
+
+        # Combined exposure per token
+        exposure_balance = np.bincount(metrics['token_index'], weights=metrics['balance'], minlength=n_tokens)
+        exposure_value = np.bincount(metrics['token_index'], weights=metrics['current_value'], minlength=n_tokens)
+        total_value = float(metrics['current_value'].sum())
+        total_cost = float(metrics['cost_basis'].sum())
+
+        combined = summarize(total_value, total_cost)
+        combined['wallets'] = len(balances)
+        combined['exposure'] = {
+            str(snapshot.symbols[i]): {
+                'balance': float(exposure_balance[i]),
+                'value': float(exposure_value[i]),
+                'weight': float(exposure_value[i] / total_value * 100) if total_value > 0 else 0
+            }
+            for i in np.flatnonzero(exposure_balance > 0).tolist()
+        }
+
+        # Per-wallet breakdown
+        per_wallet = {wallet: {'positions': {}} for wallet in balances}
+        wallet_value = np.bincount(wallet_index, weights=metrics['current_value'], minlength=len(holdings.wallet_ids))
+        wallet_cost = np.bincount(wallet_index, weights=metrics['cost_basis'], minlength=len(holdings.wallet_ids))
+        for w, wallet in enumerate(holdings.wallet_ids):
+            per_wallet[wallet].update(summarize(float(wallet_value[w]), float(wallet_cost[w])))
+
+        for w, index, balance, value in zip(wallet_index.tolist(), metrics['token_index'].tolist(),
+                                            metrics['balance'].tolist(), metrics['current_value'].tolist()):
+            per_wallet[holdings.wallet_ids[w]]['positions'][str(snapshot.symbols[index])] = {
+                'balance': balance,
+                'value': value
+            }
+
+        for entry in per_wallet.values():
+            if 'total_value' not in entry:
+                entry.update(summarize(0.0, 0.0))
+
+        return {
+            'wallets': per_wallet,
+            'combined': combined
+        }
+
+    def _to_rows(self, metrics: Dict[str, np.ndarray], snapshot: PriceSnapshot) -> List[Dict[str, Any]]:
+        """Convert metric columns into the JSON-serializable rows the templates use"""
+        columns = zip(
+            metrics['token_index'].tolist(),
+            metrics['balance'].tolist(),
+            metrics['avg_buy_price'].tolist(),
+            metrics['price'].tolist(),
+            metrics['current_value'].tolist(),
+            metrics['cost_basis'].tolist(),
+            metrics['pnl'].tolist(),
+            metrics['pnl_percent'].tolist()
+        )
+
+        rows = []
+        for index, balance, avg_buy_price, price, current_value, cost_basis, pnl, pnl_percent in columns:
+            rows.append({
+                'token': {
+                    'symbol': str(snapshot.symbols[index]),
+                    'name': snapshot.names[index],
+                    'price': price
+                },
+                'holding': {
+                    'balance': balance,
+                    'avg_buy_price': avg_buy_price
+                },
+                'current_value': current_value,
+                'cost_basis': cost_basis,
+                'pnl': pnl,
+                'pnl_percent': pnl_percent
+            })
+        return rows
+
+# Global engine instance
+valuation_engine = PortfolioValuationEngine()
+
+def get_valuation_engine() -> PortfolioValuationEngine:
+    """Get the portfolio valuation engine instance"""
+    return valuation_engine
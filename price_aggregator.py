@@ -0,0 +1,199 @@
+"""
+Concurrent multi-source price aggregation
+Every price source (FTSO, CoinGecko, any PRICE_EXTRA_SOURCES) is queried at
+once and the refresh waits for them up to one shared deadline, so a slow or
+dead source costs at most PRICE_DEADLINE_SECONDS instead of its full
+timeout. Sources that miss the deadline are left to finish in the
+background and are skipped while still running. External APIs are asked
+at most once per PRICE_EXTERNAL_MIN_INTERVAL; in between their last answer
+is reused.
+
+Per token, values more than PRICE_MAX_DEVIATION away from the median of all
+sources are rejected, then the survivors are combined by median (or the
+highest-priority source, PRICE_COMBINE=priority). With only two sources
+that disagree there is no majority, and the higher-priority one is used.
+"""
+
+import os
+import time
+import logging
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+from metrics import get_metrics, external_request
+from logging_config import log_throttled
+
+logger = logging.getLogger(__name__)
+
+PRICE_DEADLINE_SECONDS = float(os.environ.get('PRICE_DEADLINE_SECONDS', 3))
+PRICE_COMBINE = os.environ.get('PRICE_COMBINE', 'median').lower()
+PRICE_MAX_DEVIATION = float(os.environ.get('PRICE_MAX_DEVIATION', 0.05))
+# Additional JSON sources answering {"SYMBOL": price, ...}: "name=url,..." (lowest priority, in order)
+PRICE_EXTRA_SOURCES = os.environ.get('PRICE_EXTRA_SOURCES', '')
+# Seconds between calls to rate-limited external APIs (CoinGecko, extra sources)
+PRICE_EXTERNAL_MIN_INTERVAL = float(os.environ.get('PRICE_EXTERNAL_MIN_INTERVAL', 60))
+
+class PriceSource(NamedTuple):
+    """A named fetcher returning {symbol: usd_price}; lower priority wins ties"""
+    name: str
+    fetch: Callable[[], Dict[str, float]]
+    priority: int
+    # Reuse the last answer for this many seconds instead of fetching
+    min_interval: float = 0.0
+
+class AggregatedPrices(NamedTuple):
+    """Combined prices and what each source contributed"""
+    prices: Dict[str, float]
+    # source -> 'ok', 'cached', 'empty', 'failed', 'late' or 'busy'
+    sources: Dict[str, str]
+    # symbol -> sources whose value was used
+    used: Dict[str, List[str]]
+    # symbol -> sources whose value was rejected as an outlier
+    rejected: Dict[str, List[str]]
+    elapsed: float
+
+    @property
+    def source_label(self) -> str:
+        """Single source name when one source supplied everything, else 'consensus'"""
+        names = {name for names in self.used.values() for name in names}
+        return names.pop() if len(names) == 1 else ('consensus' if names else 'none')
+
+    def contributed(self, source: str) -> bool:
+        """Whether any combined price used this source's value"""
+        return any(source in names for names in self.used.values())
+
+    @property
+    def fetched(self) -> bool:
+        """Whether any source answered with new data rather than a cached answer"""
+        return 'ok' in self.sources.values()
+
+def parse_sources(value: str) -> Dict[str, str]:
+    """Parse "name=url,..." into {name: url}"""
+    sources = {}
+    for item in (value or '').split(','):
+        name, _, url = item.partition('=')
+        if name.strip() and url.strip():
+            sources[name.strip()] = url.strip()
+    return sources
+
+def http_price_source(name: str, url: str, priority: int,
+                      min_interval: float = PRICE_EXTERNAL_MIN_INTERVAL) -> PriceSource:
+    """Source for an endpoint answering a flat {"SYMBOL": price} JSON object"""
+    def fetch() -> Dict[str, float]:
+        response = external_request(name, 'GET', url, timeout=PRICE_DEADLINE_SECONDS)
+        if response.status_code != 200:
+            return {}
+        return {str(symbol).upper(): float(price) for symbol, price in response.json().items()
+                if isinstance(price, (int, float))}
+    return PriceSource(name, fetch, priority, min_interval)
+
+def combine(values: Dict[str, float], priorities: Dict[str, int], mode: str = PRICE_COMBINE,
+            max_deviation: float = PRICE_MAX_DEVIATION):
+    """Combine one token's {source: price}; returns (price, used sources, rejected sources)"""
+    by_priority = sorted(values, key=lambda name: priorities[name])
+    if len(values) == 1:
+        return values[by_priority[0]], by_priority, []
+
+    median = statistics.median(values.values())
+    within = [name for name in by_priority if abs(values[name] - median) <= max_deviation * median]
+    if len(values) == 2 and len(within) < 2:
+        # Two sources that disagree: no majority, trust the higher-priority one
+        return values[by_priority[0]], by_priority[:1], by_priority[1:]
+    if not within:
+        within = by_priority
+    rejected = [name for name in by_priority if name not in within]
+
+    if mode == 'priority':
+        return values[within[0]], within[:1], rejected
+    return statistics.median(values[name] for name in within), within, rejected
+
+class PriceAggregator:
+    """Fans out to all sources under one deadline and combines the answers"""
+
+    def __init__(self, sources: List[PriceSource], deadline: float = PRICE_DEADLINE_SECONDS,
+                 mode: str = PRICE_COMBINE, max_deviation: float = PRICE_MAX_DEVIATION):
+        self.sources = sources
+        self.deadline = deadline
+        self.mode = mode
+        self.max_deviation = max_deviation
+        self.last: Optional[AggregatedPrices] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_pid: Optional[int] = None
+        self._running: Dict[str, object] = {}
+        # source -> (monotonic fetch time, prices) of the last non-empty answer
+        self._cached: Dict[str, Tuple[float, Dict[str, float]]] = {}
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ThreadPoolExecutor:
+        # A pool created before fork has no threads in the child
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=2 * len(self.sources) or 1,
+                                                thread_name_prefix='price-source')
+            self._executor_pid = os.getpid()
+            self._running = {}
+        return self._executor
+
+    def collect(self) -> AggregatedPrices:
+        """Query every source concurrently and combine what arrives before the deadline"""
+        metrics = get_metrics()
+        started = time.monotonic()
+        outcomes: Dict[str, str] = {}
+        results: Dict[str, Dict[str, float]] = {}
+        futures = {}
+        with self._lock:
+            pool = self._pool()
+            for source in self.sources:
+                cached = self._cached.get(source.name)
+                if cached is not None and started - cached[0] < source.min_interval:
+                    outcomes[source.name] = 'cached'
+                    results[source.name] = cached[1]
+                    continue
+                running = self._running.get(source.name)
+                if running is not None and not running.done():
+                    # Still working on a call that missed an earlier deadline
+                    outcomes[source.name] = 'busy'
+                    continue
+                future = pool.submit(source.fetch)
+                self._running[source.name] = future
+                futures[future] = source
+
+        done, _ = wait(futures, timeout=self.deadline) if futures else (set(), set())
+        for future, source in futures.items():
+            if future not in done:
+                outcomes[source.name] = 'late'
+                continue
+            try:
+                prices = future.result()
+            except Exception as e:
+                log_throttled(logger, logging.ERROR, f'source_error:{source.name}',
+                              "Price source %s failed: %s", source.name, str(e))
+                outcomes[source.name] = 'failed'
+                continue
+            prices = {symbol: price for symbol, price in (prices or {}).items() if price and price > 0}
+            outcomes[source.name] = 'ok' if prices else 'empty'
+            if prices:
+                results[source.name] = prices
+                self._cached[source.name] = (started, prices)
+
+        priorities = {source.name: source.priority for source in self.sources}
+        combined, used, rejected = {}, {}, {}
+        for symbol in {symbol for prices in results.values() for symbol in prices}:
+            values = {name: prices[symbol] for name, prices in results.items() if symbol in prices}
+            combined[symbol], used[symbol], outliers = combine(values, priorities, self.mode, self.max_deviation)
+            if outliers:
+                rejected[symbol] = outliers
+                log_throttled(logger, logging.WARNING, f'outlier:{symbol}',
+                              "Rejected %s price from %s: %s", symbol, ','.join(outliers),
+                              ', '.join(f'{name}={values[name]:.6g}' for name in values))
+
+        for name, outcome in outcomes.items():
+            metrics.price_source_results.inc(name, outcome)
+        for outliers in rejected.values():
+            for name in outliers:
+                metrics.price_source_results.inc(name, 'outlier')
+
+        result = AggregatedPrices(combined, outcomes, used, rejected, time.monotonic() - started)
+        self.last = result
+        logger.debug("Aggregated %d prices in %.3fs: %s", len(combined), result.elapsed, outcomes)
+        return result
@@ -0,0 +1,247 @@
+"""
+Historical FTSO price backfill
+Reads getFeedsById at past blocks, one block per voting epoch, over a window
+ending at the current head, and bulk-inserts the values into PriceHistory
+with source 'backfill'. The eth_calls go out as JSON-RPC batch requests of
+PRICE_BACKFILL_BATCH_SIZE, PRICE_BACKFILL_WORKERS at a time. Each window of
+completed batches is inserted in the same transaction as the checkpoint, so
+an interrupted run resumes where it stopped. Failed calls are retried once;
+if they still fail the run stops before the first gap instead of moving the
+checkpoint past it. Historical state needs an archive RPC endpoint.
+
+Usage:
+    python price_backfill.py [--days 30] [--workers 8] [--restart]
+"""
+
+import os
+import math
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from eth_abi import decode, encode
+from eth_utils import keccak
+from web3 import Web3
+from sqlalchemy import insert, select, update
+from app import db
+from models import PriceHistory, IndexerCheckpoint
+from blockchain_service import get_blockchain_service
+from head_scheduler import FIRST_VOTING_ROUND_START, VOTING_EPOCH_SECONDS, current_voting_epoch
+
+logger = logging.getLogger(__name__)
+
+PRICE_BACKFILL_DAYS = float(os.environ.get('PRICE_BACKFILL_DAYS', 30))
+PRICE_BACKFILL_BATCH_SIZE = int(os.environ.get('PRICE_BACKFILL_BATCH_SIZE', 100))
+PRICE_BACKFILL_WORKERS = int(os.environ.get('PRICE_BACKFILL_WORKERS', 8))
+
+GET_FEEDS_BY_ID_SELECTOR = keccak(text='getFeedsById(bytes21[])')[:4]
+# Blocks sampled to estimate the average block time
+BLOCK_TIME_SAMPLE = 10000
+
+class PriceBackfill:
+    """Walks forward from the start of the window to the head, one block per voting epoch"""
+
+    def __init__(self, chain: str = 'flare'):
+        self.chain = chain
+        self.checkpoint_name = f"ftso_backfill:{chain}"
+        self.service = get_blockchain_service()
+        self.stats = {'calls': 0, 'failed_calls': 0, 'rows': 0, 'duplicate_epochs': 0}
+
+    @property
+    def w3(self):
+        return self.service.web3_connections[self.chain]
+
+    def load_checkpoint(self) -> Optional[int]:
+        return db.session.execute(
+            select(IndexerCheckpoint.last_block).where(IndexerCheckpoint.name == self.checkpoint_name)
+        ).scalar()
+
+    def _block_timestamp(self, number: int) -> int:
+        return self.w3.eth.get_block(number)['timestamp']
+
+    def plan(self, days: float, head: int) -> Tuple[int, int]:
+        """(first block, blocks per voting epoch) for a window of days ending at head"""
+        sample = min(BLOCK_TIME_SAMPLE, head)
+        block_time = (self._block_timestamp(head) - self._block_timestamp(head - sample)) / sample if sample else 1.0
+        step = max(1, round(VOTING_EPOCH_SECONDS / block_time))
+        first = max(1, head - math.ceil(days * 86400 / block_time))
+        logger.info(f"Backfill plan: {block_time:.2f}s blocks, every {step} blocks from {first} to {head}")
+        return first, step
+
+    def _call_data(self, feed_ids: List[bytes]) -> str:
+        return '0x' + (GET_FEEDS_BY_ID_SELECTOR + encode(['bytes21[]'], [feed_ids])).hex()
+
+    def _read_batch(self, ftso_address: str, calls: List[Tuple[int, int, str]]) -> List[Tuple[int, int, Optional[tuple]]]:
+        """One JSON-RPC batch of (block, feed chunk index, call data); returns decoded results per call"""
+        try:
+            responses = self.w3.provider.make_batch_request([
+                ('eth_call', [{'to': ftso_address, 'data': data}, hex(block)]) for block, _, data in calls
+            ])
+        except Exception as e:
+            logger.warning(f"Backfill batch of {len(calls)} calls failed: {e}")
+            responses = None
+        if not isinstance(responses, list):
+            return [(block, chunk, None) for block, chunk, _ in calls]
+
+        results = []
+        for (block, chunk, _), response in zip(calls, responses):
+            raw = response.get('result') if isinstance(response, dict) else None
+            try:
+                decoded = decode(['uint256[]', 'int8[]', 'uint64'], bytes.fromhex(raw[2:])) if raw else None
+            except Exception:
+                decoded = None
+            results.append((block, chunk, decoded))
+        return results
+
+    def _read_calls(self, executor: ThreadPoolExecutor, ftso_address: str,
+                    calls: List[Tuple[int, int, str]], batch_size: int) -> List[Tuple[int, int, Optional[tuple]]]:
+        """Read calls as batch requests of batch_size on the executor; results keep the call order"""
+        batches = [calls[j:j + batch_size] for j in range(0, len(calls), batch_size)]
+        return [result for batch in executor.map(lambda b: self._read_batch(ftso_address, b), batches)
+                for result in batch]
+
+    def run(self, days: float = PRICE_BACKFILL_DAYS, workers: int = PRICE_BACKFILL_WORKERS,
+            batch_size: int = PRICE_BACKFILL_BATCH_SIZE, restart: bool = False) -> Dict[str, int]:
+        """Backfill the window (or resume from the checkpoint); returns call and row counts"""
+        started = time.monotonic()
+        catalog = self.service.feed_catalog
+        catalog.load(self.service.discover_ftso_feed_ids)
+        entries = [entry for entry in catalog.entries() if entry.symbols]
+        if not entries:
+            logger.warning("No FTSO feeds map to tokens; nothing to backfill")
+            return self.stats
+
+        feed_batch = self.service.ftso_feed_batch_size
+        feed_chunks = [entries[i:i + feed_batch] for i in range(0, len(entries), feed_batch)]
+        chunk_data = [self._call_data([entry.feed_id for entry in chunk]) for chunk in feed_chunks]
+        ftso_address = self.w3.eth.contract(
+            address=Web3.to_checksum_address(self.service.contract_registry), abi=self.service.REGISTRY_ABI
+        ).functions.getFtsoV2().call()
+
+        head = self.w3.eth.block_number
+        first, step = self.plan(days, head)
+        checkpoint = None if restart else self.load_checkpoint()
+        if checkpoint is not None and checkpoint >= first:
+            first = checkpoint + step
+        blocks = list(range(first, head + 1, step))
+        logger.info(f"Backfilling {len(blocks)} epochs with {workers} workers")
+
+        # One window = one round of batches across all workers, committed with its checkpoint
+        calls_per_window = workers * batch_size
+        blocks_per_window = max(1, calls_per_window // len(feed_chunks))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for i in range(0, len(blocks), blocks_per_window):
+                window = blocks[i:i + blocks_per_window]
+                calls = [(block, index, data) for block in window for index, data in enumerate(chunk_data)]
+                results = self._read_calls(executor, ftso_address, calls, batch_size)
+                failed = [call for call, (_, _, decoded) in zip(calls, results) if decoded is None]
+                if failed:
+                    # One retry for calls lost to transient errors
+                    retried = {(block, chunk): decoded for block, chunk, decoded
+                               in self._read_calls(executor, ftso_address, failed, batch_size)}
+                    results = [(block, chunk, decoded if decoded is not None else retried.get((block, chunk)))
+                               for block, chunk, decoded in results]
+
+                failed_blocks = [block for block, _, decoded in results if decoded is None]
+                if failed_blocks:
+                    self.stats['failed_calls'] += len(failed_blocks)
+                    if i == 0 and len(failed_blocks) == len(results):
+                        raise RuntimeError(f"Every getFeedsById call from block {window[0]} failed; "
+                                           f"the RPC endpoint probably has no archive state")
+                    # Keep the epochs before the first gap; the next run resumes at the gap
+                    first_failed = min(failed_blocks)
+                    complete = [block for block in window if block < first_failed]
+                    if complete:
+                        self._store([result for result in results if result[0] < first_failed], feed_chunks, complete[-1])
+                    logger.error(f"Backfill stopped at block {first_failed} after {len(failed_blocks)} failed calls; "
+                                 f"rerun to resume from there")
+                    self.stats['stopped_at'] = first_failed
+                    break
+
+                self._store(results, feed_chunks, window[-1])
+                logger.info(f"Backfilled through block {window[-1]} ({i + len(window)}/{len(blocks)} epochs)")
+
+        self.stats['seconds'] = round(time.monotonic() - started, 1)
+        return self.stats
+
+    def _store(self, results: List[Tuple[int, int, Optional[tuple]]], feed_chunks: List[list], checkpoint_block: int):
+        """
+        Insert one window's prices, skipping epochs already in PriceHistory, and move the checkpoint
+        Live rows may carry the poll time rather than the round's timestamp, so a
+        symbol counts as recorded for a round if any row falls inside that round.
+        """
+        prices: Dict[int, Dict[str, float]] = {}
+        for block, chunk, decoded in results:
+            self.stats['calls'] += 1
+            if decoded is None:
+                continue
+            values, decimals, timestamp = decoded
+            epoch_prices = prices.setdefault(timestamp, {})
+            for entry, value, decimal in zip(feed_chunks[chunk], values, decimals):
+                if value:
+                    for symbol in entry.symbols:
+                        epoch_prices[symbol] = value / (10 ** decimal)
+
+        rows = []
+        if prices:
+            to_datetime = lambda ts: datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None)
+            symbols = {symbol for epoch_prices in prices.values() for symbol in epoch_prices}
+            # Whole rounds, from the start of the first to the end of the last
+            since = min(prices) - (min(prices) - FIRST_VOTING_ROUND_START) % VOTING_EPOCH_SECONDS
+            until = max(prices) - (max(prices) - FIRST_VOTING_ROUND_START) % VOTING_EPOCH_SECONDS + VOTING_EPOCH_SECONDS
+            existing = {
+                (symbol, current_voting_epoch(moment.replace(tzinfo=timezone.utc).timestamp()))
+                for symbol, moment in db.session.execute(
+                    select(PriceHistory.symbol, PriceHistory.timestamp).where(
+                        PriceHistory.symbol.in_(symbols),
+                        PriceHistory.timestamp >= to_datetime(since),
+                        PriceHistory.timestamp < to_datetime(until)
+                    )
+                ).all()
+            }
+            for timestamp, epoch_prices in sorted(prices.items()):
+                moment = to_datetime(timestamp)
+                epoch = current_voting_epoch(timestamp)
+                fresh = [(symbol, price) for symbol, price in epoch_prices.items() if (symbol, epoch) not in existing]
+                if len(fresh) < len(epoch_prices):
+                    self.stats['duplicate_epochs'] += 1
+                rows.extend({'symbol': symbol, 'price': price, 'source': 'backfill', 'timestamp': moment}
+                            for symbol, price in fresh)
+
+        try:
+            if rows:
+                db.session.execute(insert(PriceHistory), rows)
+            self._save_checkpoint(checkpoint_block)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        self.stats['rows'] += len(rows)
+
+    def _save_checkpoint(self, block: int):
+        updated = db.session.execute(
+            update(IndexerCheckpoint)
+            .where(IndexerCheckpoint.name == self.checkpoint_name)
+            .values(last_block=block, updated_at=datetime.utcnow())
+        ).rowcount
+        if not updated:
+            db.session.add(IndexerCheckpoint(name=self.checkpoint_name, last_block=block))
+
+if __name__ == '__main__':
+    import argparse
+    from app import app
+
+    parser = argparse.ArgumentParser(description='Backfill FTSO price history at past blocks')
+    parser.add_argument('--days', type=float, default=PRICE_BACKFILL_DAYS, help='Window ending at the current head')
+    parser.add_argument('--workers', type=int, default=PRICE_BACKFILL_WORKERS, help='Batch requests in flight')
+    parser.add_argument('--batch-size', type=int, default=PRICE_BACKFILL_BATCH_SIZE, help='eth_calls per batch request')
+    parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and start over')
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            stats = PriceBackfill().run(args.days, args.workers, args.batch_size, args.restart)
+        except RuntimeError as e:
+            raise SystemExit(f"Backfill failed: {e}")
+        print(f"Backfill {'stopped' if 'stopped_at' in stats else 'done'}: {stats}")
@@ -0,0 +1,155 @@
+"""
+PriceHistory retention
+Every price refresh appends one row per token, so the table grows without
+bound. Rows older than PRICE_HISTORY_RAW_DAYS are downsampled to the last row
+per token per PRICE_HISTORY_BUCKET_MINUTES, and rows older than
+PRICE_HISTORY_RETENTION_DAYS are deleted (0 keeps them). Deletes go out in
+batches of PRICE_HISTORY_PRUNE_BATCH ids, one day per transaction.
+
+A single price_retention_checkpoint row records how far downsampling got and
+the highest id it has seen, so a run only rescans days that gained rows since
+(a backfill inserting old epochs moves the start back to them).
+"""
+
+import os
+import time
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from sqlalchemy import delete, func, select
+from app import db
+from models import PriceHistory, PriceRetentionCheckpoint, IndexerCheckpoint
+
+logger = logging.getLogger(__name__)
+
+PRICE_HISTORY_RAW_DAYS = float(os.environ.get('PRICE_HISTORY_RAW_DAYS', 7))
+PRICE_HISTORY_BUCKET_MINUTES = int(os.environ.get('PRICE_HISTORY_BUCKET_MINUTES', 60))
+PRICE_HISTORY_RETENTION_DAYS = float(os.environ.get('PRICE_HISTORY_RETENTION_DAYS', 365))
+PRICE_HISTORY_PRUNE_BATCH = int(os.environ.get('PRICE_HISTORY_PRUNE_BATCH', 5000))
+
+CHECKPOINT_ID = 1
+# Where earlier versions kept the checkpoint, moved on first run
+LEGACY_CHECKPOINTS = {'downsampled_day': 'price_history:downsampled_day', 'seen_id': 'price_history:max_id'}
+
+def to_datetime(ts: float) -> datetime:
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None)
+
+def to_timestamp(value: datetime) -> float:
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+class PriceHistoryRetention:
+    """Downsamples and expires PriceHistory rows"""
+
+    def __init__(self, raw_days: float = PRICE_HISTORY_RAW_DAYS, bucket_minutes: int = PRICE_HISTORY_BUCKET_MINUTES,
+                 retention_days: float = PRICE_HISTORY_RETENTION_DAYS, batch_size: int = PRICE_HISTORY_PRUNE_BATCH):
+        self.raw_days = raw_days
+        self.bucket_seconds = max(1, bucket_minutes) * 60
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+
+    def run_once(self, now: Optional[float] = None) -> Dict[str, int]:
+        """Expire, then downsample; returns the rows deleted by each step"""
+        now = time.time() if now is None else now
+        stats = {'expired': 0, 'downsampled': 0}
+        try:
+            if self.retention_days > 0:
+                stats['expired'] = self.expire(to_datetime(now - self.retention_days * 86400))
+            stats['downsampled'] = self.downsample(now)
+        except Exception as e:
+            logger.error(f"Error pruning price history: {e}")
+            db.session.rollback()
+        if stats['expired'] or stats['downsampled']:
+            logger.info(f"Price history pruned: {stats['expired']} expired, {stats['downsampled']} downsampled rows deleted")
+        return stats
+
+    def expire(self, cutoff: datetime) -> int:
+        """Delete every row older than cutoff"""
+        deleted = 0
+        while True:
+            ids = db.session.execute(
+                select(PriceHistory.id).where(PriceHistory.timestamp < cutoff).limit(self.batch_size)
+            ).scalars().all()
+            if not ids:
+                return deleted
+            deleted += self._delete(ids)
+            db.session.commit()
+
+    def downsample(self, now: float) -> int:
+        """Keep the last row per token per bucket for days older than PRICE_HISTORY_RAW_DAYS"""
+        # Only whole days are downsampled, so a day is never split across runs
+        end = (now - self.raw_days * 86400) // 86400 * 86400
+        start = self._start()
+        if start is None:
+            return 0
+
+        deleted = 0
+        day = start // 86400 * 86400
+        while day < end:
+            deleted += self._downsample_window(to_datetime(day), to_datetime(day + 86400))
+            self._checkpoint().downsampled_day = int(day // 86400) + 1
+            db.session.commit()
+            day += 86400
+        db.session.commit()
+        return deleted
+
+    def _start(self) -> Optional[float]:
+        """Oldest time that may hold rows not yet downsampled"""
+        max_id = db.session.execute(select(func.max(PriceHistory.id))).scalar()
+        if max_id is None:
+            return None
+        checkpoint = self._checkpoint()
+        done, seen_id = checkpoint.downsampled_day, checkpoint.seen_id
+
+        start = done * 86400 if done is not None else None
+        if done is None or seen_id is None:
+            oldest = db.session.execute(select(func.min(PriceHistory.timestamp))).scalar()
+        else:
+            # Rows added since the last run may be older than the checkpoint (backfill)
+            oldest = db.session.execute(
+                select(func.min(PriceHistory.timestamp)).where(PriceHistory.id > seen_id)
+            ).scalar()
+        if oldest is not None:
+            start = to_timestamp(oldest) if start is None else min(start, to_timestamp(oldest))
+        checkpoint.seen_id = max_id
+        return start
+
+    def _downsample_window(self, since: datetime, until: datetime) -> int:
+        rows = db.session.execute(
+            select(PriceHistory.id, PriceHistory.symbol, PriceHistory.timestamp)
+            .where(PriceHistory.timestamp >= since, PriceHistory.timestamp < until)
+            .order_by(PriceHistory.timestamp, PriceHistory.id)
+        ).all()
+
+        # Rows are in time order, so the last one written per (symbol, bucket) is the one kept
+        keep = {}
+        for row_id, symbol, timestamp in rows:
+            keep[(symbol, int(to_timestamp(timestamp) // self.bucket_seconds))] = row_id
+        kept = set(keep.values())
+        stale = [row_id for row_id, _, _ in rows if row_id not in kept]
+        return sum(self._delete(stale[i:i + self.batch_size]) for i in range(0, len(stale), self.batch_size))
+
+    def _delete(self, ids: List[int]) -> int:
+        if not ids:
+            return 0
+        return db.session.execute(delete(PriceHistory).where(PriceHistory.id.in_(ids))).rowcount
+
+    def _checkpoint(self) -> PriceRetentionCheckpoint:
+        """The checkpoint row, created (from the legacy indexer_checkpoint rows if any) on first use"""
+        checkpoint = db.session.get(PriceRetentionCheckpoint, CHECKPOINT_ID)
+        if checkpoint is None:
+            legacy = dict(db.session.execute(
+                select(IndexerCheckpoint.name, IndexerCheckpoint.last_block)
+                .where(IndexerCheckpoint.name.in_(LEGACY_CHECKPOINTS.values()))
+            ).all())
+            checkpoint = PriceRetentionCheckpoint(id=CHECKPOINT_ID, **{
+                field: legacy.get(name) for field, name in LEGACY_CHECKPOINTS.items()})
+            db.session.add(checkpoint)
+            db.session.execute(delete(IndexerCheckpoint).where(IndexerCheckpoint.name.in_(LEGACY_CHECKPOINTS.values())))
+        return checkpoint
+
+# Global retention instance
+price_history_retention = PriceHistoryRetention()
+
+def get_price_history_retention() -> PriceHistoryRetention:
+    """Get the price history retention instance"""
+    return price_history_retention
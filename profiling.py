@@ -0,0 +1,194 @@
+"""
+Opt-in per-request sampling profiler
+A request is profiled when it carries the X-Profile-Token header matching
+PROFILE_SECRET, or is picked by PROFILE_SAMPLE_RATE. A background thread
+samples the request thread's stack and the result is written as collapsed
+stacks (flamegraph.pl / speedscope input) plus a JSON metadata file.
+"""
+
+import os
+import sys
+import hmac
+import json
+import time
+import random
+import logging
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SECRET = os.environ.get('PROFILE_SECRET', '')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', 200))
+PROFILE_HEADER = 'X-Profile-Token'
+
+class SamplingProfiler:
+    """Samples one thread's stack at a fixed interval from a daemon thread"""
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_INTERVAL_MS / 1000):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self) -> 'SamplingProfiler':
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.stacks[self._collapse(frame)] += 1
+            self.samples += 1
+
+    @staticmethod
+    def _collapse(frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def folded(self) -> str:
+        """Collapsed stacks, one 'frame;frame;frame count' line per unique stack"""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+class ProfileStore:
+    """Profile captures on disk: <name>.folded plus <name>.json metadata"""
+
+    def __init__(self, directory: str, max_files: int = PROFILE_MAX_FILES):
+        self.directory = directory
+        self.max_files = max_files
+
+    def save(self, profiler: SamplingProfiler, metadata: Dict[str, Any]) -> Optional[str]:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')
+            name = f"{stamp}_{metadata.get('endpoint') or 'unmatched'}"
+
+            with open(os.path.join(self.directory, f"{name}.folded"), 'w') as f:
+                f.write(profiler.folded())
+            with open(os.path.join(self.directory, f"{name}.json"), 'w') as f:
+                json.dump(dict(metadata, name=name, samples=profiler.samples), f)
+
+            self._prune()
+            return name
+
+        except Exception as e:
+            logger.error(f"Error saving profile: {e}")
+            return None
+
+    def _prune(self):
+        captures = sorted(f for f in os.listdir(self.directory) if f.endswith('.json'))
+        for stale in captures[:max(0, len(captures) - self.max_files)]:
+            for ext in ('.json', '.folded'):
+                try:
+                    os.remove(os.path.join(self.directory, stale[:-5] + ext))
+                except FileNotFoundError:
+                    pass
+
+    def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Metadata for the newest captures first"""
+        if not os.path.isdir(self.directory):
+            return []
+
+        captures = sorted((f for f in os.listdir(self.directory) if f.endswith('.json')), reverse=True)
+        entries = []
+        for filename in captures[:limit]:
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    entries.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return entries
+
+    def path(self, name: str) -> Optional[str]:
+        """Path of a capture's collapsed stacks, or None for unknown or unsafe names"""
+        if os.path.basename(name) != name:
+            return None
+        path = os.path.join(self.directory, f"{name}.folded")
+        return path if os.path.isfile(path) else None
+
+profile_store: Optional[ProfileStore] = None
+
+def get_profile_store() -> Optional[ProfileStore]:
+    """Get the profile store (None until install_profiling runs)"""
+    return profile_store
+
+def is_authorized(headers) -> bool:
+    """True when the request carries the profiling secret"""
+    token = headers.get(PROFILE_HEADER)
+    return bool(PROFILE_SECRET) and token is not None and \
+        hmac.compare_digest(token.encode(), PROFILE_SECRET.encode())
+
+def install_profiling(app):
+    """Profile requests selected by header secret or sample rate"""
+    global profile_store
+    if not PROFILE_SECRET and PROFILE_SAMPLE_RATE <= 0:
+        return
+
+    from flask import g, request
+    from wallet_service import get_wallet_service
+
+    profile_store = ProfileStore(os.environ.get('PROFILE_DIR', os.path.join(app.instance_path, 'profiles')))
+
+    @app.before_request
+    def _start_profiler():
+        if request.endpoint == 'static':
+            return
+        if is_authorized(request.headers):
+            trigger = 'header'
+        elif PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+            trigger = 'sampled'
+        else:
+            return
+        g.profiler = SamplingProfiler(threading.get_ident()).start()
+        g.profile_trigger = trigger
+        g.profile_start = time.perf_counter()
+
+    def _finish_profile(status: Optional[int]) -> Optional[str]:
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return None
+
+        profiler.stop()
+        duration_ms = (time.perf_counter() - g.pop('profile_start')) * 1000
+        name = profile_store.save(profiler, {
+            'endpoint': request.endpoint,
+            'method': request.method,
+            'path': request.path,
+            'status': status,
+            'wallet': get_wallet_service().get_connected_wallet(),
+            'trigger': g.pop('profile_trigger', None),
+            'duration_ms': round(duration_ms, 3),
+            'interval_ms': profiler.interval * 1000,
+            'captured_at': datetime.now(timezone.utc).isoformat()
+        })
+        if name:
+            logger.info(f"Profiled {request.method} {request.path} in {duration_ms:.1f}ms -> {name}")
+        return name
+
+    @app.after_request
+    def _save_profile(response):
+        name = _finish_profile(response.status_code)
+        if name:
+            response.headers['X-Profile-Id'] = name
+        return response
+
+    @app.teardown_request
+    def _stop_profiler(error=None):
+        # after_request is skipped when an exception propagates; the sampler thread must still stop
+        _finish_profile(500 if error is not None else None)
@@ -0,0 +1,134 @@
+"""
+Batched transaction-confirmation tracker
+Once per new block, fetches receipts for every pending trade in JSON-RPC
+batches and updates status, gas used and block number in one bulk UPDATE.
+A receipt settles a trade only if it was sent from the trade's wallet to our
+DEX contract or the 1inch router; any other hash is detached so the real one
+can still be submitted. Trades that stay pending past RECEIPT_EXPIRY_SECONDS
+are marked expired.
+"""
+
+import os
+import re
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import select, update
+from app import db
+from models import Trade
+from blockchain_service import get_blockchain_service
+from fragment_cache import get_fragment_cache
+from metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+RECEIPT_CHAIN = os.environ.get('RECEIPT_CHAIN', 'flare')
+RECEIPT_BATCH_SIZE = int(os.environ.get('RECEIPT_BATCH_SIZE', 100))
+RECEIPT_EXPIRY_SECONDS = int(os.environ.get('RECEIPT_EXPIRY_SECONDS', 1800))
+
+TX_HASH_PATTERN = re.compile(r'^0x[0-9a-fA-F]{64}$')
+
+def is_tx_hash(value: Optional[str]) -> bool:
+    return bool(value) and bool(TX_HASH_PATTERN.match(value))
+
+class ReceiptTracker:
+    """Confirms pending trades from their receipts, one batch round-trip per block"""
+
+    def __init__(self, chain: str = RECEIPT_CHAIN):
+        self.chain = chain
+
+    @property
+    def provider(self):
+        return get_blockchain_service().web3_connections[self.chain].provider
+
+    def pending(self) -> Dict[str, Tuple[int, str]]:
+        """tx hash -> (trade id, wallet) for pending trades of a known wallet that have a submitted hash"""
+        rows = db.session.execute(
+            select(Trade.id, Trade.tx_hash, Trade.wallet_address).where(
+                Trade.status == 'pending', Trade.tx_hash.isnot(None), Trade.wallet_address.isnot(None)
+            )
+        ).all()
+        return {tx_hash.lower(): (trade_id, wallet) for trade_id, tx_hash, wallet in rows if is_tx_hash(tx_hash)}
+
+    def fetch_receipts(self, tx_hashes: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Receipts by tx hash for the mined ones, RECEIPT_BATCH_SIZE hashes per request"""
+        receipts = {}
+        for i in range(0, len(tx_hashes), RECEIPT_BATCH_SIZE):
+            chunk = tx_hashes[i:i + RECEIPT_BATCH_SIZE]
+            responses = self.provider.make_batch_request([
+                ('eth_getTransactionReceipt', [tx_hash]) for tx_hash in chunk
+            ])
+            if not isinstance(responses, list):
+                logger.warning(f"Receipt batch failed: {responses}")
+                continue
+            for tx_hash, response in zip(chunk, responses):
+                receipt = response.get('result') if isinstance(response, dict) else None
+                if receipt:
+                    receipts[tx_hash] = receipt
+        return receipts
+
+    def run_once(self) -> Dict[str, int]:
+        """Update pending trades from receipts and expire stale ones; returns counts by new status"""
+        counts = {'confirmed': 0, 'failed': 0, 'expired': 0, 'mismatched': 0}
+        pending = self.pending()
+
+        changes, detached = [], []
+        if pending:
+            contracts = get_blockchain_service().trade_contract_addresses(self.chain)
+            for tx_hash, receipt in self.fetch_receipts(list(pending)).items():
+                trade_id, wallet = pending[tx_hash]
+                if (receipt.get('from') or '').lower() != wallet.lower() or (receipt.get('to') or '').lower() not in contracts:
+                    # Not this wallet's trade transaction
+                    detached.append(trade_id)
+                    counts['mismatched'] += 1
+                    continue
+                status = 'confirmed' if int(receipt.get('status', '0x1'), 16) == 1 else 'failed'
+                changes.append({
+                    'id': trade_id,
+                    'status': status,
+                    'gas_used': int(receipt['gasUsed'], 16),
+                    'block_number': int(receipt['blockNumber'], 16)
+                })
+                counts[status] += 1
+
+        try:
+            if changes:
+                db.session.execute(update(Trade), changes)
+            if detached:
+                db.session.execute(
+                    update(Trade).where(Trade.id.in_(detached)).values(tx_hash=None)
+                    .execution_options(synchronize_session=False)
+                )
+
+            # Never mined (dropped, replaced or never broadcast)
+            cutoff = datetime.utcnow() - timedelta(seconds=RECEIPT_EXPIRY_SECONDS)
+            counts['expired'] = db.session.execute(
+                update(Trade)
+                .where(Trade.status == 'pending', Trade.created_at < cutoff)
+                .values(status='expired')
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.session.commit()
+
+        except Exception as e:
+            logger.error(f"Error updating trade receipts: {e}")
+            db.session.rollback()
+            return {}
+
+        if changes or detached or counts['expired']:
+            # Bulk UPDATEs bypass ORM events
+            get_fragment_cache().bump('trades')
+            for status, count in counts.items():
+                if count:
+                    get_metrics().receipt_updates.inc(status, amount=count)
+            logger.info(f"Trade receipts: {counts} ({len(pending)} pending)")
+        return counts
+
+_tracker: Optional[ReceiptTracker] = None
+
+def get_receipt_tracker() -> ReceiptTracker:
+    """Get the receipt tracker instance"""
+    global _tracker
+    if _tracker is None:
+        _tracker = ReceiptTracker()
+    return _tracker
@@ -1,106 +1,87 @@
-from flask import render_template, request, jsonify, flash, redirect, url_for
-from app import app, db
+from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, Response, send_file
+from app import db
 from models import Token, Portfolio, Trade, ChatMessage
 from mock_data import initialize_real_data, update_real_prices, execute_real_trade, sync_real_portfolio
 from chatbot import process_chat_message
 from blockchain_service import get_blockchain_service
+from market_stats import get_market_stats
+from portfolio_valuation import get_valuation_engine
+from fragment_cache import get_fragment_cache
+from metrics import get_metrics, is_scrape_authorized, METRICS_ENABLED
+from profiling import get_profile_store, is_authorized
+from head_scheduler import get_head_scheduler
+from receipt_tracker import is_tx_hash
+from shared_prices import read_shared_prices, shared_token_rows
+from admission import admit
 from wallet_service import get_wallet_service, require_wallet_connection
+from wallet_auth import TOKEN_COOKIE
+import os
 import json
+import time
 import logging
 from datetime import datetime, timedelta
+from web3 import Web3
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+bp = Blueprint('main', __name__)
 
-@app.route('/')
+# Upper bound on wallets per aggregated portfolio request
+MAX_AGGREGATE_WALLETS = int(os.environ.get('MAX_AGGREGATE_WALLETS', 500))
+
+@bp.route('/')
 def dashboard():
     initialize_real_data()
-    tokens = Token.query.all()
-    
+    fragments = get_fragment_cache()
+
+    # Market-wide parts are cached per price snapshot / trade version
+    token_list = fragments.render('dashboard_token_list', 'partials/token_list.html',
+                                  lambda: {'tokens': Token.query.all()})
+    recent_trades = fragments.render('dashboard_recent_trades', 'partials/recent_trades.html',
+                                     lambda: {'recent_trades': Trade.query.filter(Trade.is_liquidity.isnot(True))
+                                              .order_by(Trade.created_at.desc()).limit(5).all()},
+                                     depends=('trades',))
+
     # Get portfolio for connected wallet only
     wallet_service = get_wallet_service()
     wallet_address = wallet_service.get_connected_wallet()
-    
-    if wallet_address:
-        portfolio = Portfolio.query.filter(
-            Portfolio.balance > 0,
-            Portfolio.wallet_address == wallet_address
-        ).all()
-    else:
-        portfolio = []
-    
-    recent_trades = Trade.query.order_by(Trade.created_at.desc()).limit(5).all()
-
-    # Calculate total portfolio value from real balances
-    total_value = 0
-    for holding in portfolio:
-        token = Token.query.filter_by(symbol=holding.token_symbol).first()
-        if token:
-            total_value += holding.balance * token.price
+    get_head_scheduler().watch_wallet(wallet_address)
+
+    # Value real balances against the current price snapshot
+    valuation = get_valuation_engine().value_wallet(wallet_address)
+    portfolio = valuation['holdings']
+    total_value = valuation['total_value']
 
     return render_template('dashboard_modern.html', 
-                         tokens=tokens, 
+                         token_list=token_list, 
                          portfolio=portfolio, 
+                         holding_count=valuation['holding_count'],
                          recent_trades=recent_trades,
                          total_value=total_value,
                          wallet_connected=wallet_address is not None)
 
-@app.route('/trading')
+@bp.route('/trading')
 def trading():
-    tokens = Token.query.all()
-    return render_template('trading.html', tokens=tokens)
+    fragments = get_fragment_cache()
+    load_tokens = lambda: {'tokens': Token.query.all()}
 
-@app.route('/portfolio')
+    return render_template('trading.html',
+                         token_options=fragments.render('trading_token_options', 'partials/token_options.html', load_tokens),
+                         chart_token_options=fragments.render('trading_chart_token_options', 'partials/chart_token_options.html', load_tokens),
+                         market_table_rows=fragments.render('trading_market_table_rows', 'partials/market_table_rows.html', load_tokens))
+
+@bp.route('/portfolio')
 def portfolio():
     # Get portfolio for connected wallet only
     wallet_service = get_wallet_service()
     wallet_address = wallet_service.get_connected_wallet()
-    
-    if wallet_address:
-        portfolio_items = Portfolio.query.filter(
-            Portfolio.balance > 0,
-            Portfolio.wallet_address == wallet_address
-        ).all()
-    else:
-        portfolio_items = []
-
-    tokens = Token.query.all()
+    get_head_scheduler().watch_wallet(wallet_address)
 
     # Calculate portfolio metrics
-    portfolio_data = []
-    total_value = 0
-    total_cost = 0
-
-    for holding in portfolio_items:
-        token = Token.query.filter_by(symbol=holding.token_symbol).first()
-        if token and holding.balance > 0:
-            current_value = holding.balance * token.price
-            cost_basis = holding.balance * holding.avg_buy_price
-            pnl = current_value - cost_basis
-            pnl_percent = (pnl / cost_basis * 100) if cost_basis > 0 else 0
-
-            # Convert to JSON-serializable format
-            portfolio_data.append({
-                'token': {
-                    'symbol': token.symbol,
-                    'name': token.name,
-                    'price': token.price
-                },
-                'holding': {
-                    'balance': holding.balance,
-                    'avg_buy_price': holding.avg_buy_price
-                },
-                'current_value': current_value,
-                'cost_basis': cost_basis,
-                'pnl': pnl,
-                'pnl_percent': pnl_percent
-            })
-
-            total_value += current_value
-            total_cost += cost_basis
-
-    total_pnl = total_value - total_cost
-    total_pnl_percent = (total_pnl / total_cost * 100) if total_cost > 0 else 0
+    valuation = get_valuation_engine().value_wallet(wallet_address)
+    portfolio_data = valuation['holdings']
+    total_value = valuation['total_value']
+    total_cost = valuation['total_cost']
+    total_pnl = valuation['total_pnl']
+    total_pnl_percent = valuation['total_pnl_percent']
 
     return render_template('portfolio.html', 
                          portfolio_data=portfolio_data,
@@ -110,12 +91,85 @@ def portfolio():
                          total_pnl_percent=total_pnl_percent,
                          wallet_connected=wallet_address is not None)
 
-@app.route('/chat')
+@bp.route('/api/portfolio')
+def portfolio_api():
+    """Portfolio holdings, PnL and totals for the connected wallet"""
+    wallet_service = get_wallet_service()
+    wallet_address = wallet_service.get_connected_wallet()
+    if not wallet_address:
+        return jsonify({
+            'success': False,
+            'message': 'Wallet connection required'
+        }), 401
+
+    get_head_scheduler().watch_wallet(wallet_address)
+    valuation = get_valuation_engine().value_wallet(wallet_address)
+    return jsonify({
+        'success': True,
+        'wallet_address': wallet_address,
+        **valuation
+    })
+
+@bp.route('/api/portfolio/aggregate', methods=['POST'])
+@admit('quote')
+def aggregate_portfolio():
+    """Combined and per-wallet exposure for a set of wallets"""
+    try:
+        data = request.json or {}
+        wallets = data.get('wallets') or []
+
+        if not isinstance(wallets, list) or not wallets:
+            return jsonify({
+                'success': False,
+                'message': 'wallets must be a non-empty list of addresses'
+            }), 400
+
+        if len(wallets) > MAX_AGGREGATE_WALLETS:
+            return jsonify({
+                'success': False,
+                'message': f'At most {MAX_AGGREGATE_WALLETS} wallets per request'
+            }), 400
+
+        invalid = [w for w in wallets if not isinstance(w, str) or not Web3.is_address(w)]
+        if invalid:
+            return jsonify({
+                'success': False,
+                'message': f'Invalid wallet addresses: {", ".join(map(str, invalid[:5]))}'
+            }), 400
+
+        # Deduplicate case-insensitively, keeping the first spelling
+        seen = {}
+        for wallet in wallets:
+            seen.setdefault(Web3.to_checksum_address(wallet), wallet)
+        unique_wallets = list(seen.values())
+
+        engine = get_valuation_engine()
+        snapshot = engine.load_price_snapshot()
+
+        blockchain_service = get_blockchain_service()
+        balances = blockchain_service.get_wallet_balances(unique_wallets, snapshot.symbols.tolist())
+
+        return jsonify({
+            'success': True,
+            **engine.value_balances(balances, snapshot),
+            # Wallets whose balances could not be read are reported rather than valued as empty
+            'unavailable': [wallet for wallet in unique_wallets if wallet not in balances]
+        })
+
+    except Exception as e:
+        logging.error(f"Error aggregating portfolios: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Portfolio aggregation failed: {str(e)}'
+        }), 500
+
+@bp.route('/chat')
 def chat():
     messages = ChatMessage.query.order_by(ChatMessage.created_at.desc()).limit(20).all()
     return render_template('chat.html', messages=messages[::-1])
 
-@app.route('/api/execute_trade', methods=['POST'])
+@bp.route('/api/execute_trade', methods=['POST'])
+@admit('trade')
 def execute_trade():
     """Execute real blockchain trades only"""
     wallet_service = get_wallet_service()
@@ -157,7 +211,8 @@ def execute_trade():
             'message': f'Real trade execution failed: {str(e)}'
         })
 
-@app.route('/api/chat', methods=['POST'])
+@bp.route('/api/chat', methods=['POST'])
+@admit('quote')
 def chat_api():
     message = request.json.get('message', '').strip()
 
@@ -184,7 +239,7 @@ def chat_api():
     except Exception as e:
         return jsonify({'response': f'Error processing message: {str(e)}'})
 
-@app.route('/api/price_data/<symbol>')
+@bp.route('/api/price_data/<symbol>')
 def get_price_data(symbol):
     # Generate mock price data for charts
     import random
@@ -213,23 +268,32 @@ def get_price_data(symbol):
         'current_price': current_price
     })
 
-@app.route('/api/refresh_prices')
+@bp.route('/api/refresh_prices')
+@admit('refresh')
 def refresh_prices():
     """Refresh prices from live blockchain and market data"""
     try:
-        blockchain_service = get_blockchain_service()
-        blockchain_service.update_token_prices()
+        # The head scheduler refreshes prices once per FTSO epoch; only fetch here without it
+        refresh = {'rows_written': 0, 'coalesced': 'scheduler'}
+        if not get_head_scheduler().running:
+            # Concurrent calls share one refresh; recent ones reuse the last result
+            refresh = get_blockchain_service().refresh_token_prices()
+
+        # Prices published by whichever worker polls, without a DB round-trip
+        shared = read_shared_prices()
+        if shared is not None:
+            tokens = [{'symbol': symbol, 'price': row['price'], 'change_24h': row['change_24h']}
+                      for symbol, row in shared_token_rows(shared).items()]
+        else:
+            tokens = [{'symbol': t.symbol, 'price': t.price, 'change_24h': t.change_24h}
+                      for t in Token.query.all()]
 
-        tokens = Token.query.all()
         return jsonify({
             'success': True,
             'message': 'Prices updated from live blockchain data',
-            'tokens': [{
-                'symbol': t.symbol,
-                'price': t.price,
-                'change_24h': t.change_24h,
-                'real_data': True
-            } for t in tokens]
+            'rows_written': refresh['rows_written'],
+            'coalesced': refresh['coalesced'],
+            'tokens': [{**token, 'real_data': True} for token in tokens]
         })
     except Exception as e:
         logging.error(f"Error refreshing live prices: {e}")
@@ -239,39 +303,97 @@ def refresh_prices():
             'tokens': []
         })
 
+@bp.route('/api/market_stats')
+@bp.route('/api/market_stats/<symbol>')
+def market_stats(symbol=None):
+    """Rolling 24h change, high, low and VWAP per token"""
+    stats = get_market_stats()
+
+    if symbol:
+        token_stats = stats.get_stats(symbol.upper())
+        if not token_stats:
+            return jsonify({'success': False, 'message': f'No price data for {symbol.upper()}'}), 404
+        return jsonify({'success': True, 'symbol': symbol.upper(), 'stats': token_stats})
+
+    return jsonify({'success': True, 'stats': stats.snapshot()})
+
+@bp.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint (requires METRICS_TOKEN as a bearer token)"""
+    if not METRICS_ENABLED or not is_scrape_authorized(request.headers):
+        return jsonify({'success': False, 'message': 'Metrics disabled'}), 404
+    return Response(get_metrics().render(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/api/profiles')
+def list_profiles():
+    """Recent request profile captures (requires the profiling secret header)"""
+    store = get_profile_store()
+    if store is None or not is_authorized(request.headers):
+        return jsonify({'success': False, 'message': 'Not found'}), 404
+
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    return jsonify({'success': True, 'profiles': store.recent(limit)})
+
+@bp.route('/api/profiles/<name>')
+def download_profile(name):
+    """Collapsed stacks for one capture"""
+    store = get_profile_store()
+    path = store.path(name) if store is not None and is_authorized(request.headers) else None
+    if not path:
+        return jsonify({'success': False, 'message': 'Not found'}), 404
+    return send_file(path, mimetype='text/plain')
+
 # Wallet connection endpoints
-@app.route('/api/wallet/config')
+@bp.route('/api/wallet/config')
 def get_wallet_config():
     """Get WalletConnect configuration"""
     wallet_service = get_wallet_service()
     return jsonify(wallet_service.get_wallet_config())
 
-@app.route('/api/wallet/connect', methods=['POST'])
+@bp.route('/api/wallet/sign_in', methods=['POST'])
+def wallet_sign_in():
+    """SIWE message for the wallet to sign before /api/wallet/connect"""
+    data = request.json or {}
+    sign_in_request = get_wallet_service().create_sign_in(data.get('address'), data.get('chainId'))
+    if not sign_in_request:
+        return jsonify({
+            'success': False,
+            'message': 'Invalid wallet address or unsupported chain'
+        }), 400
+    return jsonify({'success': True, **sign_in_request})
+
+@bp.route('/api/wallet/connect', methods=['POST'])
 def connect_wallet():
-    """Connect a wallet via WalletConnect"""
+    """Connect a wallet with a signed SIWE message; answers with its wallet token"""
     try:
-        data = request.json
-        wallet_address = data.get('address')
-        chain_id = data.get('chainId')
+        data = request.json or {}
 
         wallet_service = get_wallet_service()
-        success = wallet_service.connect_wallet(wallet_address, chain_id)
+        token, message = wallet_service.connect_wallet(data)
+
+        if token:
+            wallet_address = wallet_service.get_connected_wallet()
+            chain_id = wallet_service.get_claims().chain_id
 
-        if success:
             # Sync portfolio with real blockchain balances
             sync_real_portfolio(wallet_address)
+            get_head_scheduler().watch_wallet(wallet_address)
 
-            return jsonify({
+            response = jsonify({
                 'success': True,
                 'message': 'Wallet connected successfully',
                 'address': wallet_address,
-                'chainId': chain_id
+                'chainId': chain_id,
+                'token': token
             })
+            response.set_cookie(TOKEN_COOKIE, token, max_age=int(data['expiresAt']) - int(time.time()),
+                                httponly=True, samesite='Lax', secure=request.is_secure)
+            return response
         else:
             return jsonify({
                 'success': False,
-                'message': 'Failed to connect wallet'
-            }), 400
+                'message': message
+            }), 401
 
     except Exception as e:
         logging.error(f"Error connecting wallet: {e}")
@@ -280,17 +402,19 @@ def connect_wallet():
             'message': f'Connection error: {str(e)}'
         }), 500
 
-@app.route('/api/wallet/disconnect', methods=['POST'])
+@bp.route('/api/wallet/disconnect', methods=['POST'])
 def disconnect_wallet():
     """Disconnect the current wallet"""
     try:
         wallet_service = get_wallet_service()
         wallet_service.disconnect_wallet()
 
-        return jsonify({
+        response = jsonify({
             'success': True,
             'message': 'Wallet disconnected successfully'
         })
+        response.delete_cookie(TOKEN_COOKIE)
+        return response
     except Exception as e:
         logging.error(f"Error disconnecting wallet: {e}")
         return jsonify({
@@ -298,7 +422,7 @@ def disconnect_wallet():
             'message': f'Disconnection error: {str(e)}'
         }), 500
 
-@app.route('/api/wallet/status')
+@bp.route('/api/wallet/status')
 def wallet_status():
     """Get current wallet connection status"""
     wallet_service = get_wallet_service()
@@ -309,7 +433,8 @@ def wallet_status():
         'chain': wallet_service.get_chain_info()
     })
 
-@app.route('/api/execute_onchain_trade', methods=['POST'])
+@bp.route('/api/execute_onchain_trade', methods=['POST'])
+@admit('trade')
 def execute_onchain_trade():
     """Execute a real onchain trade via smart contracts"""
     try:
@@ -343,7 +468,9 @@ def execute_onchain_trade():
                     to_token=to_token,
                     amount=amount,
                     price=Token.query.filter_by(symbol=to_token).first().price,
-                    total_value=amount * Token.query.filter_by(symbol=to_token).first().price
+                    total_value=amount * Token.query.filter_by(symbol=to_token).first().price,
+                    wallet_address=wallet_address,
+                    status='pending'
                 )
                 db.session.add(trade)
                 db.session.commit()
@@ -352,7 +479,8 @@ def execute_onchain_trade():
                 'success': success,
                 'message': message,
                 'onchain': True,
-                'use_oneinch': use_oneinch
+                'use_oneinch': use_oneinch,
+                'trade_id': trade.id if success else None
             })
         else:
             return jsonify({
@@ -367,7 +495,37 @@ def execute_onchain_trade():
             'message': f'Onchain trade failed: {str(e)}'
         }), 500
 
-@app.route('/api/execute_dex_swap', methods=['POST'])
+@bp.route('/api/trades/<int:trade_id>/tx', methods=['POST'])
+def submit_trade_tx(trade_id):
+    """Attach the signed transaction's hash so the receipt tracker can confirm the trade"""
+    try:
+        data = request.json or {}
+        tx_hash = (data.get('tx_hash') or '').strip()
+        if not is_tx_hash(tx_hash):
+            return jsonify({'success': False, 'message': 'Invalid transaction hash'}), 400
+
+        trade = db.session.get(Trade, trade_id)
+        if trade is None:
+            return jsonify({'success': False, 'message': 'Trade not found'}), 404
+
+        # Trades without a wallet cannot be matched to a receipt's sender, so nobody may claim them
+        wallet_address = get_wallet_service().get_connected_wallet()
+        if not trade.wallet_address or not wallet_address or wallet_address.lower() != trade.wallet_address.lower():
+            return jsonify({'success': False, 'message': 'Trade belongs to another wallet'}), 403
+        if trade.status != 'pending':
+            return jsonify({'success': False, 'message': f'Trade is already {trade.status}'}), 409
+
+        trade.tx_hash = tx_hash.lower()
+        db.session.commit()
+        return jsonify({'success': True, 'trade_id': trade.id, 'status': trade.status})
+
+    except Exception as e:
+        logging.error(f"Error submitting trade tx: {e}")
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@bp.route('/api/execute_dex_swap', methods=['POST'])
+@admit('trade')
 def execute_dex_swap():
     """Execute DEX swap with 1inch integration"""
     try:
@@ -399,7 +557,9 @@ def execute_dex_swap():
                 to_token=to_token,
                 amount=amount,
                 price=Token.query.filter_by(symbol=to_token).first().price,
-                total_value=amount * Token.query.filter_by(symbol=to_token).first().price
+                total_value=amount * Token.query.filter_by(symbol=to_token).first().price,
+                wallet_address=wallet_address,
+                status='pending'
             )
             db.session.add(trade)
             db.session.commit()
@@ -408,7 +568,8 @@ def execute_dex_swap():
             'success': success,
             'message': message,
             'use_oneinch': use_oneinch,
-            'transaction_ready': success
+            'transaction_ready': success,
+            'trade_id': trade.id if success else None
         })
 
     except Exception as e:
@@ -418,7 +579,8 @@ def execute_dex_swap():
             'message': f'DEX swap failed: {str(e)}'
         }), 500
 
-@app.route('/api/execute_cross_chain', methods=['POST'])
+@bp.route('/api/execute_cross_chain', methods=['POST'])
+@admit('trade')
 def execute_cross_chain():
     """Execute cross-chain swap via bridge"""
     try:
@@ -454,7 +616,9 @@ def execute_cross_chain():
                 to_token=to_token,
                 amount=amount,
                 price=Token.query.filter_by(symbol=from_token).first().price,
-                total_value=amount * Token.query.filter_by(symbol=from_token).first().price
+                total_value=amount * Token.query.filter_by(symbol=from_token).first().price,
+                wallet_address=wallet_address,
+                status='pending'
             )
             db.session.add(trade)
             db.session.commit()
@@ -463,7 +627,8 @@ def execute_cross_chain():
             'success': success,
             'message': message,
             'destination_chain': destination_chain,
-            'transaction_ready': success
+            'transaction_ready': success,
+            'trade_id': trade.id if success else None
         })
 
     except Exception as e:
@@ -473,7 +638,8 @@ def execute_cross_chain():
             'message': f'Cross-chain swap failed: {str(e)}'
         }), 500
 
-@app.route('/api/add_liquidity', methods=['POST'])
+@bp.route('/api/add_liquidity', methods=['POST'])
+@admit('trade')
 def add_liquidity():
     """Add liquidity to trading pair"""
     try:
@@ -506,7 +672,10 @@ def add_liquidity():
                 amount=amount_a,
                 price=amount_b / amount_a if amount_a > 0 else 0,
                 total_value=amount_a * Token.query.filter_by(symbol=token_a).first().price + 
-                           amount_b * Token.query.filter_by(symbol=token_b).first().price
+                           amount_b * Token.query.filter_by(symbol=token_b).first().price,
+                wallet_address=wallet_address,
+                status='pending',
+                is_liquidity=True
             )
             db.session.add(trade)
             db.session.commit()
@@ -515,7 +684,8 @@ def add_liquidity():
             'success': success,
             'message': message,
             'pair': f"{token_a}/{token_b}",
-            'transaction_ready': success
+            'transaction_ready': success,
+            'trade_id': trade.id if success else None
         })
 
     except Exception as e:
@@ -527,7 +697,8 @@ def add_liquidity():
 
 
 
-@app.route('/api/cross_chain_quote', methods=['POST'])
+@bp.route('/api/cross_chain_quote', methods=['POST'])
+@admit('quote')
 def get_cross_chain_quote():
     """Get quote for cross-chain swap"""
     try:
@@ -567,7 +738,8 @@ def get_cross_chain_quote():
             'message': f'Quote failed: {str(e)}'
         }), 500
 
-@app.route('/api/execute_cross_chain_swap', methods=['POST'])
+@bp.route('/api/execute_cross_chain_swap', methods=['POST'])
+@admit('trade')
 def execute_cross_chain_swap():
     """Execute cross-chain swap"""
     try:
@@ -601,11 +773,13 @@ def execute_cross_chain_swap():
                 amount=amount,
                 price=Token.query.filter_by(symbol=to_token).first().price if Token.query.filter_by(symbol=to_token).first() else 1.0,
                 total_value=amount,
-                metadata=json.dumps({
+                trade_metadata=json.dumps({
                     'from_chain': from_chain,
                     'to_chain': to_chain,
                     'cross_chain': True
-                })
+                }),
+                wallet_address=wallet_address,
+                status='pending'
             )
             db.session.add(trade)
             db.session.commit()
@@ -613,7 +787,8 @@ def execute_cross_chain_swap():
         return jsonify({
             'success': success,
             'message': message,
-            'cross_chain': True
+            'cross_chain': True,
+            'trade_id': trade.id if success else None
         })
 
     except Exception as e:
@@ -623,7 +798,7 @@ def execute_cross_chain_swap():
             'message': f'Cross-chain swap failed: {str(e)}'
         }), 500
 
-@app.route('/api/supported_chains')
+@bp.route('/api/supported_chains')
 def get_supported_chains():
     """Get list of supported chains and their tokens"""
     try:
@@ -642,7 +817,9 @@ def get_supported_chains():
                     'avalanche': 'AVAX'
                 }.get(chain, 'ETH'),
                 'rpc_connected': chain in blockchain_service.web3_connections and 
-                               blockchain_service.web3_connections[chain].is_connected()
+                               blockchain_service.web3_connections[chain].is_connected(),
+                'rpc_endpoints': blockchain_service.web3_connections[chain].provider.status()
+                                 if chain in blockchain_service.web3_connections else []
             }
 
         return jsonify({
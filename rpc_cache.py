@@ -0,0 +1,204 @@
+"""
+Block-number-keyed read cache for JSON-RPC
+Reads against 'latest' are keyed by the current head block and sent with
+that block number in place of the tag, so every request inside one block
+shares the answer for exactly that block, and new blocks invalidate it
+implicitly. Reads pinned to an explicit block number never change and stay
+cached until they fall out of the LRU.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional, Tuple
+from metrics import get_metrics
+from logging_config import log_throttled
+
+logger = logging.getLogger(__name__)
+
+RPC_CACHE_ENABLED = os.environ.get('RPC_CACHE_ENABLED', 'true').lower() != 'false'
+RPC_CACHE_SIZE = int(os.environ.get('RPC_CACHE_SIZE', 10000))
+# Poll intervals without a new head before the last one is no longer reported as current
+HEAD_STALE_INTERVALS = int(os.environ.get('HEAD_STALE_INTERVALS', 10))
+# Upper bound in seconds on the wait between head polls after failures
+HEAD_MAX_BACKOFF = float(os.environ.get('HEAD_MAX_BACKOFF', 30))
+
+# Average block times in seconds; the head is re-polled at half of this
+CHAIN_BLOCK_TIMES = {
+    'flare': 1.8,
+    'coston2': 1.8,
+    'ethereum': 12.0,
+    'polygon': 2.0,
+    'avalanche': 2.0,
+    'bsc': 3.0
+}
+
+# Cached read methods -> index of their block parameter (None: no block parameter)
+CACHED_METHODS = {
+    'eth_call': 1,
+    'eth_getBalance': 1,
+    'eth_getTransactionCount': 1,
+    'eth_getCode': 1,
+    'eth_getStorageAt': 2,
+    'eth_chainId': None,
+    'net_version': None,
+    'web3_clientVersion': None
+}
+
+# 'safe' and 'finalized' trail the head by an unknown distance, so they are not cached
+UNCACHEABLE_TAGS = ('pending', 'safe', 'finalized')
+LATEST_TAGS = ('latest',)
+# Errors from a node that has not seen the pinned head yet; the read is retried against 'latest'
+BLOCK_NOT_FOUND_ERRORS = ('header not found', 'unknown block', 'block not found')
+
+def is_block_not_found(response: Any) -> bool:
+    """True for an error response saying the requested block is unknown to the node"""
+    if not isinstance(response, dict) or not isinstance(response.get('error'), dict):
+        return False
+    message = str(response['error'].get('message', '')).lower()
+    return any(error in message for error in BLOCK_NOT_FOUND_ERRORS)
+
+class HeadTracker:
+    """
+    Latest block number for one chain, polled at most every half block
+    Callers between polls get the last known head without an RPC round-trip;
+    only one caller at a time refreshes it. Failed polls back off
+    exponentially, and a head not refreshed for HEAD_STALE_INTERVALS polls is
+    reported as unknown (None) so callers read 'latest' from the node.
+    """
+
+    def __init__(self, chain: str, fetch: Callable[[], Any], interval: Optional[float] = None,
+                 stale_intervals: int = HEAD_STALE_INTERVALS, max_backoff: float = HEAD_MAX_BACKOFF):
+        self.chain = chain
+        self.fetch = fetch
+        self.interval = interval if interval is not None else CHAIN_BLOCK_TIMES.get(chain, 2.0) / 2
+        self.stale_after = self.interval * stale_intervals
+        self.max_backoff = max_backoff
+        self.block_number: Optional[int] = None
+        self.updated_at = 0.0
+        self.failures = 0
+        self.next_poll = 0.0
+        self._refreshing = threading.Lock()
+
+    def _due(self) -> bool:
+        now = time.monotonic()
+        return now - self.updated_at >= self.interval and now >= self.next_poll
+
+    def head(self) -> Optional[int]:
+        """Current head block, refreshed if the last poll is older than interval"""
+        if not self._due():
+            return self.current()
+
+        # The first caller blocks; later ones use the previous head while a poll runs
+        if not self._refreshing.acquire(blocking=self.block_number is None):
+            return self.current()
+        try:
+            if self._due():
+                response = self.fetch()
+                if not isinstance(response, dict) or 'result' not in response:
+                    raise ValueError(f"no result in {response}")
+                self.observe(int(response['result'], 16))
+        except Exception as e:
+            self.failures += 1
+            self.next_poll = time.monotonic() + min(self.interval * 2 ** min(self.failures, 16), self.max_backoff)
+            log_throttled(logger, logging.WARNING, f"head_poll:{self.chain}", "Head poll failed for %s (%d in a row): %s",
+                          self.chain, self.failures, str(e))
+        finally:
+            self._refreshing.release()
+        return self.current()
+
+    def current(self) -> Optional[int]:
+        """Last known head, or None when it was never seen or has gone stale"""
+        if self.block_number is None or time.monotonic() - self.updated_at > self.stale_after:
+            return None
+        return self.block_number
+
+    def observe(self, block_number: int):
+        """Record a head seen elsewhere (eth_blockNumber responses passing through)"""
+        if self.block_number is None or block_number >= self.block_number:
+            self.block_number = block_number
+        self.updated_at = time.monotonic()
+        self.failures = 0
+        self.next_poll = 0.0
+
+class BlockReadCache:
+    """LRU of RPC responses keyed by (block, method, params)"""
+
+    def __init__(self, chain: str, head_tracker: HeadTracker, max_entries: int = RPC_CACHE_SIZE):
+        self.chain = chain
+        self.head_tracker = head_tracker
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def pin(self, method: str, params: List[Any]) -> Tuple[Optional[Tuple], List[Any]]:
+        """
+        Cache key for a request (None when it must go to the node) and the params to send
+        A 'latest' read is sent for the head block its key names, so a node that has
+        moved on cannot answer with later state.
+        """
+        key = self.key(method, params)
+        if key is None or CACHED_METHODS[method] is None:
+            return key, params
+        index = CACHED_METHODS[method]
+        pinned = list(params or [])
+        if len(pinned) > index and pinned[index] not in LATEST_TAGS:
+            return key, params
+        pinned[index:index + 1] = [hex(key[0])]
+        return key, pinned
+
+    def key(self, method: str, params: List[Any]) -> Optional[Tuple]:
+        """Cache key for a request, or None when it must go to the node"""
+        if method not in CACHED_METHODS:
+            return None
+
+        params = list(params or [])
+        index = CACHED_METHODS[method]
+        tag = params[index] if index is not None and len(params) > index else 'latest'
+
+        if isinstance(tag, int):
+            block = tag
+        elif tag in UNCACHEABLE_TAGS or not isinstance(tag, str):
+            return None
+        elif tag in LATEST_TAGS:
+            block = self.head_tracker.head()
+            if block is None:
+                return None
+        elif tag.startswith('0x') and len(tag) <= 18:
+            block = int(tag, 16)
+        else:
+            # Block hashes and other selectors are not cached
+            return None
+
+        if index is not None and len(params) > index:
+            params[index] = block
+        try:
+            encoded = json.dumps(params, sort_keys=True, default=str)
+        except (TypeError, ValueError):
+            return None
+        return block, method, encoded
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        with self._lock:
+            response = self._entries.get(key)
+            if response is not None:
+                self._entries.move_to_end(key)
+        get_metrics().cache_events.inc('rpc', 'hit' if response is not None else 'miss')
+        return response
+
+    def put(self, key: Tuple, response: Any):
+        # Errors (reverts, rate limits) are not cached
+        if not isinstance(response, dict) or 'error' in response:
+            return
+        with self._lock:
+            self._entries[key] = response
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
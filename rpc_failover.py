@@ -0,0 +1,271 @@
+"""
+Multi-endpoint JSON-RPC provider with failover and hedged reads
+Each chain can be configured with a comma-separated list of RPC URLs. Requests
+go to the healthy endpoint with the lowest latency moving average; endpoints
+that keep failing are skipped by a circuit breaker until a cooldown passes.
+Idempotent reads that outlast the primary's p95 latency are hedged to the
+next endpoint and the first good answer wins.
+"""
+
+import os
+import time
+import logging
+import threading
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+from web3.providers import JSONBaseProvider
+from metrics import get_metrics, Gauge, InstrumentedHTTPProvider
+from rpc_cache import HeadTracker, BlockReadCache, RPC_CACHE_ENABLED, is_block_not_found
+from logging_config import log_throttled
+
+logger = logging.getLogger(__name__)
+
+RPC_TIMEOUT = float(os.environ.get('RPC_TIMEOUT', 10))
+RPC_EWMA_ALPHA = float(os.environ.get('RPC_EWMA_ALPHA', 0.2))
+RPC_BREAKER_FAILURES = int(os.environ.get('RPC_BREAKER_FAILURES', 3))
+RPC_BREAKER_COOLDOWN = float(os.environ.get('RPC_BREAKER_COOLDOWN', 30))
+RPC_HEDGE_MIN_MS = float(os.environ.get('RPC_HEDGE_MIN_MS', 50))
+RPC_HEDGE_WORKERS = int(os.environ.get('RPC_HEDGE_WORKERS', 8))
+
+# Reads that are safe to send twice
+HEDGED_METHODS = frozenset({
+    'eth_call', 'eth_getBalance', 'eth_getCode', 'eth_getStorageAt', 'eth_blockNumber',
+    'eth_chainId', 'net_version', 'web3_clientVersion', 'eth_gasPrice', 'eth_maxPriorityFeePerGas',
+    'eth_feeHistory', 'eth_estimateGas', 'eth_getTransactionCount', 'eth_getBlockByNumber',
+    'eth_getBlockByHash', 'eth_getLogs', 'eth_getTransactionByHash', 'eth_getTransactionReceipt'
+})
+
+# Samples kept per endpoint for the hedge threshold
+LATENCY_WINDOW = 100
+MIN_HEDGE_SAMPLES = 20
+
+def parse_rpc_urls(value: str) -> List[str]:
+    """Split a comma-separated RPC URL setting into a list"""
+    return [url.strip() for url in (value or '').split(',') if url.strip()]
+
+class RPCEndpoint:
+    """One RPC URL with its latency stats and circuit breaker"""
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, url: str, chain: str, timeout: float = RPC_TIMEOUT):
+        self.url = url
+        self.chain = chain
+        self.timeout = timeout
+        # Host only, so API keys in the path stay out of logs and metrics
+        self.label = urlparse(url).netloc or url
+        # Failover replaces web3's in-provider retries
+        self.provider = InstrumentedHTTPProvider(url, chain, request_kwargs={'timeout': timeout},
+                                                 exception_retry_configuration=None)
+
+        self.ewma_latency: Optional[float] = None
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.consecutive_failures = 0
+        self.state = self.CLOSED
+        self.opened_until = 0.0
+        self._lock = threading.Lock()
+
+    def available(self, now: float) -> bool:
+        """Closed, open with the cooldown elapsed, or half-open with no probe in flight"""
+        with self._lock:
+            return self.state == self.CLOSED or now >= self.opened_until
+
+    def dispatched(self):
+        """Called as a request goes out; a request to an open endpoint is its half-open probe"""
+        with self._lock:
+            if self.state != self.CLOSED:
+                self.state = self.HALF_OPEN
+                # A probe that never reports back frees the slot after one timeout
+                self.opened_until = time.monotonic() + self.timeout
+
+    def record_success(self, latency: float):
+        with self._lock:
+            self.latencies.append(latency)
+            self.ewma_latency = latency if self.ewma_latency is None else \
+                RPC_EWMA_ALPHA * latency + (1 - RPC_EWMA_ALPHA) * self.ewma_latency
+            self.consecutive_failures = 0
+            if self.state != self.CLOSED:
+                logger.info(f"RPC endpoint {self.chain}/{self.label} recovered")
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= RPC_BREAKER_FAILURES:
+                if self.state != self.OPEN:
+                    logger.warning(f"RPC endpoint {self.chain}/{self.label} opened after "
+                                   f"{self.consecutive_failures} failures")
+                self.state = self.OPEN
+                self.opened_until = time.monotonic() + RPC_BREAKER_COOLDOWN
+
+    def hedge_delay(self) -> Optional[float]:
+        """p95 latency in seconds once enough samples exist, floored at RPC_HEDGE_MIN_MS"""
+        with self._lock:
+            if len(self.latencies) < MIN_HEDGE_SAMPLES:
+                return None
+            ordered = sorted(self.latencies)
+        p95 = ordered[int(0.95 * (len(ordered) - 1))]
+        return max(p95, RPC_HEDGE_MIN_MS / 1000)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'endpoint': self.label,
+            'state': self.state,
+            'ewma_ms': round(self.ewma_latency * 1000, 2) if self.ewma_latency is not None else None,
+            'consecutive_failures': self.consecutive_failures
+        }
+
+class FailoverHTTPProvider(JSONBaseProvider):
+    """Web3 provider over several RPC endpoints for one chain"""
+
+    def __init__(self, urls: List[str], chain: str, timeout: float = RPC_TIMEOUT,
+                 read_cache: bool = RPC_CACHE_ENABLED):
+        super().__init__()
+        if not urls:
+            raise ValueError(f"No RPC endpoints configured for {chain}")
+        self.chain = chain
+        self.endpoints = [RPCEndpoint(url, chain, timeout) for url in urls]
+
+        # Head tracking and the block-keyed read cache share the uncached request path
+        self.head_tracker = HeadTracker(chain, lambda: self._request('eth_blockNumber', []))
+        self.read_cache = BlockReadCache(chain, self.head_tracker) if read_cache else None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        _providers.add(self)
+
+    def __str__(self):
+        return f"FailoverHTTPProvider({self.chain}: {', '.join(e.label for e in self.endpoints)})"
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        # Created on first hedge so no threads exist before a fork
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=RPC_HEDGE_WORKERS,
+                                                        thread_name_prefix=f'rpc-hedge-{self.chain}')
+        return self._executor
+
+    def candidates(self) -> List[RPCEndpoint]:
+        """Available endpoints by latency average; untried endpoints first, in config order"""
+        now = time.monotonic()
+        healthy = [e for e in self.endpoints if e.available(now)]
+        if not healthy:
+            # Everything is open: try the endpoint that has been resting longest
+            return sorted(self.endpoints, key=lambda e: e.opened_until)
+        return sorted(healthy, key=lambda e: e.ewma_latency or 0.0)
+
+    def _call(self, endpoint: RPCEndpoint, method, params):
+        endpoint.dispatched()
+        start = time.perf_counter()
+        try:
+            response = endpoint.provider.make_request(method, params)
+        except Exception:
+            endpoint.record_failure()
+            raise
+        endpoint.record_success(time.perf_counter() - start)
+        return response
+
+    def make_request(self, method, params):
+        key, pinned = self.read_cache.pin(method, params) if self.read_cache else (None, params)
+        if key is not None:
+            response = self.read_cache.get(key)
+            if response is not None:
+                return response
+
+        response = self._request(method, pinned)
+        if pinned is not params and is_block_not_found(response):
+            # This node is behind the tracked head; answer from its 'latest' without caching
+            return self._request(method, params)
+
+        if key is not None:
+            self.read_cache.put(key, response)
+        elif method == 'eth_blockNumber' and isinstance(response, dict) and 'result' in response:
+            self.head_tracker.observe(int(response['result'], 16))
+        return response
+
+    def _request(self, method, params):
+        candidates = self.candidates()
+        if method in HEDGED_METHODS and len(candidates) > 1:
+            response, candidates = self._hedged_request(method, params, candidates)
+            if response is not None:
+                return response
+
+        last_error = None
+        for index, endpoint in enumerate(candidates):
+            try:
+                return self._call(endpoint, method, params)
+            except Exception as e:
+                last_error = e
+                if index + 1 < len(candidates):
+                    get_metrics().rpc_failovers.inc(self.chain)
+                    log_throttled(logger, logging.WARNING, f"failover:{self.chain}/{endpoint.label}",
+                                  "RPC %s failed on %s/%s, failing over: %s", method, self.chain, endpoint.label, str(e))
+        raise last_error or ConnectionError(f"No RPC endpoint available for {self.chain}")
+
+    def _hedged_request(self, method, params, candidates: List[RPCEndpoint]) -> Tuple[Any, List[RPCEndpoint]]:
+        """
+        Send to the primary; past its p95 (or on failure) also send to the backup.
+        Returns (response, []) on success or (None, untried endpoints) when both fail.
+        """
+        primary, backup = candidates[0], candidates[1]
+        delay = primary.hedge_delay()
+        if delay is None:
+            return None, candidates
+
+        first = self.executor.submit(self._call, primary, method, params)
+        done, _ = wait([first], timeout=delay)
+        if done and first.exception() is None:
+            return first.result(), []
+
+        get_metrics().rpc_hedges.inc(self.chain, 'failed' if done else 'slow')
+        pending = {self.executor.submit(self._call, backup, method, params): 'backup'}
+        if not done:
+            pending[first] = 'primary'
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                winner = pending.pop(future)
+                if future.exception() is None:
+                    get_metrics().rpc_hedge_wins.inc(self.chain, winner)
+                    return future.result(), []
+
+        return None, candidates[2:]
+
+    def make_batch_request(self, batch_requests):
+        last_error = None
+        candidates = self.candidates()
+        for index, endpoint in enumerate(candidates):
+            endpoint.dispatched()
+            start = time.perf_counter()
+            try:
+                response = endpoint.provider.make_batch_request(batch_requests)
+            except Exception as e:
+                endpoint.record_failure()
+                last_error = e
+                if index + 1 < len(candidates):
+                    get_metrics().rpc_failovers.inc(self.chain)
+                continue
+            endpoint.record_success(time.perf_counter() - start)
+            return response
+        raise last_error or ConnectionError(f"No RPC endpoint available for {self.chain}")
+
+    def status(self) -> List[Dict[str, Any]]:
+        return [endpoint.status() for endpoint in self.endpoints]
+
+# Live providers in this process, for the endpoint health gauge (dropped with their service)
+_providers: 'weakref.WeakSet[FailoverHTTPProvider]' = weakref.WeakSet()
+
+def _endpoint_health() -> Dict[Tuple[str, ...], float]:
+    return {
+        (provider.chain, endpoint.label): 0.0 if endpoint.state == RPCEndpoint.OPEN else 1.0
+        for provider in list(_providers) for endpoint in provider.endpoints
+    }
+
+get_metrics().register(Gauge(
+    'flare_rpc_endpoint_up', 'Endpoint circuit breaker closed (1) or open (0) in every worker', ('chain', 'endpoint'),
+    callback=_endpoint_health, mode='min'))
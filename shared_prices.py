@@ -0,0 +1,253 @@
+"""
+Cross-worker price snapshot in a memory-mapped file
+The process that refreshes prices publishes the full token price table into
+a fixed binary layout guarded by a sequence counter (odd while a write is in
+progress). Every worker maps the same file and re-decodes it only when the
+counter moves, so reading the current prices costs one 8-byte load.
+
+One worker at a time holds the poller lock (a non-blocking flock), and the
+head scheduler runs the price and indexing jobs only there. The kernel
+releases the lock when that process dies, and the next worker to tick takes
+over. Readers ignore a snapshot older than SHARED_PRICES_MAX_AGE, so a
+poller that stops publishing does not freeze prices for every worker.
+
+Layout (little-endian):
+    header (64 bytes): magic 4s, max_tokens u32, seq u64, published_at f64,
+                       ftso_round u64, source 16s, count u32, padding
+    entries (64 bytes each): symbol 16s, name 32s, price f64, change_24h f64
+"""
+
+import os
+import mmap
+import time
+import fcntl
+import struct
+import logging
+import threading
+import numpy as np
+from typing import Any, Dict, Iterable, NamedTuple, Optional, Tuple
+from metrics import get_metrics
+from logging_config import log_throttled
+
+logger = logging.getLogger(__name__)
+
+SHARED_PRICES_ENABLED = os.environ.get('SHARED_PRICES_ENABLED', 'true').lower() != 'false'
+SHARED_PRICES_PATH = os.environ.get('SHARED_PRICES_PATH', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'instance', 'price_snapshot.bin'))
+SHARED_PRICES_MAX_TOKENS = int(os.environ.get('SHARED_PRICES_MAX_TOKENS', 512))
+# Seconds after which a published snapshot is stale and readers use the database instead
+SHARED_PRICES_MAX_AGE = float(os.environ.get('SHARED_PRICES_MAX_AGE', 300))
+
+MAGIC = b'FPS1'
+HEADER_SIZE = 64
+SEQ_OFFSET = 8
+HEADER = struct.Struct('<4sIQdQ16sI')
+BODY = struct.Struct('<dQ16sI')
+SEQ = struct.Struct('<Q')
+ENTRY_DTYPE = np.dtype([('symbol', 'S16'), ('name', 'S32'), ('price', '<f8'), ('change_24h', '<f8')])
+
+# Reader attempts before falling back to the database while a write is in progress
+READ_RETRIES = 100
+
+class SharedSnapshot(NamedTuple):
+    """One decoded version of the shared price table"""
+    seq: int
+    published_at: float
+    ftso_round: Optional[int]
+    source: str
+    symbols: np.ndarray
+    names: np.ndarray
+    prices: np.ndarray
+    changes: np.ndarray
+
+class SharedPriceTable:
+    """Seqlock-guarded price table in a memory-mapped file shared by all workers"""
+
+    def __init__(self, path: str = SHARED_PRICES_PATH, max_tokens: int = SHARED_PRICES_MAX_TOKENS):
+        self.path = path
+        self.max_tokens = max_tokens
+        self.size = HEADER_SIZE + max_tokens * ENTRY_DTYPE.itemsize
+        self._mm: Optional[mmap.mmap] = None
+        self._cached: Optional[SharedSnapshot] = None
+        self._lock = threading.Lock()
+
+    def _map(self) -> mmap.mmap:
+        # MAP_SHARED mappings stay shared across fork, so one mapping per process tree is enough
+        if self._mm is None:
+            with self._lock:
+                if self._mm is None:
+                    os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                    fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX)
+                        if os.fstat(fd).st_size != self.size:
+                            # New file, or one written with another SHARED_PRICES_MAX_TOKENS
+                            os.ftruncate(fd, 0)
+                            os.ftruncate(fd, self.size)
+                        mm = mmap.mmap(fd, self.size)
+                        if mm[:4] != MAGIC:
+                            HEADER.pack_into(mm, 0, MAGIC, self.max_tokens, 0, 0.0, 0, b'', 0)
+                    finally:
+                        fcntl.flock(fd, fcntl.LOCK_UN)
+                        os.close(fd)
+                    self._mm = mm
+        return self._mm
+
+    def version(self) -> int:
+        """Current sequence number (0 until the first publish)"""
+        return SEQ.unpack_from(self._map(), SEQ_OFFSET)[0]
+
+    def publish(self, rows: Iterable[Tuple[str, str, float, float]], source: str,
+                ftso_round: Optional[int] = None) -> int:
+        """Write (symbol, name, price, change_24h) rows as the new version; returns its seq"""
+        rows = list(rows)
+        if len(rows) > self.max_tokens:
+            logger.warning(f"Shared price table holds {self.max_tokens} tokens; dropping {len(rows) - self.max_tokens}")
+            rows = rows[:self.max_tokens]
+
+        entries = np.zeros(len(rows), dtype=ENTRY_DTYPE)
+        for i, (symbol, name, price, change_24h) in enumerate(rows):
+            entries[i] = (symbol.encode()[:16], (name or symbol).encode()[:32], price or 0.0, change_24h or 0.0)
+
+        mm = self._map()
+        # Writers in different processes are serialized by the file lock
+        fd = os.open(self.path, os.O_RDWR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            seq = SEQ.unpack_from(mm, SEQ_OFFSET)[0]
+            # An odd seq here means a writer died mid-write; the next even value supersedes it
+            seq += 1 if seq & 1 else 2
+            SEQ.pack_into(mm, SEQ_OFFSET, seq - 1)
+            mm[HEADER_SIZE:HEADER_SIZE + entries.nbytes] = entries.tobytes()
+            BODY.pack_into(mm, SEQ_OFFSET + 8, time.time(), ftso_round or 0, source.encode()[:16], len(rows))
+            SEQ.pack_into(mm, SEQ_OFFSET, seq)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        return seq
+
+    def read(self) -> Optional[SharedSnapshot]:
+        """The current version, decoded once per seq; None if never published or a write is stuck"""
+        mm = self._map()
+        for _ in range(READ_RETRIES):
+            seq = SEQ.unpack_from(mm, SEQ_OFFSET)[0]
+            cached = self._cached
+            if cached is not None and cached.seq == seq:
+                return cached
+            if seq == 0:
+                return None
+            if seq & 1:
+                time.sleep(0)
+                continue
+
+            _, _, _, published_at, ftso_round, source, count = HEADER.unpack_from(mm, 0)
+            entries = np.frombuffer(mm, dtype=ENTRY_DTYPE, count=min(count, self.max_tokens),
+                                    offset=HEADER_SIZE).copy()
+            if SEQ.unpack_from(mm, SEQ_OFFSET)[0] != seq:
+                continue
+
+            snapshot = SharedSnapshot(
+                seq=seq,
+                published_at=published_at,
+                ftso_round=ftso_round or None,
+                source=source.rstrip(b'\0').decode(),
+                symbols=np.char.decode(entries['symbol'], 'utf-8', 'ignore'),
+                names=np.char.decode(entries['name'], 'utf-8', 'ignore'),
+                prices=entries['price'],
+                changes=entries['change_24h']
+            )
+            self._cached = snapshot
+            get_metrics().price_snapshot_timestamp.set(snapshot.source, value=published_at)
+            return snapshot
+        return None
+
+class PollerElection:
+    """Holds an exclusive, non-blocking flock; the holder is the one process that polls"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+        self._pid: Optional[int] = None
+
+    @property
+    def is_poller(self) -> bool:
+        return self._fd is not None and self._pid == os.getpid()
+
+    def try_acquire(self) -> bool:
+        """Become the poller if nobody is; cheap to call on every tick"""
+        if self.is_poller:
+            return True
+        # A descriptor inherited across fork shares the parent's lock, so never reuse one
+        self._fd = None
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd, self._pid = fd, os.getpid()
+        os.ftruncate(fd, 0)
+        os.write(fd, str(self._pid).encode())
+        get_metrics().price_poller.set(value=1)
+        logger.info(f"Process {self._pid} elected price poller")
+        return True
+
+    def release(self):
+        if self.is_poller:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            get_metrics().price_poller.set(value=0)
+        self._fd = None
+
+# Global instances
+shared_price_table = SharedPriceTable()
+poller_election = PollerElection(SHARED_PRICES_PATH + '.lock')
+
+def get_shared_price_table() -> Optional[SharedPriceTable]:
+    """Get the shared price table, or None when SHARED_PRICES_ENABLED=false"""
+    return shared_price_table if SHARED_PRICES_ENABLED else None
+
+def is_price_poller() -> bool:
+    """Whether this process should poll; always true without the shared table"""
+    if not SHARED_PRICES_ENABLED:
+        return True
+    try:
+        return poller_election.try_acquire()
+    except OSError as e:
+        logger.error(f"Poller election failed: {e}")
+        return False
+
+def read_shared_prices(max_age: Optional[float] = SHARED_PRICES_MAX_AGE) -> Optional[SharedSnapshot]:
+    """Current shared snapshot, or None to fall back to the database (also when older than max_age)"""
+    table = get_shared_price_table()
+    if table is None:
+        return None
+    try:
+        snapshot = table.read()
+    except OSError as e:
+        logger.error(f"Error reading shared prices: {e}")
+        return None
+    if snapshot is not None and max_age is not None and time.time() - snapshot.published_at > max_age:
+        log_throttled(logger, logging.WARNING, 'shared_prices_stale',
+                      "Shared price snapshot is %.0fs old; reading prices from the database",
+                      time.time() - snapshot.published_at)
+        return None
+    return snapshot
+
+def shared_prices_version() -> int:
+    """Shared seq for fragment cache keys (0 when disabled or unavailable)"""
+    table = get_shared_price_table()
+    if table is None:
+        return 0
+    try:
+        return table.version()
+    except OSError:
+        return 0
+
+def shared_token_rows(snapshot: SharedSnapshot) -> Dict[str, Dict[str, Any]]:
+    """Symbol -> {name, price, change_24h} for a decoded snapshot"""
+    return {
+        str(symbol): {'name': str(name), 'price': float(price), 'change_24h': float(change)}
+        for symbol, name, price, change in zip(snapshot.symbols, snapshot.names, snapshot.prices, snapshot.changes)
+    }
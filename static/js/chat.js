@@ -176,14 +176,30 @@ async function connectWallet() {
             if (accounts.length > 0) {
                 const address = accounts[0];
                 
-                // Send wallet connection to backend
-                const response = await fetch('/api/wallet/connect', {
+                // Sign-In with Ethereum: sign the server's message, then exchange it for a wallet token
+                const signIn = await fetch('/api/wallet/sign_in', {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
                     body: JSON.stringify({
                         address: address,
                         chainId: parseInt(chainId, 16)
                     })
+                }).then(r => r.json());
+
+                if (!signIn.success) {
+                    showNotification('Failed to connect wallet: ' + signIn.message, 'error');
+                    return;
+                }
+
+                const signature = await window.ethereum.request({
+                    method: 'personal_sign',
+                    params: [signIn.message, address]
+                });
+
+                const response = await fetch('/api/wallet/connect', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ ...signIn, signature: signature })
                 });
                 
                 const result = await response.json();
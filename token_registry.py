@@ -0,0 +1,196 @@
+"""
+Multi-chain token registry
+One table of every token the app knows about, built once at import with
+O(1) lookups by (chain, symbol), by (chain, address) and by checksum
+address. ERC20 decimals are read on-chain once per token, stored in
+TokenDecimals and reused by every process afterwards, so balances and swap
+amounts are converted with the token's real scale instead of assuming 18.
+Raw amounts stay integer base units until they are displayed.
+"""
+
+import logging
+import threading
+from decimal import Decimal, ROUND_DOWN
+from typing import Callable, Dict, List, NamedTuple, Optional
+from web3 import Web3
+from sqlalchemy import select
+from models import TokenDecimals
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# Placeholder address the DEX contract uses for native FLR
+NATIVE_ADDRESS = '0x0000000000000000000000000000000000000001'
+
+# chain -> [(symbol, name, address or None for price-only tokens, known decimals or None)]
+# Known decimals are used until the on-chain value has been read and stored
+TOKEN_DEFINITIONS = {
+    'flare': [
+        ('FLR', 'Flare', NATIVE_ADDRESS, 18),
+        ('WFLR', 'Wrapped Flare', '0x1D80c49BbBCd1C0911346656B529DF9E5c2F783d', 18),
+        ('ETH', 'Ethereum', '0x6B7a87899490EcE95443e979cA9485CBE7E71522', 18),
+        ('USDT', 'Tether USD', '0xf56dc6695cF1f5c364eDEbC7Dc7077ac9B586068', 6),
+        ('MATIC', 'Polygon', None, 18),
+        ('METIS', 'Metis', None, 18),
+        ('APE', 'ApeCoin', None, 18)
+    ],
+    'ethereum': [
+        ('WETH', 'Wrapped Ether', '0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2', 18),
+        ('USDT', 'Tether USD', '0xdAC17F958D2ee523a2206206994597C13D831ec7', 6),
+        ('USDC', 'USD Coin', '0xA0b86a33E6441e7b1d7C31E5e6b2a41D4BC0E2e5', 6),
+        ('DAI', 'Dai', '0x6B175474E89094C44Da98b954EedeAC495271d0F', 18)
+    ],
+    'polygon': [
+        ('WMATIC', 'Wrapped Matic', '0x0d500B1d8E8eF31E21C99d1Db9A6444d3ADf1270', 18),
+        ('USDT', 'Tether USD', '0xc2132D05D31c914a87C6611C10748AEb04B58e8F', 6),
+        ('USDC', 'USD Coin', '0x2791Bca1f2de4661ED88A30C99A7a9449Aa84174', 6)
+    ],
+    'bsc': [
+        ('WBNB', 'Wrapped BNB', '0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c', 18),
+        ('USDT', 'Tether USD', '0x55d398326f99059fF775485246999027B3197955', 18),
+        ('BUSD', 'Binance USD', '0xe9e7CEA3DedcA5984780Bafc599bD69ADd087D56', 18)
+    ]
+}
+
+class TokenInfo(NamedTuple):
+    """One token on one chain; address is None for tokens tracked only for prices"""
+    chain: str
+    symbol: str
+    name: str
+    address: Optional[str]
+    decimals: Optional[int]
+
+    @property
+    def native(self) -> bool:
+        return self.address == NATIVE_ADDRESS
+
+    @property
+    def is_contract(self) -> bool:
+        return self.address is not None and not self.native
+
+def to_base_units(amount, decimals: int) -> int:
+    """Human amount -> integer base units, truncated (exact for decimal strings and floats' repr)"""
+    return int((Decimal(str(amount)).scaleb(decimals)).to_integral_value(rounding=ROUND_DOWN))
+
+def from_base_units(raw: int, decimals: int) -> float:
+    """Integer base units -> display amount"""
+    return raw / 10 ** decimals
+
+class TokenRegistry:
+    """Indexed token definitions plus decimals confirmed on-chain"""
+
+    def __init__(self, definitions: Dict[str, list] = TOKEN_DEFINITIONS):
+        self._tokens: Dict[str, List[TokenInfo]] = {}
+        self._by_symbol: Dict[tuple, TokenInfo] = {}
+        self._by_address: Dict[tuple, TokenInfo] = {}
+        self._by_checksum: Dict[str, TokenInfo] = {}
+        for chain, tokens in definitions.items():
+            for symbol, name, address, decimals in tokens:
+                if address:
+                    address = Web3.to_checksum_address(address)
+                self._add(TokenInfo(chain, symbol, name, address, decimals))
+
+        # Decimals confirmed on-chain, and 10 ** decimals per token so hot paths do one division
+        self._decimals: Dict[tuple, int] = {}
+        self._scales: Dict[tuple, int] = {}
+        self._verified = set()
+        self._lock = threading.Lock()
+
+    def _add(self, token: TokenInfo):
+        self._tokens.setdefault(token.chain, []).append(token)
+        self._by_symbol[(token.chain, token.symbol)] = token
+        if token.address:
+            self._by_address[(token.chain, token.address.lower())] = token
+            # First definition wins when the same contract is listed twice
+            self._by_checksum.setdefault(token.address, token)
+
+    def chains(self) -> List[str]:
+        return list(self._tokens)
+
+    def tokens(self, chain: str = 'flare') -> List[TokenInfo]:
+        return list(self._tokens.get(chain, ()))
+
+    def get(self, symbol: str, chain: str = 'flare') -> Optional[TokenInfo]:
+        return self._by_symbol.get((chain, symbol))
+
+    def by_address(self, address: str, chain: str = 'flare') -> Optional[TokenInfo]:
+        return self._by_address.get((chain, address.lower())) if address else None
+
+    def by_checksum(self, address: str) -> Optional[TokenInfo]:
+        """Lookup across chains by an already-checksummed address"""
+        return self._by_checksum.get(address)
+
+    def addresses(self, chain: str = 'flare') -> Dict[str, str]:
+        """Symbol -> address for tokens with an address on the chain"""
+        return {token.symbol: token.address for token in self._tokens.get(chain, ()) if token.address}
+
+    def addresses_by_chain(self) -> Dict[str, Dict[str, str]]:
+        return {chain: self.addresses(chain) for chain in self._tokens}
+
+    def decimals(self, token: TokenInfo) -> int:
+        """Confirmed decimals, else the definition's, else 18"""
+        decimals = self._decimals.get((token.chain, token.symbol))
+        if decimals is not None:
+            return decimals
+        return token.decimals if token.decimals is not None else 18
+
+    def scale(self, token: TokenInfo) -> int:
+        key = (token.chain, token.symbol)
+        scale = self._scales.get(key)
+        if scale is None:
+            scale = self._scales[key] = 10 ** self.decimals(token)
+        return scale
+
+    def to_base_units(self, symbol: str, amount, chain: str = 'flare') -> int:
+        token = self.get(symbol, chain)
+        return to_base_units(amount, self.decimals(token) if token else 18)
+
+    def from_base_units(self, token: TokenInfo, raw: int) -> float:
+        return raw / self.scale(token)
+
+    def ensure_decimals(self, chain: str, fetch: Callable[[str, List[str]], Dict[str, int]]):
+        """
+        Load stored decimals for a chain once per process; read the ones still
+        missing with fetch(chain, addresses) -> {address: decimals} and store them
+        """
+        if chain in self._verified:
+            return
+        with self._lock:
+            if chain in self._verified:
+                return
+            try:
+                stored = dict(db.session.execute(
+                    select(TokenDecimals.address, TokenDecimals.decimals).where(TokenDecimals.chain == chain)
+                ).all())
+
+                missing = [token.address for token in self._tokens.get(chain, ())
+                           if token.is_contract and token.address not in stored]
+                fetched = fetch(chain, missing) if missing else {}
+                if fetched:
+                    db.session.add_all(TokenDecimals(chain=chain, address=address, decimals=decimals)
+                                       for address, decimals in fetched.items())
+                    db.session.commit()
+                    logger.info(f"Stored on-chain decimals for {len(fetched)} {chain} tokens")
+
+                for address, decimals in {**stored, **fetched}.items():
+                    token = self._by_address.get((chain, address.lower()))
+                    if token is None:
+                        continue
+                    if token.decimals is not None and token.decimals != decimals:
+                        logger.warning(f"{chain} {token.symbol} has {decimals} decimals on-chain, not {token.decimals}")
+                    self._decimals[(chain, token.symbol)] = decimals
+                    self._scales[(chain, token.symbol)] = 10 ** decimals
+
+                # Tokens whose decimals() call failed keep their defaults and are retried next process
+                self._verified.add(chain)
+
+            except Exception as e:
+                logger.error(f"Error loading token decimals for {chain}: {e}")
+                db.session.rollback()
+
+# Global registry instance
+token_registry = TokenRegistry()
+
+def get_token_registry() -> TokenRegistry:
+    """Get the token registry instance"""
+    return token_registry
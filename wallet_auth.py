@@ -0,0 +1,237 @@
+"""
+Sign-In with Ethereum (EIP-4361) wallet tokens
+The wallet signs a SIWE message built from this server's domain, and the
+token it gets back is that message's fields plus the signature in compact
+form. Any node can rebuild the message from the token and recover the
+signer, so authentication needs no shared secret. Recovered signers are kept
+in an LRU keyed by the token, so a repeat request costs a dictionary lookup
+instead of ECDSA recovery.
+
+The nonce is issued by the server and stored in wallet_session. Connecting
+consumes it, so a signed message cannot be replayed, and disconnecting
+revokes it. Each worker remembers a session's state for SIWE_SESSION_RECHECK
+seconds, so a revocation reaches every worker within that time.
+
+Token: <address>.<chain_id>.<issued_at>.<expires_at>.<nonce>.<signature hex>
+"""
+
+import os
+import time
+import secrets
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional, Tuple
+from eth_account import Account
+from eth_account.messages import encode_defunct
+from sqlalchemy import delete, or_, select, update
+from web3 import Web3
+from app import db
+from models import WalletSession
+from metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# Domain and URI in the signed message; must be the same on every node
+SIWE_DOMAIN = os.environ.get('SIWE_DOMAIN', os.environ.get('REPLIT_DEV_DOMAIN', 'localhost:5000'))
+SIWE_URI = os.environ.get('SIWE_URI', f'https://{SIWE_DOMAIN}')
+SIWE_STATEMENT = 'Sign in to Flare Trading Bot.'
+SIWE_TOKEN_TTL = int(os.environ.get('SIWE_TOKEN_TTL', 86400))
+# Signed messages must reach /api/wallet/connect within this many seconds of being issued
+SIWE_SIGN_IN_WINDOW = int(os.environ.get('SIWE_SIGN_IN_WINDOW', 600))
+SIWE_CLOCK_SKEW = 60
+SIWE_SIGNER_CACHE_SIZE = int(os.environ.get('SIWE_SIGNER_CACHE_SIZE', 10000))
+SIWE_SESSION_RECHECK = float(os.environ.get('SIWE_SESSION_RECHECK', 30))
+
+TOKEN_COOKIE = 'wallet_token'
+
+class WalletClaims(NamedTuple):
+    """Fields of a SIWE sign-in, as carried by a wallet token"""
+    address: str
+    chain_id: int
+    issued_at: int
+    expires_at: int
+    nonce: str
+
+def _iso(timestamp: int) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def build_message(claims: WalletClaims) -> str:
+    """The EIP-4361 message for a set of claims, byte-for-byte what the wallet signs"""
+    return (
+        f"{SIWE_DOMAIN} wants you to sign in with your Ethereum account:\n"
+        f"{claims.address}\n"
+        f"\n"
+        f"{SIWE_STATEMENT}\n"
+        f"\n"
+        f"URI: {SIWE_URI}\n"
+        f"Version: 1\n"
+        f"Chain ID: {claims.chain_id}\n"
+        f"Nonce: {claims.nonce}\n"
+        f"Issued At: {_iso(claims.issued_at)}\n"
+        f"Expiration Time: {_iso(claims.expires_at)}"
+    )
+
+def new_claims(address: str, chain_id: int) -> WalletClaims:
+    """Fresh claims for a sign-in request"""
+    now = int(time.time())
+    return WalletClaims(Web3.to_checksum_address(address), int(chain_id), now, now + SIWE_TOKEN_TTL,
+                        secrets.token_hex(8))
+
+def encode_token(claims: WalletClaims, signature: str) -> str:
+    signature = signature[2:] if signature.startswith('0x') else signature
+    return '.'.join((claims.address, str(claims.chain_id), str(claims.issued_at),
+                     str(claims.expires_at), claims.nonce, signature.lower()))
+
+def decode_token(token: str) -> Tuple[WalletClaims, str]:
+    """Split a token into its claims and signature; raises ValueError if malformed"""
+    parts = token.split('.')
+    if len(parts) != 6:
+        raise ValueError('Malformed wallet token')
+    address, chain_id, issued_at, expires_at, nonce, signature = parts
+    if not Web3.is_checksum_address(address) or not nonce.isalnum() or len(nonce) < 8:
+        raise ValueError('Malformed wallet token')
+    return WalletClaims(address, int(chain_id), int(issued_at), int(expires_at), nonce), signature
+
+class SignerCache:
+    """LRU of token -> recovered signer address"""
+
+    def __init__(self, max_size: int = SIWE_SIGNER_CACHE_SIZE):
+        self.max_size = max_size
+        self._signers: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[str]:
+        with self._lock:
+            signer = self._signers.get(token)
+            if signer is not None:
+                self._signers.move_to_end(token)
+            return signer
+
+    def put(self, token: str, signer: str):
+        with self._lock:
+            self._signers[token] = signer
+            self._signers.move_to_end(token)
+            if len(self._signers) > self.max_size:
+                self._signers.popitem(last=False)
+
+class SessionStore:
+    """Issued nonces, consumed once on sign-in and revocable until the token expires"""
+
+    def __init__(self, recheck: float = SIWE_SESSION_RECHECK, max_size: int = SIWE_SIGNER_CACHE_SIZE):
+        self.recheck = recheck
+        self.max_size = max_size
+        # nonce -> (active, monotonic time checked)
+        self._states: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, nonce: str, active: bool):
+        with self._lock:
+            self._states[nonce] = (active, time.monotonic())
+            self._states.move_to_end(nonce)
+            if len(self._states) > self.max_size:
+                self._states.popitem(last=False)
+
+    def issue(self, claims: WalletClaims):
+        """Store a nonce handed out for signing; drops expired and never-used ones"""
+        now = int(time.time())
+        db.session.execute(delete(WalletSession).where(or_(
+            WalletSession.expires_at <= now,
+            (WalletSession.signed_in_at.is_(None)) & (WalletSession.issued_at < now - SIWE_SIGN_IN_WINDOW),
+        )))
+        db.session.add(WalletSession(nonce=claims.nonce, address=claims.address,
+                                     issued_at=claims.issued_at, expires_at=claims.expires_at))
+        db.session.commit()
+
+    def consume(self, claims: WalletClaims) -> bool:
+        """Mark an issued nonce signed in; False if unknown, already used or not these claims"""
+        consumed = db.session.execute(
+            update(WalletSession)
+            .where(WalletSession.nonce == claims.nonce, WalletSession.address == claims.address,
+                   WalletSession.issued_at == claims.issued_at, WalletSession.expires_at == claims.expires_at,
+                   WalletSession.signed_in_at.is_(None), WalletSession.revoked_at.is_(None))
+            .values(signed_in_at=datetime.utcnow())
+        ).rowcount == 1
+        db.session.commit()
+        if consumed:
+            self._remember(claims.nonce, True)
+        return consumed
+
+    def is_active(self, nonce: str) -> bool:
+        """Signed in and not revoked, as of at most SIWE_SESSION_RECHECK seconds ago"""
+        with self._lock:
+            state = self._states.get(nonce)
+        if state is not None and time.monotonic() - state[1] < self.recheck:
+            return state[0]
+        active = db.session.execute(
+            select(WalletSession.id).where(WalletSession.nonce == nonce, WalletSession.signed_in_at.isnot(None),
+                                           WalletSession.revoked_at.is_(None))
+        ).first() is not None
+        self._remember(nonce, active)
+        return active
+
+    def revoke(self, nonce: str):
+        db.session.execute(
+            update(WalletSession).where(WalletSession.nonce == nonce).values(revoked_at=datetime.utcnow())
+        )
+        db.session.commit()
+        self._remember(nonce, False)
+
+# Global instances
+signer_cache = SignerCache()
+session_store = SessionStore()
+
+def recover_signer(claims: WalletClaims, signature: str) -> str:
+    """ECDSA recovery of the address that signed the claims' SIWE message"""
+    return Account.recover_message(encode_defunct(text=build_message(claims)), signature=bytes.fromhex(signature))
+
+def verify_token(token: str, now: Optional[float] = None, require_session: bool = True) -> Optional[WalletClaims]:
+    """Claims of a valid, unexpired, unrevoked token signed by its own address, else None"""
+    metrics = get_metrics()
+    try:
+        claims, signature = decode_token(token)
+        now = time.time() if now is None else now
+        if claims.expires_at <= now or claims.issued_at > now + SIWE_CLOCK_SKEW:
+            metrics.wallet_auth.inc('expired')
+            return None
+        if claims.expires_at - claims.issued_at > SIWE_TOKEN_TTL:
+            metrics.wallet_auth.inc('rejected')
+            return None
+
+        signer = signer_cache.get(token)
+        if signer is None:
+            signer = recover_signer(claims, signature)
+            signer_cache.put(token, signer)
+            outcome = 'recovered'
+        else:
+            outcome = 'cached'
+
+        if signer != claims.address:
+            metrics.wallet_auth.inc('rejected')
+            return None
+        if require_session and not session_store.is_active(claims.nonce):
+            metrics.wallet_auth.inc('revoked')
+            return None
+        metrics.wallet_auth.inc(outcome)
+        return claims
+
+    except Exception as e:
+        logger.debug("Wallet token rejected: %s", e)
+        metrics.wallet_auth.inc('rejected')
+        return None
+
+def sign_in(claims: WalletClaims, signature: str) -> Tuple[Optional[str], str]:
+    """Check a freshly signed SIWE message; returns (token, message) or (None, reason)"""
+    now = time.time()
+    if not claims.issued_at <= now + SIWE_CLOCK_SKEW or now - claims.issued_at > SIWE_SIGN_IN_WINDOW:
+        return None, 'Sign-in message expired, request a new one'
+    try:
+        token = encode_token(claims, signature)
+    except (AttributeError, TypeError):
+        return None, 'Invalid signature'
+    if verify_token(token, now, require_session=False) is None:
+        return None, 'Signature does not match the wallet address'
+    if not session_store.consume(claims):
+        return None, 'Sign-in message unknown or already used, request a new one'
+    return token, 'Signed in'
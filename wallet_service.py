@@ -1,12 +1,18 @@
 """
 Wallet Service for WalletConnect Integration
 Handles wallet connections and user authentication
+Wallets sign in with a SIWE message and then present the resulting token
+(Authorization: Bearer, or the wallet_token cookie) on every request.
 """
 
 import os
 import logging
-from typing import Optional, Dict, Any
-from flask import session, jsonify
+from typing import Optional, Dict, Any, Tuple
+from flask import g, request
+from eth_account import Account
+from eth_account.messages import encode_defunct
+from web3 import Web3
+from wallet_auth import TOKEN_COOKIE, WalletClaims, build_message, new_claims, session_store, sign_in, verify_token
 
 logger = logging.getLogger(__name__)
 
@@ -80,81 +86,110 @@ class WalletService:
             'chains': list(self.supported_chains.values())
         }
 
-    def connect_wallet(self, wallet_address: str, chain_id: int) -> bool:
-        """Store wallet connection in session"""
+    def _is_supported_chain(self, chain_id: Any) -> bool:
+        return chain_id in {chain['chainId'] for chain in self.supported_chains.values()}
+
+    def create_sign_in(self, wallet_address: str, chain_id: int) -> Optional[Dict[str, Any]]:
+        """SIWE message for the wallet to sign, with the fields to send back to connect_wallet"""
         try:
             # Validate wallet address format
-            if not wallet_address.startswith('0x') or len(wallet_address) != 42:
-                return False
+            if not isinstance(wallet_address, str) or not Web3.is_address(wallet_address):
+                return None
 
             # Validate chain ID
-            valid_chains = [chain['chainId'] for chain in self.supported_chains.values()]
-            if chain_id not in valid_chains:
-                return False
-
-            # Store in session
-            session['wallet_address'] = wallet_address
-            session['chain_id'] = chain_id
-            session['wallet_connected'] = True
+            if not self._is_supported_chain(chain_id):
+                return None
+
+            claims = new_claims(wallet_address, chain_id)
+            session_store.issue(claims)
+            return {
+                'message': build_message(claims),
+                'address': claims.address,
+                'chainId': claims.chain_id,
+                'issuedAt': claims.issued_at,
+                'expiresAt': claims.expires_at,
+                'nonce': claims.nonce
+            }
 
-            logger.info(f"Wallet connected: {wallet_address} on chain {chain_id}")
-            return True
+        except Exception as e:
+            logger.error(f"Error creating sign-in message: {e}")
+            return None
 
+    def connect_wallet(self, data: Dict[str, Any]) -> Tuple[Optional[str], str]:
+        """Verify a signed sign-in message; returns (token, message) or (None, reason)"""
+        try:
+            claims = WalletClaims(
+                address=Web3.to_checksum_address(data['address']),
+                chain_id=int(data['chainId']),
+                issued_at=int(data['issuedAt']),
+                expires_at=int(data['expiresAt']),
+                nonce=str(data['nonce'])
+            )
+            if not self._is_supported_chain(claims.chain_id):
+                return None, f"Unsupported chain {claims.chain_id}"
+
+            token, message = sign_in(claims, data['signature'])
+            if token:
+                # The rest of this request sees the new wallet
+                g.wallet_claims = claims
+                logger.info(f"Wallet connected: {claims.address} on chain {claims.chain_id}")
+            return token, message
+
+        except (KeyError, TypeError, ValueError) as e:
+            return None, f"Invalid sign-in request: {e}"
         except Exception as e:
             logger.error(f"Error connecting wallet: {e}")
-            return False
+            return None, "Failed to connect wallet"
 
     def disconnect_wallet(self):
-        """Clear wallet connection from session"""
-        try:
-            session.pop('wallet_address', None)
-            session.pop('chain_id', None)
-            session.pop('wallet_connected', None)
-            logger.info("Wallet disconnected")
-        except Exception as e:
-            logger.error(f"Error disconnecting wallet: {e}")
+        """Revoke the request's wallet token (the route clears the token cookie)"""
+        claims = self.get_claims()
+        if claims is not None:
+            session_store.revoke(claims.nonce)
+        g.wallet_claims = None
+        logger.info("Wallet disconnected")
+
+    def get_claims(self) -> Optional[WalletClaims]:
+        """Verified claims of the request's wallet token, checked once per request"""
+        if 'wallet_claims' not in g:
+            token = None
+            auth = request.headers.get('Authorization', '')
+            if auth.startswith('Bearer '):
+                token = auth[7:].strip()
+            else:
+                token = request.cookies.get(TOKEN_COOKIE)
+            g.wallet_claims = verify_token(token) if token else None
+        return g.wallet_claims
 
     def get_connected_wallet(self) -> Optional[str]:
         """Get currently connected wallet address"""
-        if session.get('wallet_connected'):
-            return session.get('wallet_address')
-        return None
+        claims = self.get_claims()
+        return claims.address if claims else None
 
     def is_wallet_connected(self) -> bool:
         """Check if a wallet is connected"""
-        return session.get('wallet_connected', False)
+        return self.get_claims() is not None
 
     def get_chain_info(self) -> Optional[Dict[str, Any]]:
         """Get information about the connected chain"""
-        if not self.is_wallet_connected():
+        claims = self.get_claims()
+        if claims is None:
             return None
 
-        chain_id = session.get('chain_id')
         for chain_info in self.supported_chains.values():
-            if chain_info['chainId'] == chain_id:
+            if chain_info['chainId'] == claims.chain_id:
                 return chain_info
         return None
 
-    def sign_message(self, message: str, wallet_address: str) -> Optional[str]:
-        """
-        Request message signing from connected wallet
-        This would be handled on the frontend with WalletConnect
-        """
+    def verify_signature(self, message: str, signature: str, wallet_address: str) -> bool:
+        """Check that a message signed in the wallet (personal_sign) was signed by wallet_address"""
         try:
-            # In a real implementation, this would:
-            # 1. Send signing request to frontend
-            # 2. Frontend uses WalletConnect to request signature
-            # 3. User signs in their wallet
-            # 4. Signature is returned to backend
-
-            # For now, return a mock signature
-            if self.get_connected_wallet() == wallet_address:
-                return f"0xmocksignature{hash(message)}"
-            return None
+            signer = Account.recover_message(encode_defunct(text=message), signature=signature)
+            return signer.lower() == wallet_address.lower()
 
         except Exception as e:
-            logger.error(f"Error signing message: {e}")
-            return None
+            logger.error(f"Error verifying signature: {e}")
+            return False
 
 # Global service instance
 wallet_service = WalletService()